@@ -6,6 +6,40 @@ load_dotenv(find_dotenv(), override=True)
 
 # Database
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 3600)) # 1 hour
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 10))
+DB_POOL_PING_INTERVAL_SECONDS = float(os.getenv("DB_POOL_PING_INTERVAL_SECONDS", 10))
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") # optional read replica, falls back to DATABASE_URL
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5)) # keep a client's reads on the primary after its writes
+DB_OFFLOAD_WORKERS = int(os.getenv("DB_OFFLOAD_WORKERS", DB_POOL_MAX_SIZE)) # threads running blocking model calls
+DB_OFFLOAD_QUEUE_SIZE = int(os.getenv("DB_OFFLOAD_QUEUE_SIZE", DB_POOL_MAX_SIZE)) # calls allowed to wait for a thread before 503
+BOOKING_LOCK_TIMEOUT_SECONDS = int(os.getenv("BOOKING_LOCK_TIMEOUT_SECONDS", 5)) # wait for a court-day booking lock before 503
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 60 * 60 * 24)) # how long responses of Idempotency-Key requests are replayed
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", 60)) # after this an unfinished request's key can be taken over
+
+# Payment webhook queue
+PAYMENT_QUEUE_ENABLED = os.getenv("PAYMENT_QUEUE_ENABLED", "true").lower() == "true" # /confirm answers 202 and a worker confirms in batches
+PAYMENT_QUEUE_DIR = os.getenv("PAYMENT_QUEUE_DIR", "data/payment_queue") # must be on persistent storage
+PAYMENT_QUEUE_BATCH_SIZE = int(os.getenv("PAYMENT_QUEUE_BATCH_SIZE", 200))
+PAYMENT_QUEUE_POLL_SECONDS = float(os.getenv("PAYMENT_QUEUE_POLL_SECONDS", 1))
+PAYMENT_QUEUE_RETRY_BASE_SECONDS = float(os.getenv("PAYMENT_QUEUE_RETRY_BASE_SECONDS", 2)) # first retry delay, doubled per attempt
+PAYMENT_QUEUE_RETRY_MAX_SECONDS = float(os.getenv("PAYMENT_QUEUE_RETRY_MAX_SECONDS", 300))
+PAYMENT_QUEUE_MAX_ATTEMPTS = int(os.getenv("PAYMENT_QUEUE_MAX_ATTEMPTS", 10)) # then moved to dead.log
+
+# Abandoned checkouts
+PENDING_ORDER_HOLD_MINUTES = int(os.getenv("PENDING_ORDER_HOLD_MINUTES", 30)) # unpaid orders older than this are cancelled
+PENDING_SWEEP_INTERVAL_SECONDS = float(os.getenv("PENDING_SWEEP_INTERVAL_SECONDS", 60)) # 0 disables the sweeper
+PENDING_SWEEP_BATCH_SIZE = int(os.getenv("PENDING_SWEEP_BATCH_SIZE", 500)) # orders cancelled per transaction
+
+# Caching
+CATALOG_CACHE_ENABLED = os.getenv("CATALOG_CACHE_ENABLED", "true").lower() == "true"
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60)) # 0 disables the authenticated-user cache
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+COURT_INDEX_ENABLED = os.getenv("COURT_INDEX_ENABLED", "true").lower() == "true"
+COURT_INDEX_HORIZON_DAYS = int(os.getenv("COURT_INDEX_HORIZON_DAYS", 60)) # days ahead of now kept in memory
+COURT_INDEX_REFRESH_SECONDS = float(os.getenv("COURT_INDEX_REFRESH_SECONDS", 60)) # full rebuild interval, 0 disables
 
 # FastAPI
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
@@ -20,6 +54,8 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30)) # 30 minutes
 REFRESH_TOKEN_EXPIRE_MINUTES = int(os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES", 60 * 24 * 7)) # 7 days
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1)) # bcrypt worker processes
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", 64)) # hashes allowed to wait before 503
 
 # Email
 SMTP_HOST = os.getenv("SMTP_HOST")
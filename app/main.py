@@ -1,9 +1,18 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from typing import Annotated, Dict, Any
-from app.env import HOST, PORT, TITLE, DESCRIPTION, VERSION, HOST, PORT, DEBUG
+from app.env import HOST, PORT, TITLE, DESCRIPTION, VERSION, HOST, PORT, DEBUG, PAYMENT_QUEUE_ENABLED
 from app.utils.auth import get_current_user
+from app.database import db_pool, async_db_pool, replica_db_pool, async_replica_db_pool, recent_writes
+from app.utils.offload import db_executor, offload_routes
+from app.utils.cache import catalog_cache
+from app.utils.hashing import password_hasher
+from app.models.court_index import court_index
+from app.models.payment_queue import payment_queue
+from app.models.order_expiry import pending_order_sweeper
+from app.utils.events import court_events
+from loguru import logger
 import uvicorn
 
 # Import routers
@@ -49,6 +58,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Keep a client's reads on the primary for a short window after its own writes
+@app.middleware("http")
+async def track_recent_writes(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        recent_writes.mark(request)
+    return response
+
 # Include routers
 app.include_router(router_auth, prefix="/v1")
 app.include_router(router_court, prefix="/v1/public")
@@ -56,21 +73,109 @@ app.include_router(coach_router, prefix="/v1/public")
 app.include_router(training_router, prefix="/v1/public")
 app.include_router(equipment_router, prefix="/v1/public")
 app.include_router(food_router, prefix="/v1/public")
-app.include_router(router_user_order, prefix="/v1/user", dependencies=[Depends(get_current_user)]) # Include user order router with auth dependency
-app.include_router(router_user_training_session, prefix="/v1/user", dependencies=[Depends(get_current_user)]) # Include user training session router with auth dependency
-app.include_router(feedback_router, prefix="/v1/user", dependencies=[Depends(get_current_user)]) # Include user feedback router with auth dependency
+app.include_router(offload_routes(router_user_order), prefix="/v1/user", dependencies=[Depends(get_current_user)]) # Include user order router with auth dependency
+app.include_router(offload_routes(router_user_training_session), prefix="/v1/user", dependencies=[Depends(get_current_user)]) # Include user training session router with auth dependency
+app.include_router(offload_routes(feedback_router), prefix="/v1/user", dependencies=[Depends(get_current_user)]) # Include user feedback router with auth dependency
 # Include admin routers
-app.include_router(admin_user_router, prefix="/v1/admin")
-app.include_router(admin_staff_router, prefix="/v1/admin")
-app.include_router(admin_coach_router, prefix="/v1/admin")
-app.include_router(admin_training_router, prefix="/v1/admin") # New
-app.include_router(admin_booking_router, prefix="/v1/admin") # New
-app.include_router(admin_food_router, prefix="/v1/admin") # New
-app.include_router(admin_equipment_router, prefix="/v1/admin") # New
-app.include_router(admin_enrollment_router, prefix="/v1/admin") # New
-app.include_router(admin_feedback_router, prefix="/v1/admin") # New
-
-app.include_router(internal_payment_router, prefix="/v1") # Include internal payment webhook router (no auth dependency here, it's handled internally)
+app.include_router(offload_routes(admin_user_router), prefix="/v1/admin")
+app.include_router(offload_routes(admin_staff_router), prefix="/v1/admin")
+app.include_router(offload_routes(admin_coach_router), prefix="/v1/admin")
+app.include_router(offload_routes(admin_training_router), prefix="/v1/admin") # New
+app.include_router(offload_routes(admin_booking_router), prefix="/v1/admin") # New
+app.include_router(offload_routes(admin_food_router), prefix="/v1/admin") # New
+app.include_router(offload_routes(admin_equipment_router), prefix="/v1/admin") # New
+app.include_router(offload_routes(admin_enrollment_router), prefix="/v1/admin") # New
+app.include_router(offload_routes(admin_feedback_router), prefix="/v1/admin") # New
+
+app.include_router(offload_routes(internal_payment_router), prefix="/v1") # Include internal payment webhook router (no auth dependency here, it's handled internally)
+
+@app.on_event("startup")
+def open_database_pool():
+    """Pre-open the minimum number of pooled database connections."""
+    try:
+        db_pool.open()
+    except Exception as e:
+        # Connections are opened lazily on first use if the database is not reachable yet
+        logger.error(f"Could not pre-open database pool: {e}")
+    if replica_db_pool is not None:
+        try:
+            replica_db_pool.open()
+        except Exception as e:
+            logger.error(f"Could not pre-open replica database pool: {e}")
+
+@app.on_event("startup")
+async def open_async_database_pool():
+    """Pre-open the aiomysql pool used by the async read paths."""
+    try:
+        await async_db_pool.open()
+    except Exception as e:
+        logger.error(f"Could not pre-open async database pool: {e}")
+    if async_replica_db_pool is not None:
+        try:
+            await async_replica_db_pool.open()
+        except Exception as e:
+            logger.error(f"Could not pre-open async replica database pool: {e}")
+
+@app.on_event("shutdown")
+def close_database_pool():
+    db_pool.close()
+    if replica_db_pool is not None:
+        replica_db_pool.close()
+
+@app.on_event("shutdown")
+async def close_async_database_pool():
+    await async_db_pool.close()
+    if async_replica_db_pool is not None:
+        await async_replica_db_pool.close()
+
+@app.on_event("startup")
+def load_court_index():
+    """Build the in-memory court availability index and keep it refreshed."""
+    court_index.add_listener(court_events.publish)
+    if not court_index.enabled:
+        return
+    try:
+        with db_pool.connection() as db:
+            court_index.load(db)
+    except Exception as e:
+        # Availability is read from the database until the first successful refresh
+        logger.error(f"Could not load court index: {e}")
+    court_index.start_refresher()
+
+@app.on_event("shutdown")
+def shutdown_court_index():
+    court_index.shutdown()
+
+@app.on_event("startup")
+def start_payment_queue():
+    """Start the worker confirming queued payment webhooks (also drains what a previous run left)."""
+    if PAYMENT_QUEUE_ENABLED:
+        payment_queue.start()
+
+@app.on_event("shutdown")
+def shutdown_payment_queue():
+    payment_queue.shutdown()
+
+@app.on_event("startup")
+def start_pending_order_sweeper():
+    """Periodically cancel unpaid orders past the hold time and release what they reserved."""
+    pending_order_sweeper.start()
+
+@app.on_event("shutdown")
+def shutdown_pending_order_sweeper():
+    pending_order_sweeper.shutdown()
+
+@app.on_event("startup")
+def start_password_hasher():
+    password_hasher.warm_up()
+
+@app.on_event("shutdown")
+def shutdown_database_executor():
+    db_executor.shutdown()
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    password_hasher.shutdown()
 
 # Health check endpoint
 @app.get("/health", tags=["Health"])
@@ -78,6 +183,41 @@ def health_check() -> Dict[str, str]:
     """Health check endpoint to verify service is running."""
     return {"status": "ok"}
 
+@app.get("/health/db-executor", tags=["Health"])
+def db_executor_stats() -> Dict[str, Any]:
+    """Queue-wait and run-time metrics for endpoints offloaded to the database executor."""
+    return db_executor.stats()
+
+@app.get("/health/password-hasher", tags=["Health"])
+def password_hasher_stats() -> Dict[str, Any]:
+    """Queue-wait and hashing-time metrics for the bcrypt process pool."""
+    return password_hasher.stats()
+
+@app.get("/health/cache", tags=["Health"])
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters for the public catalog cache."""
+    return catalog_cache.stats()
+
+@app.get("/health/court-index", tags=["Health"])
+def court_index_stats() -> Dict[str, Any]:
+    """Size and loaded window of the in-memory court availability index."""
+    return court_index.stats()
+
+@app.get("/health/court-events", tags=["Health"])
+def court_events_stats() -> Dict[str, Any]:
+    """Connected clients and events published on the court availability stream."""
+    return court_events.stats()
+
+@app.get("/health/payment-queue", tags=["Health"])
+def payment_queue_stats() -> Dict[str, Any]:
+    """Counters of the payment webhook queue and its worker."""
+    return payment_queue.stats()
+
+@app.get("/health/pending-orders", tags=["Health"])
+def pending_order_sweeper_stats() -> Dict[str, Any]:
+    """Runs and expired-order count of the abandoned checkout sweeper."""
+    return pending_order_sweeper.stats()
+
 # Run the application with uvicorn when this script is executed directly
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host=HOST, port=PORT, reload=DEBUG)
\ No newline at end of file
@@ -2,6 +2,7 @@ import pymysql
 from fastapi import HTTPException, status
 from typing import List, Dict, Any, Optional
 from app.models.enums import BookingStatus
+from app.models.court_index import court_index
 from loguru import logger
 from datetime import datetime
 
@@ -146,7 +147,16 @@ def update_booking_status_admin(booking_id: int, new_status: BookingStatus, db:
             logger.info(f"Admin: Successfully updated status for booking ID {booking_id} to {new_status.value}.")
 
             # Fetch and return updated details
-            return get_booking_by_id_admin(booking_id, db)
+            booking = get_booking_by_id_admin(booking_id, db)
+            court_index.add_booking(
+                booking['BookingID'],
+                booking['CourtID'],
+                booking['StartTime'],
+                booking['Endtime'],
+                booking['Status'],
+                booking['OrderID']
+            )
+            return booking
 
     except pymysql.Error as db_err:
         db.rollback()
@@ -1,8 +1,16 @@
+import aiomysql
 import pymysql
 import datetime
 from fastapi import HTTPException
 from typing import List, Dict, Any
 from loguru import logger # Import loguru
+from app.utils.cache import catalog_cache, CATALOG_TTL_SECONDS, MISSING
+
+COACH_SELECT_SQL = """
+    SELECT c.StaffID, c.Description, c.url as image_url, s.Name
+    FROM Coach c
+    JOIN Staff s ON c.StaffID = s.StaffID
+"""
 
 def get_all_coaches(db: pymysql.connections.Connection) -> List[Dict[str, Any]]:
     """
@@ -10,13 +18,7 @@ def get_all_coaches(db: pymysql.connections.Connection) -> List[Dict[str, Any]]:
     """
     try:
         with db.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT c.StaffID, c.Description, c.url as image_url, s.Name
-                FROM Coach c
-                JOIN Staff s ON c.StaffID = s.StaffID
-                """
-            )
+            cursor.execute(COACH_SELECT_SQL)
             coaches = cursor.fetchall()
             if not coaches:
                  logger.info("No coaches found in the database.") # Log info if no coaches found
@@ -39,15 +41,7 @@ def get_coach_by_id(coach_id: int, db: pymysql.connections.Connection) -> Dict[s
     coach = None # Initialize coach to None
     try:
         with db.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT c.StaffID, c.Description, c.url as image_url, s.Name
-                FROM Coach c
-                JOIN Staff s ON c.StaffID = s.StaffID
-                WHERE c.StaffID = %s
-                """,
-                (coach_id,)
-            )
+            cursor.execute(COACH_SELECT_SQL + " WHERE c.StaffID = %s", (coach_id,))
             coach = cursor.fetchone()
     except pymysql.Error as db_err:
         logger.error(f"Database error fetching coach ID {coach_id}: {db_err}")
@@ -65,6 +59,62 @@ def get_coach_by_id(coach_id: int, db: pymysql.connections.Connection) -> Dict[s
     return coach
 
 
+async def get_all_coaches_async(db: aiomysql.Connection) -> List[Dict[str, Any]]:
+    """
+    Async version of get_all_coaches, served from the catalog cache when possible.
+    """
+    cache_key = ("coach",)
+    cached = catalog_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    generation = catalog_cache.generation("coach")
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute(COACH_SELECT_SQL)
+            coaches = await cursor.fetchall()
+            if not coaches:
+                 logger.info("No coaches found in the database.")
+            catalog_cache.set(cache_key, coaches, CATALOG_TTL_SECONDS["coach"], generation)
+            return coaches
+    except aiomysql.Error as db_err:
+        logger.error(f"Database error fetching all coaches: {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
+    except Exception as e:
+        logger.exception(f"Unexpected error fetching all coaches: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+async def get_coach_by_id_async(coach_id: int, db: aiomysql.Connection) -> Dict[str, Any]:
+    """
+    Async version of get_coach_by_id, served from the catalog cache when possible.
+    """
+    if coach_id <= 0:
+        logger.warning(f"Attempted to fetch coach with invalid ID: {coach_id}")
+        raise HTTPException(status_code=400, detail="Invalid Coach ID provided.")
+    cache_key = ("coach", coach_id)
+    cached = catalog_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    generation = catalog_cache.generation("coach")
+
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute(COACH_SELECT_SQL + " WHERE c.StaffID = %s", (coach_id,))
+            coach = await cursor.fetchone()
+    except aiomysql.Error as db_err:
+        logger.error(f"Database error fetching coach ID {coach_id}: {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
+    except Exception as e:
+        logger.exception(f"Unexpected error fetching coach ID {coach_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    if not coach:
+        logger.warning(f"Coach with ID {coach_id} not found.")
+        raise HTTPException(status_code=404, detail=f"Coach with ID {coach_id} not found")
+
+    catalog_cache.set(cache_key, coach, CATALOG_TTL_SECONDS["coach"], generation)
+    return coach
+
+
 # --- Admin Specific Functions ---
 
 def get_all_coaches_admin(db: pymysql.connections.Connection) -> List[Dict[str, Any]]:
@@ -190,6 +240,7 @@ def update_coach_admin(staff_id: int, db: pymysql.connections.Connection, update
                  return get_coach_details_admin(staff_id, db)
 
             db.commit()
+            catalog_cache.invalidate("coach", "training_session")
             logger.info(f"Admin: Successfully updated coach StaffID {staff_id}.")
 
             # Fetch and return updated details
@@ -1,9 +1,123 @@
+import aiomysql
 import pymysql
 from fastapi import HTTPException
-from datetime import datetime, timedelta, time
+from datetime import date, datetime, timedelta, time
 from typing import List, Dict, Optional, Any
 from loguru import logger
 from app.models.enums import CourtStatus, CourtType
+from app.utils.cache import catalog_cache, CATALOG_TTL_SECONDS, MISSING
+from app.models.court_index import court_index
+from app.utils.slot_calendar import (
+    SLOT, SLOT_MINUTES, WORKING_DAY, FULL_DAY,
+    cells_for, cell_of, free_runs, free_starts, is_free, occupancy_mask, range_mask,
+    slots_from_runs, mask_to_string
+)
+
+BOOKING_OVERLAP_SQL = """
+    SELECT * FROM Booking 
+    WHERE CourtID = %s 
+    AND Status = 'Success'
+    AND (
+        (StartTime BETWEEN %s AND %s) OR 
+        (EndTime BETWEEN %s AND %s) OR
+        (StartTime <= %s AND EndTime >= %s)
+    )
+    ORDER BY StartTime
+"""
+
+TRAINING_SCHEDULE_OVERLAP_SQL = """
+    SELECT StartTime, EndTime FROM TrainingSchedule
+    WHERE CourtID = %s
+    AND (
+        (StartTime BETWEEN %s AND %s) OR
+        (EndTime BETWEEN %s AND %s) OR
+        (StartTime <= %s AND EndTime >= %s)
+    )
+    ORDER BY StartTime
+"""
+
+def get_local_date() -> date:
+    """
+    Return the current date in UTC+7.
+    """
+    return (datetime.utcnow() + timedelta(hours=7)).date()
+
+COURTS_UNAVAILABLE_SQL = """
+    SELECT CourtID, StartTime, Endtime AS EndTime FROM Booking
+    WHERE CourtID IN ({court_ids})
+    AND Status = 'Success'
+    AND StartTime <= %s AND Endtime >= %s
+    UNION ALL
+    SELECT CourtID, StartTime, EndTime FROM TrainingSchedule
+    WHERE CourtID IN ({court_ids})
+    AND StartTime <= %s AND EndTime >= %s
+"""
+
+def get_working_hours_window(day: Optional[date] = None) -> tuple:
+    """
+    Return the working hours (5:00-23:00 UTC+7) of `day` (default: today) as a (start, end) pair in UTC.
+    """
+    # Get current date in UTC+7
+    if day is None:
+        day = get_local_date()
+    start_time = datetime.combine(day, time(5, 0))  # 5:00 AM
+    end_time = datetime.combine(day, time(23, 0))   # 11:00 PM
+    # Convert back to UTC for database query
+    return start_time - timedelta(hours=7), end_time - timedelta(hours=7)
+
+def merge_free_slots(
+    start_time: datetime,
+    end_time: datetime,
+    unavailable_periods: List[Dict[str, datetime]]
+) -> List[Dict[str, datetime]]:
+    """
+    Given the unavailable periods inside [start_time, end_time], return the gaps between them.
+    """
+    # Sort unavailable periods by start time
+    unavailable_periods = sorted(unavailable_periods, key=lambda x: x['start'])
+
+    # Initialize available time slots
+    available_slots = []
+    current_time = start_time
+
+    # Iterate through unavailable periods to find gaps
+    for period in unavailable_periods:
+        # If there's a gap between current_time and the period start, add it
+        if current_time < period["start"]:
+            available_slots.append({
+                "start": current_time,
+                "end": period["start"]
+            })
+        # Move current_time to the end of the current unavailable period
+        current_time = max(current_time, period["end"])
+
+    # Add the final slot if there's time left after the last unavailable period
+    if current_time < end_time:
+        available_slots.append({
+            "start": current_time,
+            "end": end_time
+        })
+
+    return available_slots
+
+def compute_free_slots(
+    start_time: datetime,
+    end_time: datetime,
+    unavailable_periods: List[Dict[str, datetime]]
+) -> List[Dict[str, datetime]]:
+    """
+    Free slots inside [start_time, end_time]. Ranges on the slot grid of one
+    working day go through the occupancy bitmask (partly used cells count as
+    busy); any other range is merged exactly with merge_free_slots.
+    """
+    day_start, _ = get_working_hours_window((start_time + timedelta(hours=7)).date())
+    first = cell_of(day_start, start_time)
+    offset = end_time - day_start
+    if first is None or offset % SLOT or not start_time < end_time <= day_start + WORKING_DAY:
+        return merge_free_slots(start_time, end_time, unavailable_periods)
+    outside = FULL_DAY & ~range_mask(first, offset // SLOT - first)
+    busy = occupancy_mask(day_start, unavailable_periods) | outside
+    return slots_from_runs(day_start, free_runs(busy))
 
 def get_available_courts(db: pymysql.connections.Connection) -> List[Dict[str, Any]]:
     """
@@ -50,27 +164,11 @@ def get_court_bookings(
     try:
         # If start_time and end_time are not provided, use working hours (5:00-23:00 UTC+7)
         if not start_time or not end_time:
-            # Get current date in UTC+7
-            now = datetime.utcnow() + timedelta(hours=7)
-            start_time = datetime.combine(now.date(), time(5, 0))  # 5:00 AM
-            end_time = datetime.combine(now.date(), time(23, 0))   # 11:00 PM
-            # Convert back to UTC for database query
-            start_time = start_time - timedelta(hours=7)
-            end_time = end_time - timedelta(hours=7)
+            start_time, end_time = get_working_hours_window()
         
         with db.cursor() as cursor:
             cursor.execute(
-                """
-                SELECT * FROM Booking 
-                WHERE CourtID = %s 
-                AND Status = 'Success'
-                AND (
-                    (StartTime BETWEEN %s AND %s) OR 
-                    (EndTime BETWEEN %s AND %s) OR
-                    (StartTime <= %s AND EndTime >= %s)
-                )
-                ORDER BY StartTime
-                """,
+                BOOKING_OVERLAP_SQL,
                 (court_id, start_time, end_time, start_time, end_time, start_time, end_time)
             )
             bookings = cursor.fetchall()
@@ -92,13 +190,12 @@ def get_available_time_slots(
     try:
         # If start_time and end_time are not provided, use working hours (5:00-23:00 UTC+7)
         if not start_time or not end_time:
-            # Get current date in UTC+7
-            now = datetime.utcnow() + timedelta(hours=7)
-            start_time = datetime.combine(now.date(), time(5, 0))  # 5:00 AM
-            end_time = datetime.combine(now.date(), time(23, 0))   # 11:00 PM
-            # Convert back to UTC for database query
-            start_time = start_time - timedelta(hours=7)
-            end_time = end_time - timedelta(hours=7)
+            start_time, end_time = get_working_hours_window()
+
+        # Answer from the in-memory index when it covers the requested range
+        indexed_periods = court_index.unavailable_periods(court_id, start_time, end_time)
+        if indexed_periods is not None:
+            return compute_free_slots(start_time, end_time, indexed_periods)
 
         # Get all successful bookings for this court during the specified time period
         bookings = get_court_bookings(court_id, start_time, end_time, db)
@@ -107,16 +204,7 @@ def get_available_time_slots(
         training_schedules = []
         with db.cursor() as cursor:
             cursor.execute(
-                """
-                SELECT StartTime, EndTime FROM TrainingSchedule
-                WHERE CourtID = %s
-                AND (
-                    (StartTime BETWEEN %s AND %s) OR
-                    (EndTime BETWEEN %s AND %s) OR
-                    (StartTime <= %s AND EndTime >= %s)
-                )
-                ORDER BY StartTime
-                """,
+                TRAINING_SCHEDULE_OVERLAP_SQL,
                 (court_id, start_time, end_time, start_time, end_time, start_time, end_time)
             )
             training_schedules = cursor.fetchall()
@@ -126,7 +214,7 @@ def get_available_time_slots(
         for booking in bookings:
             unavailable_periods.append({
                 "start": booking['StartTime'],
-                "end": booking['EndTime']
+                "end": booking['Endtime'] # Booking's column is spelled Endtime
             })
         for schedule in training_schedules:
             unavailable_periods.append({
@@ -134,33 +222,284 @@ def get_available_time_slots(
                 "end": schedule['EndTime']
             })
 
-        # Sort unavailable periods by start time
-        unavailable_periods = sorted(unavailable_periods, key=lambda x: x['start'])
+        return compute_free_slots(start_time, end_time, unavailable_periods)
+    except Exception as e:
+        # Log the exception for debugging
+        logger.error(f"Error in get_available_time_slots: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error fetching time slots")
 
-        # Initialize available time slots
-        available_slots = []
-        current_time = start_time
 
-        # Iterate through unavailable periods to find gaps
-        for period in unavailable_periods:
-            # If there's a gap between current_time and the period start, add it
-            if current_time < period["start"]:
-                available_slots.append({
-                    "start": current_time,
-                    "end": period["start"]
-                })
-            # Move current_time to the end of the current unavailable period
-            current_time = max(current_time, period["end"])
+# --- Async variants (aiomysql) used by the async public routes ---
 
-        # Add the final slot if there's time left after the last unavailable period
-        if current_time < end_time:
-            available_slots.append({
-                "start": current_time,
-                "end": end_time
-            })
+async def get_available_courts_async(db: aiomysql.Connection) -> List[Dict[str, Any]]:
+    """
+    Async version of get_available_courts, served from the catalog cache when possible.
+    """
+    cache_key = ("court",)
+    cached = catalog_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    generation = catalog_cache.generation("court")
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "SELECT * FROM Court WHERE Status = %s",
+                (CourtStatus.AVAILABLE.value,)
+            )
+            courts = await cursor.fetchall()
+            catalog_cache.set(cache_key, courts, CATALOG_TTL_SECONDS["court"], generation)
+            return courts
+    except Exception as e:
+        logger.error(f"Error in get_available_courts_async: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+async def get_court_by_id_async(court_id: int, db: aiomysql.Connection) -> Dict[str, Any]:
+    """
+    Async version of get_court_by_id. Raises 404 if the court does not exist.
+    """
+    cache_key = ("court", court_id)
+    cached = catalog_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    generation = catalog_cache.generation("court")
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "SELECT * FROM Court WHERE Court_ID = %s",
+                (court_id,)
+            )
+            court = await cursor.fetchone()
+    except Exception as e:
+        logger.error(f"Error in get_court_by_id_async for court {court_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    if not court:
+        raise HTTPException(status_code=404, detail=f"Court with ID {court_id} not found")
+    catalog_cache.set(cache_key, court, CATALOG_TTL_SECONDS["court"], generation)
+    return court
 
-        return available_slots
+async def get_available_time_slots_async(
+    court_id: int,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    db: aiomysql.Connection = None
+) -> List[Dict[str, datetime]]:
+    """
+    Async version of get_available_time_slots.
+    """
+    try:
+        if not start_time or not end_time:
+            start_time, end_time = get_working_hours_window()
+
+        indexed_periods = court_index.unavailable_periods(court_id, start_time, end_time)
+        if indexed_periods is not None:
+            return compute_free_slots(start_time, end_time, indexed_periods)
+
+        params = (court_id, start_time, end_time, start_time, end_time, start_time, end_time)
+        async with db.cursor() as cursor:
+            await cursor.execute(BOOKING_OVERLAP_SQL, params)
+            bookings = await cursor.fetchall()
+            await cursor.execute(TRAINING_SCHEDULE_OVERLAP_SQL, params)
+            training_schedules = await cursor.fetchall()
+
+        unavailable_periods = [{"start": row['StartTime'], "end": row['Endtime']} for row in bookings]
+        unavailable_periods += [{"start": row['StartTime'], "end": row['EndTime']} for row in training_schedules]
+        return compute_free_slots(start_time, end_time, unavailable_periods)
     except Exception as e:
-        # Log the exception for debugging
-        logger.error(f"Error in get_available_time_slots: {e}")
-        raise HTTPException(status_code=500, detail="Internal Server Error fetching time slots")
\ No newline at end of file
+        logger.error(f"Error in get_available_time_slots_async: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error fetching time slots")
+
+async def get_court_day_masks_async(
+    start_day: Optional[date],
+    days: int,
+    court_type: Optional[CourtType],
+    db: aiomysql.Connection
+) -> tuple:
+    """
+    Occupancy bitmasks of every available court (optionally of one type) for
+    `days` days starting at `start_day` (default: today, UTC+7).
+    Returns (courts, [(day, day_start), ...], {court_id: [mask per day]}).
+    Occupancy comes from the court index when it covers the window, otherwise
+    from a single UNION query over Booking and TrainingSchedule.
+    """
+    if start_day is None:
+        start_day = get_local_date()
+    courts = await get_available_courts_async(db)
+    if court_type is not None:
+        courts = [court for court in courts if court['Type'] == court_type.value]
+
+    day_windows = [
+        (start_day + timedelta(days=offset), get_working_hours_window(start_day + timedelta(days=offset))[0])
+        for offset in range(days)
+    ]
+    if not courts:
+        return courts, day_windows, {}
+    window_start, window_end = day_windows[0][1], day_windows[-1][1] + WORKING_DAY
+
+    periods_by_court: Dict[int, List[Dict[str, datetime]]] = {}
+    for court in courts:
+        periods = court_index.unavailable_periods(court['Court_ID'], window_start, window_end)
+        if periods is None:
+            periods_by_court = None
+            break
+        periods_by_court[court['Court_ID']] = periods
+
+    if periods_by_court is None:
+        court_ids = [court['Court_ID'] for court in courts]
+        placeholders = ", ".join(["%s"] * len(court_ids))
+        sql = COURTS_UNAVAILABLE_SQL.format(court_ids=placeholders)
+        params = (*court_ids, window_end, window_start, *court_ids, window_end, window_start)
+        try:
+            async with db.cursor() as cursor:
+                await cursor.execute(sql, params)
+                rows = await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error in get_court_day_masks_async: {e}")
+            raise HTTPException(status_code=500, detail="Internal Server Error fetching time slots")
+        periods_by_court = {court_id: [] for court_id in court_ids}
+        for row in rows:
+            periods_by_court.setdefault(row['CourtID'], []).append({"start": row['StartTime'], "end": row['EndTime']})
+
+    masks = {
+        court['Court_ID']: [
+            occupancy_mask(day_start, periods_by_court[court['Court_ID']])
+            for _, day_start in day_windows
+        ]
+        for court in courts
+    }
+    return courts, day_windows, masks
+
+async def get_courts_availability_async(
+    start_day: Optional[date] = None,
+    days: int = 1,
+    court_type: Optional[CourtType] = None,
+    db: aiomysql.Connection = None
+) -> List[Dict[str, Any]]:
+    """
+    Free slots of every available court (optionally of one type) for `days` days
+    starting at `start_day` (default: today, UTC+7), within working hours.
+    """
+    courts, day_windows, masks = await get_court_day_masks_async(start_day, days, court_type, db)
+    return [
+        {
+            "court": court,
+            "days": [
+                {"date": day, "available_slots": slots_from_runs(day_start, free_runs(busy))}
+                for (day, day_start), busy in zip(day_windows, masks[court['Court_ID']])
+            ],
+        }
+        for court in courts
+    ]
+
+async def get_courts_calendar_async(
+    start_day: Optional[date] = None,
+    days: int = 7,
+    court_type: Optional[CourtType] = None,
+    min_minutes: int = SLOT_MINUTES,
+    db: aiomysql.Connection = None
+) -> Dict[str, Any]:
+    """
+    Multi-day occupancy calendar: per court and day, the busy grid as a string
+    ('1' busy, '0' free, one character per SLOT_MINUTES cell from 5:00 UTC+7)
+    and the free gaps of at least `min_minutes`.
+    """
+    courts, day_windows, masks = await get_court_day_masks_async(start_day, days, court_type, db)
+    min_cells = cells_for(min_minutes)
+    return {
+        "slot_minutes": SLOT_MINUTES,
+        "courts": [
+            {
+                "court": court,
+                "days": [
+                    {
+                        "date": day,
+                        "day_start": day_start,
+                        "busy": mask_to_string(busy),
+                        "free_slots": slots_from_runs(day_start, free_runs(busy, min_cells)),
+                    }
+                    for (day, day_start), busy in zip(day_windows, masks[court['Court_ID']])
+                ],
+            }
+            for court in courts
+        ],
+    }
+
+async def get_courts_free_at_async(
+    at: datetime,
+    duration_minutes: int,
+    court_type: Optional[CourtType] = None,
+    db: aiomysql.Connection = None
+) -> List[Dict[str, Any]]:
+    """
+    Available courts (optionally of one type) that are free for `duration_minutes`
+    from `at`. Cells only partly inside the requested range still have to be free.
+    """
+    day = (at + timedelta(hours=7)).date()
+    courts, day_windows, masks = await get_court_day_masks_async(day, 1, court_type, db)
+    day_start = day_windows[0][1]
+    first = (at - day_start) // SLOT
+    last = -(-(at + timedelta(minutes=duration_minutes) - day_start) // SLOT)
+    return [court for court in courts if is_free(masks[court['Court_ID']][0], first, last - first)]
+
+MAX_SEARCH_WINDOW = timedelta(days=31)
+
+async def search_free_slots_async(
+    duration_minutes: int,
+    window_start: Optional[datetime] = None,
+    window_end: Optional[datetime] = None,
+    court_type: Optional[CourtType] = None,
+    limit: int = 10,
+    db: aiomysql.Connection = None
+) -> List[Dict[str, Any]]:
+    """
+    Earliest slots of `duration_minutes` inside [window_start, window_end] on any
+    available court (optionally of one type). Each free gap contributes its
+    earliest fitting start. Results are ordered by start time, then price
+    (Court.HourRate for the duration), then court ID; at most `limit` are returned.
+    Slot starts are on the SLOT_MINUTES grid and never in the past. Raises 400
+    if the window (after the defaults) is longer than MAX_SEARCH_WINDOW.
+    """
+    now = datetime.utcnow()
+    if window_start is None or window_start < now:
+        window_start = now
+    if window_end is None:
+        window_end = window_start + timedelta(days=7)
+    if window_end - window_start > MAX_SEARCH_WINDOW:
+        # Bounds the day masks built and the occupancy query
+        raise HTTPException(status_code=400, detail=f"Search window cannot exceed {MAX_SEARCH_WINDOW.days} days")
+    duration = timedelta(minutes=duration_minutes)
+    cells = cells_for(duration_minutes)
+    if window_end - window_start < duration:
+        return []
+
+    first_day = (window_start + timedelta(hours=7)).date()
+    last_day = (window_end + timedelta(hours=7)).date()
+    courts, day_windows, masks = await get_court_day_masks_async(first_day, (last_day - first_day).days + 1, court_type, db)
+
+    candidates = []
+    for day_offset, (day, day_start) in enumerate(day_windows):
+        # Start cells whose slot lies inside the search window
+        first_allowed = max(-(-(window_start - day_start) // SLOT), 0)
+        last_allowed = (window_end - duration - day_start) // SLOT
+        allowed = range_mask(first_allowed, last_allowed - first_allowed + 1)
+        if not allowed:
+            continue
+        for court in courts:
+            busy = masks[court['Court_ID']][day_offset]
+            starts = free_starts(busy, cells) & allowed
+            if not starts:
+                continue
+            for first, length in free_runs(busy, cells):
+                run_starts = starts & range_mask(first, length)
+                if not run_starts:
+                    continue
+                cell = (run_starts & -run_starts).bit_length() - 1
+                start = day_start + cell * SLOT
+                candidates.append({
+                    "court": court,
+                    "start": start,
+                    "end": start + duration,
+                    "price": court['HourRate'] * duration_minutes / 60,
+                })
+
+    candidates.sort(key=lambda slot: (slot["start"], slot["price"], slot["court"]['Court_ID']))
+    return candidates[:limit]
@@ -0,0 +1,312 @@
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import pymysql
+from loguru import logger
+from app.env import COURT_INDEX_ENABLED, COURT_INDEX_HORIZON_DAYS, COURT_INDEX_REFRESH_SECONDS
+from app.models.enums import BookingStatus
+
+# Statuses that make a court unavailable to other customers on the public pages.
+# Pending bookings are indexed too (for order-side checks) but do not block here.
+BLOCKING_BOOKING_STATUSES = (BookingStatus.SUCCESS.value,)
+
+INDEX_BOOKINGS_SQL = """
+    SELECT BookingID, CourtID, StartTime, Endtime, Status, OrderID FROM Booking
+    WHERE Status != %s AND StartTime <= %s AND Endtime >= %s
+"""
+
+INDEX_SCHEDULES_SQL = """
+    SELECT SessionID, CourtID, StartTime, EndTime FROM TrainingSchedule
+    WHERE StartTime <= %s AND EndTime >= %s
+"""
+
+
+class _CourtIntervals:
+    """Intervals of one court, kept sorted by start time."""
+
+    def __init__(self):
+        self.keys: List[Tuple[datetime, Hashable]] = [] # (start, entry key), sorted
+        self.max_duration = timedelta(0)
+
+    def add(self, key: Hashable, start: datetime, end: datetime):
+        bisect.insort(self.keys, (start, key))
+        self.max_duration = max(self.max_duration, end - start)
+
+    @classmethod
+    def build(cls, entries: Dict[Hashable, Dict[str, Any]]) -> Dict[int, "_CourtIntervals"]:
+        courts: Dict[int, _CourtIntervals] = {}
+        for key, entry in entries.items():
+            intervals = courts.setdefault(entry["court_id"], cls())
+            intervals.keys.append((entry["start"], key))
+            intervals.max_duration = max(intervals.max_duration, entry["end"] - entry["start"])
+        for intervals in courts.values():
+            intervals.keys.sort()
+        return courts
+
+    def remove(self, key: Hashable, start: datetime):
+        position = bisect.bisect_left(self.keys, (start, key))
+        if position < len(self.keys) and self.keys[position] == (start, key):
+            del self.keys[position]
+
+
+class CourtIntervalIndex:
+    """
+    In-process index of court occupancy (bookings and training schedule slots).
+
+    Rows are loaded for a window of `horizon_days` around now and kept per court,
+    sorted by start time, so an overlap query is a bisect plus a short scan instead
+    of two range queries. Writes made through this process update the index right
+    after they commit; a periodic rebuild picks up writes made by other processes
+    and moves the window forward. Queries outside the loaded window, or made
+    before the first load, return None and the caller falls back to the database.
+
+    Every change (incremental, or found by diffing a rebuild against the previous
+    index) is passed to the listeners registered with `add_listener()`, as an
+    event dict with a "type" of "booking" or "schedule".
+    """
+
+    def __init__(self, horizon_days: int, enabled: bool = True):
+        self.horizon_days = horizon_days
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._courts: Dict[int, _CourtIntervals] = {}
+        self._entries: Dict[Hashable, Dict[str, Any]] = {}
+        self._window: Optional[Tuple[datetime, datetime]] = None
+        self._loaded_at: Optional[datetime] = None
+        self._stop = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._touched: Dict[Hashable, float] = {} # key -> monotonic time of its last incremental update
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        self._listeners.append(listener)
+
+    def _notify(self, events: List[Dict[str, Any]]):
+        for event in events:
+            for listener in self._listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    logger.exception(f"Court index listener failed: {e}")
+
+    @staticmethod
+    def _event(key: Hashable, entry: Dict[str, Any], status: Optional[str] = None) -> Dict[str, Any]:
+        if key[0] == "booking":
+            return {"type": "booking", "court_id": entry["court_id"], "start": entry["start"], "end": entry["end"], "status": status or entry["status"]}
+        return {"type": "schedule", "court_id": entry["court_id"], "start": entry["start"], "end": entry["end"], "session_id": entry["session_id"], "action": status or "added"}
+
+    # --- Loading ---
+
+    def load(self, db: pymysql.connections.Connection):
+        """(Re)build the whole index from the database."""
+        if not self.enabled:
+            return
+        started = time.monotonic()
+        now = datetime.utcnow()
+        window_start = now - timedelta(days=1)
+        window_end = now + timedelta(days=self.horizon_days)
+        with db.cursor() as cursor:
+            cursor.execute(INDEX_BOOKINGS_SQL, (BookingStatus.CANCEL.value, window_end, window_start))
+            bookings = cursor.fetchall()
+            cursor.execute(INDEX_SCHEDULES_SQL, (window_end, window_start))
+            schedules = cursor.fetchall()
+
+        entries: Dict[Hashable, Dict[str, Any]] = {}
+        for row in bookings:
+            entry = {
+                "court_id": row['CourtID'],
+                "start": row['StartTime'],
+                "end": row['Endtime'], # Booking's column is spelled Endtime
+                "status": row['Status'],
+                "order_id": row['OrderID'],
+            }
+            entries[("booking", row['BookingID'])] = entry
+        for row in schedules:
+            entry = {
+                "court_id": row['CourtID'],
+                "start": row['StartTime'],
+                "end": row['EndTime'],
+                "status": None,
+                "session_id": row['SessionID'],
+            }
+            entries[("schedule", row['SessionID'], row['CourtID'], row['StartTime'])] = entry
+
+        with self._lock:
+            # Incremental updates made while the rows were being read win over the rows
+            for key, touched_at in list(self._touched.items()):
+                if touched_at < started:
+                    del self._touched[key]
+                elif key in self._entries:
+                    entries[key] = self._entries[key]
+                else:
+                    entries.pop(key, None)
+            courts = _CourtIntervals.build(entries)
+
+            # Changes made by other processes since the previous load
+            events = []
+            if self._window is not None:
+                for key, entry in entries.items():
+                    previous = self._entries.get(key)
+                    if previous is None or previous["status"] != entry["status"] or previous["end"] != entry["end"]:
+                        events.append(self._event(key, entry))
+                for key, previous in self._entries.items():
+                    if key not in entries and previous["end"] >= window_start:
+                        events.append(self._event(key, previous, BookingStatus.CANCEL.value if key[0] == "booking" else "removed"))
+            self._courts = courts
+            self._entries = entries
+            self._window = (window_start, window_end)
+            self._loaded_at = now
+        self._notify(events)
+        logger.info(f"Court index loaded {len(bookings)} bookings and {len(schedules)} schedule slots for {len(courts)} courts.")
+
+    def _refresh_loop(self, interval: float):
+        from app.database import db_pool, PoolTimeoutError # Imported here to keep the models importable without a pool
+        while not self._stop.wait(interval):
+            try:
+                with db_pool.connection() as db:
+                    self.load(db)
+            except (PoolTimeoutError, pymysql.Error, OSError) as e:
+                logger.error(f"Court index refresh failed, keeping the previous index: {e}")
+            except Exception as e:
+                logger.exception(f"Unexpected error refreshing court index: {e}")
+
+    def start_refresher(self, interval: float = COURT_INDEX_REFRESH_SECONDS):
+        """Rebuild the index every `interval` seconds in a daemon thread."""
+        if not self.enabled or interval <= 0 or self._refresher is not None:
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._refresh_loop, args=(interval,), name="court-index-refresh", daemon=True)
+        self._refresher.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=5)
+            self._refresher = None
+
+    # --- Incremental updates (call after the write has committed) ---
+
+    def _in_window(self, start: datetime, end: datetime) -> bool:
+        return self._window is not None and start <= self._window[1] and end >= self._window[0]
+
+    def _put(self, key: Hashable, entry: Dict[str, Any]):
+        if not self.enabled:
+            return
+        self._drop(key)
+        if not self._in_window(entry["start"], entry["end"]):
+            return
+        self._entries[key] = entry
+        self._courts.setdefault(entry["court_id"], _CourtIntervals()).add(key, entry["start"], entry["end"])
+
+    def _drop(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        entry = self._entries.pop(key, None)
+        self._touched[key] = time.monotonic()
+        if entry is not None:
+            self._courts[entry["court_id"]].remove(key, entry["start"])
+        return entry
+
+    def add_booking(self, booking_id: int, court_id: int, start: datetime, end: datetime, status: str, order_id: Optional[int] = None):
+        """Record a created booking or a booking's new status; cancelled bookings leave the index."""
+        key = ("booking", booking_id)
+        entry = {
+            "court_id": court_id,
+            "start": start,
+            "end": end,
+            "status": status,
+            "order_id": order_id,
+        }
+        with self._lock:
+            if status == BookingStatus.CANCEL.value:
+                self._drop(key)
+            else:
+                self._put(key, entry)
+        self._notify([self._event(key, entry)])
+
+    def replace_session_schedule(
+        self,
+        session_id: int,
+        slots: Iterable[Tuple[int, datetime, datetime]],
+        previous_slots: Iterable[Tuple[int, datetime, datetime]] = ()
+    ):
+        """
+        Replace the schedule slots of a training session with `slots` as
+        (court_id, start, end). `previous_slots` are the slots the write removed.
+        """
+        added = {(court_id, start): end for court_id, start, end in slots}
+        removed = {(court_id, start): end for court_id, start, end in previous_slots}
+        with self._lock:
+            stale = {key for key in self._entries if key[0] == "schedule" and key[1] == session_id}
+            stale |= {("schedule", session_id, court_id, start) for court_id, start in removed}
+            for key in stale:
+                entry = self._drop(key)
+                if entry is not None:
+                    removed.setdefault((entry["court_id"], entry["start"]), entry["end"])
+            for (court_id, start), end in added.items():
+                self._put(("schedule", session_id, court_id, start), {
+                    "court_id": court_id,
+                    "start": start,
+                    "end": end,
+                    "status": None,
+                    "session_id": session_id,
+                })
+        events = [
+            {"type": "schedule", "court_id": court_id, "start": start, "end": end, "session_id": session_id, "action": "removed"}
+            for (court_id, start), end in removed.items() if added.get((court_id, start)) != end
+        ]
+        events += [
+            {"type": "schedule", "court_id": court_id, "start": start, "end": end, "session_id": session_id, "action": "added"}
+            for (court_id, start), end in added.items() if removed.get((court_id, start)) != end
+        ]
+        self._notify(events)
+
+    def remove_session_schedule(self, session_id: int, previous_slots: Iterable[Tuple[int, datetime, datetime]] = ()):
+        self.replace_session_schedule(session_id, (), previous_slots)
+
+    # --- Queries ---
+
+    def unavailable_periods(self, court_id: int, start_time: datetime, end_time: datetime) -> Optional[List[Dict[str, datetime]]]:
+        """
+        Blocking periods (successful bookings and training slots) of a court that
+        overlap [start_time, end_time], sorted by start. None if the index cannot
+        answer (disabled, not loaded yet, or the range is outside the loaded window).
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._window is None or start_time < self._window[0] or end_time > self._window[1]:
+                return None
+            intervals = self._courts.get(court_id)
+            if intervals is None:
+                return []
+            # Nothing starting before start_time - max_duration can reach start_time
+            low = bisect.bisect_left(intervals.keys, (start_time - intervals.max_duration,))
+            periods = []
+            for start, key in intervals.keys[low:]:
+                if start > end_time:
+                    break
+                entry = self._entries[key]
+                if entry["end"] < start_time:
+                    continue
+                if key[0] == "booking" and entry["status"] not in BLOCKING_BOOKING_STATUSES:
+                    continue
+                periods.append({"start": entry["start"], "end": entry["end"]})
+            return periods
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "courts": len(self._courts),
+                "entries": len(self._entries),
+                "window_start": self._window[0] if self._window else None,
+                "window_end": self._window[1] if self._window else None,
+                "loaded_at": self._loaded_at,
+            }
+
+
+court_index = CourtIntervalIndex(horizon_days=COURT_INDEX_HORIZON_DAYS, enabled=COURT_INDEX_ENABLED)
@@ -1,26 +1,32 @@
 import pymysql
 from fastapi import HTTPException
 from loguru import logger
+from app.utils.cache import catalog_cache
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional
 import uuid # Add uuid for unique payment description
 from app.models.enums import PaymentMethod, PaymentStatus # Add Payment enums
 
-def get_enrollment_count(session_id: int, db: pymysql.connections.Connection) -> int:
-    """
-    Get the current number of enrollments for a specific training session.
-    """
-    try:
-        with db.cursor() as cursor:
-            cursor.execute("SELECT COUNT(*) as count FROM Enroll WHERE SessionID = %s", (session_id,))
-            result = cursor.fetchone()
-            return result['count'] if result else 0
-    except pymysql.Error as db_err:
-        logger.error(f"Database error counting enrollments for session ID {session_id}: {db_err}")
-        raise HTTPException(status_code=500, detail="Database error")
-    except Exception as e:
-        logger.exception(f"Unexpected error counting enrollments for session ID {session_id}: {e}")
-        raise HTTPException(status_code=500, detail="Internal Server Error")
+# Admission takes a seat with one conditional UPDATE: the session row lock
+# serializes concurrent enrollments, so the last seat cannot be taken twice.
+# The session becomes Unavailable when its last seat is taken (Status is
+# assigned first, so it sees the count before the increment).
+TAKE_SEAT_SQL = """
+    UPDATE Training_Session
+    SET Status = IF(EnrolledCount + 1 >= Max_Students, 'Unavailable', Status),
+        EnrolledCount = EnrolledCount + 1
+    WHERE SessionID = %s AND Status = 'Available' AND EnrolledCount < Max_Students
+"""
+
+# Admin enrollments are not limited by capacity, but still counted
+ADD_SEAT_SQL = """
+    UPDATE Training_Session
+    SET Status = IF(EnrolledCount + 1 >= Max_Students, 'Unavailable', Status),
+        EnrolledCount = EnrolledCount + 1
+    WHERE SessionID = %s
+"""
+
+RELEASE_SEAT_SQL = "UPDATE Training_Session SET EnrolledCount = GREATEST(EnrolledCount - 1, 0) WHERE SessionID = %s"
 
 def is_user_enrolled(customer_id: int, session_id: int, db: pymysql.connections.Connection) -> bool:
     """
@@ -37,11 +43,20 @@ def is_user_enrolled(customer_id: int, session_id: int, db: pymysql.connections.
         logger.exception(f"Unexpected error checking enrollment for customer {customer_id}, session {session_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-def enroll_user_in_session(customer_id: int, session_id: int, price: int, payment_method: PaymentMethod.CREDIT_CARD, db: pymysql.connections.Connection) -> Dict[str, Any]:
+def enroll_user_in_session(
+    customer_id: int,
+    session_id: int,
+    price: int,
+    payment_method: PaymentMethod.CREDIT_CARD,
+    db: pymysql.connections.Connection,
+    before_commit: Optional[Callable[[pymysql.cursors.DictCursor, Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
     """
     Enroll a user in a training session by creating an order and an enrollment record.
     Returns a dictionary containing the OrderID, PaymentID, and Payment Description.
-    Uses a transaction to ensure atomicity.
+    Uses a transaction to ensure atomicity. Raises 400 if no seat is left.
+    `before_commit(cursor, result)`, if given, runs last in the transaction;
+    raising from it rolls the enrollment back.
     """
     try:
         with db.cursor() as cursor:
@@ -63,13 +78,13 @@ def enroll_user_in_session(customer_id: int, session_id: int, price: int, paymen
                  raise HTTPException(status_code=500, detail="Failed to create order record")
 
             # 2. Create Payment Entry
-            payment_description = str(uuid.uuid4()) # Generate unique description
+            payment_description = str(uuid.uuid4()) # Generate unique description, also stored as the indexed Reference
             cursor.execute(
                 """
-                INSERT INTO Payment (OrderID, Total, Customer_ID, Method, Status, Description, Time)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
+                INSERT INTO Payment (OrderID, Total, Customer_ID, Method, Status, Description, Reference, Time)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
                 """,
-                (order_id, price, customer_id, payment_method.value, PaymentStatus.PENDING.value, payment_description)
+                (order_id, price, customer_id, payment_method.value, PaymentStatus.PENDING.value, payment_description, payment_description)
             )
             payment_id = cursor.lastrowid
             if not payment_id:
@@ -88,15 +103,30 @@ def enroll_user_in_session(customer_id: int, session_id: int, price: int, paymen
                 (customer_id, session_id)
             )
 
-            # Commit transaction
-            db.commit()
-            logger.info(f"Customer {customer_id} successfully enrolled in session {session_id}. OrderID: {order_id}, PaymentID: {payment_id}")
-            return {
+            # 4. Take a seat last, so the session row stays locked only until the commit
+            cursor.execute(TAKE_SEAT_SQL, (session_id,))
+            if cursor.rowcount != 1:
+                logger.warning(f"Enrollment failed: Session {session_id} is full or unavailable. CustomerID: {customer_id}")
+                db.rollback()
+                raise HTTPException(status_code=400, detail="This training session is full.")
+
+            result = {
                 "order_id": order_id,
                 "payment_id": payment_id,
                 "payment_description": payment_description
             }
+            if before_commit:
+                before_commit(cursor, result)
 
+            # Commit transaction
+            db.commit()
+            catalog_cache.invalidate("training_session")
+            logger.info(f"Customer {customer_id} successfully enrolled in session {session_id}. OrderID: {order_id}, PaymentID: {payment_id}")
+            return result
+
+    except HTTPException:
+        db.rollback()
+        raise
     except pymysql.err.IntegrityError as integrity_err:
         db.rollback()
         # Check if it's a duplicate enrollment error
@@ -201,7 +231,9 @@ def create_enrollment_admin(customer_id: int, session_id: int, db: pymysql.conne
             # Insert into Enroll table
             sql = "INSERT INTO Enroll (CustomerID, SessionID) VALUES (%s, %s)"
             cursor.execute(sql, (customer_id, session_id))
+            cursor.execute(ADD_SEAT_SQL, (session_id,))
             db.commit()
+            catalog_cache.invalidate("training_session")
             logger.info(f"Admin manually enrolled CustomerID {customer_id} in SessionID {session_id}")
 
             # Fetch and return the created enrollment details (or just confirm success)
@@ -250,7 +282,9 @@ def delete_enrollment_admin(customer_id: int, session_id: int, db: pymysql.conne
                     db.rollback()
                     raise HTTPException(status_code=500, detail="Failed to delete enrollment record.")
 
+            cursor.execute(RELEASE_SEAT_SQL, (session_id,))
             db.commit()
+            catalog_cache.invalidate("training_session")
             logger.info(f"Admin manually deleted enrollment for CustomerID {customer_id}, SessionID {session_id}")
             # No body needed for 204 response
 
@@ -1,9 +1,11 @@
+import aiomysql
 import pymysql
 from fastapi import HTTPException
 from typing import List, Dict, Any, Optional
 from loguru import logger
 from pydantic import BaseModel
 from app.models.enums import EquipmentType # Import EquipmentType
+from app.utils.cache import catalog_cache, CATALOG_TTL_SECONDS, MISSING
 
 # Pydantic model for response
 class EquipmentResponse(BaseModel):
@@ -38,6 +40,31 @@ def get_all_equipment(db: pymysql.connections.Connection) -> List[Dict[str, Any]
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 
+async def get_all_equipment_async(db: aiomysql.Connection) -> List[Dict[str, Any]]:
+    """
+    Async version of get_all_equipment, served from the catalog cache when possible.
+    """
+    cache_key = ("equipment",)
+    cached = catalog_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    generation = catalog_cache.generation("equipment")
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute("CALL GetAllEquipment()")
+            equipment = await cursor.fetchall()
+            if not equipment:
+                 logger.info("No equipment found in the database.")
+            catalog_cache.set(cache_key, equipment, CATALOG_TTL_SECONDS["equipment"], generation)
+            return equipment
+    except aiomysql.Error as db_err:
+        logger.error(f"Database error fetching all equipment: {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
+    except Exception as e:
+        logger.exception(f"Unexpected error fetching all equipment: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
 # --- Admin Specific Functions ---
 
 def create_equipment_admin(equipment_data, db: pymysql.connections.Connection) -> Dict[str, Any]:
@@ -74,6 +101,7 @@ def create_equipment_admin(equipment_data, db: pymysql.connections.Connection) -
                  raise HTTPException(status_code=500, detail="Failed to get new EquipmentID after creation.")
 
             db.commit()
+            catalog_cache.invalidate("equipment")
             logger.info(f"Admin created Equipment ID: {new_equipment_id}")
             
             # Fetch and return the created item details using the new ID
@@ -181,6 +209,7 @@ def update_equipment_admin(equipment_id: int, update_data, db: pymysql.connectio
                     return current_item
 
             db.commit()
+            catalog_cache.invalidate("equipment")
             logger.info(f"Admin: Successfully updated equipment ID {equipment_id}.")
             return get_equipment_by_id_admin(equipment_id, db) # Fetch and return updated
 
@@ -223,6 +252,7 @@ def delete_equipment_admin(equipment_id: int, db: pymysql.connections.Connection
                     raise HTTPException(status_code=500, detail="Failed to delete equipment record.")
 
             db.commit()
+            catalog_cache.invalidate("equipment")
             logger.info(f"Admin: Successfully deleted equipment ID {equipment_id}.")
             # No body needed for 204 response
 
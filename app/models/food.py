@@ -1,9 +1,11 @@
+import aiomysql
 import pymysql
 from fastapi import HTTPException
 from typing import List, Dict, Any, Optional
 from loguru import logger
 from pydantic import BaseModel
 from app.models.enums import FoodCategory # Import FoodCategory
+from app.utils.cache import catalog_cache, CATALOG_TTL_SECONDS, MISSING
 
 # Pydantic model for response
 class FoodResponse(BaseModel):
@@ -37,6 +39,31 @@ def get_all_food(db: pymysql.connections.Connection) -> List[Dict[str, Any]]:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 
+async def get_all_food_async(db: aiomysql.Connection) -> List[Dict[str, Any]]:
+    """
+    Async version of get_all_food, served from the catalog cache when possible.
+    """
+    cache_key = ("food",)
+    cached = catalog_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    generation = catalog_cache.generation("food")
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute("CALL GetAllCafeteriaFood()")
+            food_items = await cursor.fetchall()
+            if not food_items:
+                 logger.info("No food items found in the database.")
+            catalog_cache.set(cache_key, food_items, CATALOG_TTL_SECONDS["food"], generation)
+            return food_items
+    except aiomysql.Error as db_err:
+        logger.error(f"Database error fetching all food items: {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
+    except Exception as e:
+        logger.exception(f"Unexpected error fetching all food items: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
 # --- Admin Specific Functions ---
 
 def create_food_item_admin(food_data, db: pymysql.connections.Connection) -> Dict[str, Any]:
@@ -72,6 +99,7 @@ def create_food_item_admin(food_data, db: pymysql.connections.Connection) -> Dic
                  raise HTTPException(status_code=500, detail="Failed to get new FoodID after creation.")
 
             db.commit()
+            catalog_cache.invalidate("food")
             logger.info(f"Admin created Food Item ID: {new_food_id}")
             
             # Fetch and return the created item details using the new ID
@@ -179,6 +207,7 @@ def update_food_item_admin(food_id: int, update_data, db: pymysql.connections.Co
                     return current_item
 
             db.commit()
+            catalog_cache.invalidate("food")
             logger.info(f"Admin: Successfully updated food item ID {food_id}.")
             return get_food_item_by_id_admin(food_id, db) # Fetch and return updated
 
@@ -221,6 +250,7 @@ def delete_food_item_admin(food_id: int, db: pymysql.connections.Connection):
                     raise HTTPException(status_code=500, detail="Failed to delete food item record.")
 
             db.commit()
+            catalog_cache.invalidate("food")
             logger.info(f"Admin: Successfully deleted food item ID {food_id}.")
             # No body needed for 204 response
 
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pymysql
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from app.env import IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_LEASE_SECONDS
+
+# A key is claimed by inserting its row with StatusCode NULL, a random lease
+# token and a short lease (IDEMPOTENCY_LEASE_SECONDS). The response is stored in
+# the same transaction as the order it describes, and only while the row still
+# carries the request's lease token, so a key with a response always has its
+# order and a key without one never does. Stored responses are kept for
+# IDEMPOTENCY_TTL_SECONDS; a failed request deletes its claim so the client can
+# retry. A lease that runs out (worker crashed or stuck) can be taken over.
+# All times are compared in UTC on the database server.
+
+SWEEP_INTERVAL_SECONDS = 300
+SWEEP_BATCH_SIZE = 1000
+
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+# record(cursor, response), called by the operation right before it commits
+RecordResponse = Callable[[pymysql.cursors.DictCursor, Dict[str, Any]], None]
+
+
+def request_hash(endpoint: str, payload: Any) -> str:
+    """Fingerprint of a request body, to detect a key reused for a different request."""
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{endpoint}\n{body}".encode("utf-8")).hexdigest()
+
+
+def sweep_expired_keys(db: pymysql.connections.Connection):
+    """Delete expired rows, at most once every SWEEP_INTERVAL_SECONDS per process."""
+    global _last_sweep
+    with _sweep_lock:
+        if time.monotonic() - _last_sweep < SWEEP_INTERVAL_SECONDS:
+            return
+        _last_sweep = time.monotonic()
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM IdempotencyKey WHERE ExpiresAt < UTC_TIMESTAMP() LIMIT %s",
+                (SWEEP_BATCH_SIZE,)
+            )
+            deleted = cursor.rowcount
+        db.commit()
+        if deleted:
+            logger.info(f"Swept {deleted} expired idempotency keys.")
+    except pymysql.Error as db_err:
+        db.rollback()
+        logger.error(f"Database error sweeping idempotency keys: {db_err}")
+
+
+def _in_progress() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still being processed.",
+        headers={"Retry-After": "1"},
+    )
+
+
+def claim_idempotency_key(
+    username: str,
+    endpoint: str,
+    key: str,
+    fingerprint: str,
+    lease: str,
+    db: pymysql.connections.Connection
+) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """
+    Claim `key` for a new request under the lease token `lease`. Returns None if
+    the caller should process the request, or (status_code, response) of the
+    first request with this key. Raises 422 if the key was used for a different
+    request, 409 while the first request is still being processed.
+    """
+    try:
+        with db.cursor() as cursor:
+            try:
+                cursor.execute(
+                    """
+                    INSERT INTO IdempotencyKey (Username, Endpoint, IdemKey, RequestHash, LeaseToken, ExpiresAt)
+                    VALUES (%s, %s, %s, %s, %s, UTC_TIMESTAMP() + INTERVAL %s SECOND)
+                    """,
+                    (username, endpoint, key, fingerprint, lease, IDEMPOTENCY_LEASE_SECONDS)
+                )
+                db.commit()
+                claimed = True
+            except pymysql.err.IntegrityError:
+                db.rollback()
+                claimed = False
+
+            if not claimed:
+                cursor.execute(
+                    """
+                    SELECT RequestHash, StatusCode, Response, ExpiresAt < UTC_TIMESTAMP() AS Expired
+                    FROM IdempotencyKey
+                    WHERE Username = %s AND Endpoint = %s AND IdemKey = %s
+                    """,
+                    (username, endpoint, key)
+                )
+                existing = cursor.fetchone()
+                if existing is None:
+                    # Released or swept in the meantime
+                    db.commit()
+                    raise _in_progress()
+                same_request = existing['RequestHash'] == fingerprint
+                if existing['StatusCode'] is not None and same_request:
+                    # The response was stored with the order itself, so the order exists:
+                    # replay it even if its TTL ran out and it was not swept yet
+                    db.commit()
+                    logger.info(f"Replaying stored response for idempotency key of '{username}' on {endpoint}.")
+                    return existing['StatusCode'], json.loads(existing['Response'])
+                if not existing['Expired']:
+                    db.commit()
+                    if not same_request:
+                        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request.")
+                    raise _in_progress()
+
+                # Abandoned lease (nothing was committed under it) or an expired key reused
+                # for a new request: take it over unless someone else just did. A request
+                # still running under the old lease can no longer record its response, so
+                # its transaction rolls back instead of committing a second order.
+                cursor.execute(
+                    """
+                    UPDATE IdempotencyKey
+                    SET RequestHash = %s, LeaseToken = %s, StatusCode = NULL, Response = NULL,
+                        ExpiresAt = UTC_TIMESTAMP() + INTERVAL %s SECOND
+                    WHERE Username = %s AND Endpoint = %s AND IdemKey = %s AND ExpiresAt < UTC_TIMESTAMP()
+                      AND (StatusCode IS NULL OR RequestHash <> %s)
+                    """,
+                    (fingerprint, lease, IDEMPOTENCY_LEASE_SECONDS, username, endpoint, key, fingerprint)
+                )
+                taken_over = cursor.rowcount == 1
+                db.commit()
+                if not taken_over:
+                    raise _in_progress()
+    except pymysql.Error as db_err:
+        db.rollback()
+        logger.error(f"Database error claiming idempotency key for '{username}' on {endpoint}: {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
+    sweep_expired_keys(db)
+    return None
+
+
+def record_idempotent_response(
+    username: str,
+    endpoint: str,
+    key: str,
+    lease: str,
+    status_code: int,
+    response: Dict[str, Any],
+    cursor: pymysql.cursors.DictCursor
+):
+    """
+    Record the response of a claimed key for IDEMPOTENCY_TTL_SECONDS, inside the
+    caller's transaction so it commits or rolls back with the order itself.
+    Raises 409 if the lease was taken over by a retry; the caller must roll back.
+    """
+    cursor.execute(
+        """
+        UPDATE IdempotencyKey
+        SET StatusCode = %s, Response = %s, ExpiresAt = UTC_TIMESTAMP() + INTERVAL %s SECOND
+        WHERE Username = %s AND Endpoint = %s AND IdemKey = %s AND LeaseToken = %s AND StatusCode IS NULL
+        """,
+        (status_code, json.dumps(jsonable_encoder(response)), IDEMPOTENCY_TTL_SECONDS, username, endpoint, key, lease)
+    )
+    if cursor.rowcount != 1:
+        logger.warning(f"Idempotency key of '{username}' on {endpoint} was taken over by a retry; rolling back.")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A retry with this Idempotency-Key took over the request; retry again for its response.",
+            headers={"Retry-After": "1"},
+        )
+
+
+def release_idempotency_key(username: str, endpoint: str, key: str, lease: str, db: pymysql.connections.Connection):
+    """
+    Forget a claim whose request did not commit, so a retry runs it again. A
+    response recorded with a committed order, or a claim taken over by another
+    request, is left alone.
+    """
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(
+                """
+                DELETE FROM IdempotencyKey
+                WHERE Username = %s AND Endpoint = %s AND IdemKey = %s AND LeaseToken = %s AND StatusCode IS NULL
+                """,
+                (username, endpoint, key, lease)
+            )
+        db.commit()
+    except pymysql.Error as db_err:
+        db.rollback()
+        logger.error(f"Database error releasing idempotency key for '{username}' on {endpoint}: {db_err}")
+
+
+def run_idempotent(
+    username: str,
+    endpoint: str,
+    key: Optional[str],
+    payload: Any,
+    status_code: int,
+    operation: Callable[[Optional[RecordResponse]], Dict[str, Any]],
+    db: pymysql.connections.Connection
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Run `operation(record)` at most once per (username, endpoint, key) and return
+    (response, replayed). The operation must call `record(cursor, response)` in
+    its own transaction, right before committing. Without a key the operation
+    runs with `record` None.
+    """
+    if not key:
+        return operation(None), False
+    lease = uuid.uuid4().hex
+    stored = claim_idempotency_key(username, endpoint, key, request_hash(endpoint, payload), lease, db)
+    if stored is not None:
+        return stored[1], True
+
+    def record(cursor: pymysql.cursors.DictCursor, response: Dict[str, Any]):
+        record_idempotent_response(username, endpoint, key, lease, status_code, response, cursor)
+
+    try:
+        result = operation(record)
+    except Exception:
+        # Only deletes the claim if the operation's transaction did not commit
+        release_idempotency_key(username, endpoint, key, lease, db)
+        raise
+    return result, False
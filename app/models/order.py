@@ -1,110 +1,160 @@
 import pymysql
 from fastapi import HTTPException
 from loguru import logger
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Callable, Optional, Tuple
+import base64
 import uuid # Add uuid for unique payment description
 
 from app.models.enums import BookingStatus, CourtStatus, PaymentStatus, PaymentMethod # Add PaymentMethod
-from app.database import get_db
+from app.database import get_db, db_params
+from app.env import BOOKING_LOCK_TIMEOUT_SECONDS
+from app.utils.cache import catalog_cache
+from app.models.court_index import court_index
 
-# --- Helper Functions to Fetch Item Details and Prices ---
+# --- Helper Functions to Validate Items and Fetch Prices (one query per item type) ---
 
-def get_court_details(court_id: int, start_time: datetime, end_time: datetime, db: pymysql.connections.Connection) -> Optional[Dict[str, Any]]:
-    """Fetches court details including price if available for the given time."""
-    try:
-        with db.cursor() as cursor:
-            # Check for existing bookings that overlap
-            cursor.execute(
-                """
-                SELECT BookingID FROM Booking
-                WHERE CourtID = %s AND Status != %s AND (
-                    (%s < Endtime AND %s > StartTime)
-                )
-                """,
-                (court_id, BookingStatus.CANCEL.value, start_time, end_time)
-            )
-            overlapping_booking = cursor.fetchone()
-            if overlapping_booking:
-                logger.warning(f"Court {court_id} is already booked during the requested time.")
-                return None # Court is booked
+def _placeholders(values: List[Any]) -> str:
+    return ", ".join(["%s"] * len(values))
 
-            # Fetch court details and hourly rate
-            cursor.execute(
-                "SELECT Court_ID, HourRate, Status FROM Court WHERE Court_ID = %s",
-                (court_id,)
-            )
-            court = cursor.fetchone()
-            if not court:
-                logger.warning(f"Court with ID {court_id} not found.")
-                return None # Court not found
-            if court['Status'] == CourtStatus.BOOKED.value: # Check general status just in case
-                 logger.warning(f"Court {court_id} status is currently '{CourtStatus.BOOKED.value}'.")
-                 return None # Court is marked as booked
-
-            # Calculate duration and price
-            duration_hours = (end_time - start_time).total_seconds() / 3600
-            if duration_hours <= 0:
-                 logger.warning(f"Invalid booking duration for court {court_id}: start={start_time}, end={end_time}")
-                 return None # Invalid duration
 
-            price = court['HourRate'] * duration_hours
-            return {"Court_ID": court['Court_ID'], "Price": price}
+def find_overlapping_bookings(court_orders: List[Dict[str, Any]], cursor: pymysql.cursors.DictCursor) -> List[Dict[str, Any]]:
+    """Existing (non-cancelled) bookings that overlap any requested interval, in one query."""
+    overlap_conditions = " OR ".join(["(CourtID = %s AND %s < Endtime AND %s > StartTime)"] * len(court_orders))
+    params = [BookingStatus.CANCEL.value]
+    for order in court_orders:
+        params += [order['court_id'], order['start_time'], order['end_time']]
+    cursor.execute(
+        f"SELECT CourtID, StartTime, Endtime FROM Booking WHERE Status != %s AND ({overlap_conditions})",
+        params
+    )
+    return cursor.fetchall()
 
-    except pymysql.Error as db_err:
-        logger.error(f"Database error fetching court details for ID {court_id}: {db_err}")
-        raise HTTPException(status_code=500, detail="Database error checking court availability")
-    except Exception as e:
-        logger.exception(f"Unexpected error fetching court details for ID {court_id}: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error checking court availability")
+
+def court_lock_names(court_orders: List[Dict[str, Any]]) -> List[str]:
+    """
+    Names of the MySQL user locks guarding the court-days (UTC+7) the bookings touch,
+    sorted so that concurrent orders always acquire them in the same order.
+    """
+    names = set()
+    for order in court_orders:
+        day = (order['start_time'] + timedelta(hours=7)).date()
+        last_day = (order['end_time'] - timedelta(microseconds=1) + timedelta(hours=7)).date()
+        while day <= last_day:
+            # Lock names are server-wide (max 64 characters), so include the database name
+            names.add(f"{db_params['db']}.court.{order['court_id']}.{day.isoformat()}"[-64:])
+            day += timedelta(days=1)
+    return sorted(names)
+
+
+def acquire_court_locks(lock_names: List[str], cursor: pymysql.cursors.DictCursor):
+    """
+    Takes the court-day locks with GET_LOCK. Orders for other courts or days never
+    wait on each other; orders for the same court-day are admitted one at a time.
+    Raises 503 if a lock is not obtained within BOOKING_LOCK_TIMEOUT_SECONDS.
+    The caller releases them with release_court_locks().
+    """
+    for name in lock_names:
+        cursor.execute("SELECT GET_LOCK(%s, %s) AS acquired", (name, BOOKING_LOCK_TIMEOUT_SECONDS))
+        if (cursor.fetchone() or {}).get('acquired') != 1:
+            logger.warning(f"Timed out waiting for booking lock {name}.")
+            raise HTTPException(status_code=503, detail="Court is busy, please retry", headers={"Retry-After": "1"})
 
 
-def get_equipment_details(equipment_id: int, db: pymysql.connections.Connection) -> Optional[Dict[str, Any]]:
-    """Fetches equipment details including price if in stock."""
+def release_court_locks(cursor: pymysql.cursors.DictCursor):
     try:
-        with db.cursor() as cursor:
-            cursor.execute(
-                "SELECT EquipmentID, Price, Stock FROM Equipment WHERE EquipmentID = %s",
-                (equipment_id,)
-            )
-            equipment = cursor.fetchone()
-            if not equipment:
-                logger.warning(f"Equipment with ID {equipment_id} not found.")
-                return None
-            if equipment['Stock'] <= 0:
-                logger.warning(f"Equipment with ID {equipment_id} is out of stock.")
-                return None
-            return {"EquipmentID": equipment['EquipmentID'], "Price": equipment['Price']}
+        cursor.execute("SELECT RELEASE_ALL_LOCKS()")
     except pymysql.Error as db_err:
-        logger.error(f"Database error fetching equipment details for ID {equipment_id}: {db_err}")
-        raise HTTPException(status_code=500, detail="Database error checking equipment stock")
-    except Exception as e:
-        logger.exception(f"Unexpected error fetching equipment details for ID {equipment_id}: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error checking equipment stock")
+        # The locks go away with the session anyway
+        logger.error(f"Failed to release booking locks: {db_err}")
 
 
-def get_food_details(food_id: int, db: pymysql.connections.Connection) -> Optional[Dict[str, Any]]:
-    """Fetches food details including price if in stock."""
-    try:
-        with db.cursor() as cursor:
-            cursor.execute(
-                "SELECT FoodID, Price, Stock FROM CafeteriaFood WHERE FoodID = %s",
-                (food_id,)
-            )
-            food = cursor.fetchone()
-            if not food:
-                logger.warning(f"Food item with ID {food_id} not found.")
-                return None
-            if food['Stock'] <= 0:
-                logger.warning(f"Food item with ID {food_id} is out of stock.")
-                return None
-            return {"FoodID": food['FoodID'], "Price": food['Price']}
-    except pymysql.Error as db_err:
-        logger.error(f"Database error fetching food details for ID {food_id}: {db_err}")
-        raise HTTPException(status_code=500, detail="Database error checking food stock")
-    except Exception as e:
-        logger.exception(f"Unexpected error fetching food details for ID {food_id}: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error checking food stock")
+def validate_court_orders(court_orders: List[Dict[str, Any]], cursor: pymysql.cursors.DictCursor) -> List[Dict[str, Any]]:
+    """
+    Validates all court bookings of an order and returns them with their price.
+    Uses one query for the courts and one for overlapping bookings, whatever the cart size.
+    """
+    for order in court_orders:
+        if not all([order.get('court_id'), order.get('start_time'), order.get('end_time')]):
+            raise HTTPException(status_code=400, detail="Missing court booking details (court_id, start_time, end_time)")
+        if order['end_time'] <= order['start_time']:
+            logger.warning(f"Invalid booking duration for court {order['court_id']}: start={order['start_time']}, end={order['end_time']}")
+            raise HTTPException(status_code=400, detail=f"Court {order['court_id']} is unavailable or invalid for the requested time.")
+
+    # Bookings in the same cart must not overlap each other
+    by_court: Dict[int, List[Dict[str, Any]]] = {}
+    for order in court_orders:
+        by_court.setdefault(order['court_id'], []).append(order)
+    for court_id, orders in by_court.items():
+        orders = sorted(orders, key=lambda o: o['start_time'])
+        for previous, current in zip(orders, orders[1:]):
+            if current['start_time'] < previous['end_time']:
+                raise HTTPException(status_code=400, detail=f"Court {court_id} is booked more than once for overlapping times in this order.")
+
+    court_ids = list(by_court)
+    cursor.execute(
+        f"SELECT Court_ID, HourRate, Status FROM Court WHERE Court_ID IN ({_placeholders(court_ids)})",
+        court_ids
+    )
+    courts = {court['Court_ID']: court for court in cursor.fetchall()}
+
+    existing = find_overlapping_bookings(court_orders, cursor)
+
+    validated = []
+    for order in court_orders:
+        court_id, start_time, end_time = order['court_id'], order['start_time'], order['end_time']
+        court = courts.get(court_id)
+        if not court:
+            logger.warning(f"Court with ID {court_id} not found.")
+        elif court['Status'] == CourtStatus.BOOKED.value: # Check general status just in case
+            logger.warning(f"Court {court_id} status is currently '{CourtStatus.BOOKED.value}'.")
+        elif any(row['CourtID'] == court_id and start_time < row['Endtime'] and end_time > row['StartTime'] for row in existing):
+            logger.warning(f"Court {court_id} is already booked during the requested time.")
+        else:
+            duration_hours = (end_time - start_time).total_seconds() / 3600
+            validated.append({**order, "price": court['HourRate'] * duration_hours})
+            continue
+        raise HTTPException(status_code=400, detail=f"Court {court_id} is unavailable or invalid for the requested time.")
+    return validated
+
+
+def validate_stock_items(
+    item_orders: List[Dict[str, Any]],
+    item_key: str,
+    table: str,
+    id_column: str,
+    label: str,
+    cursor: pymysql.cursors.DictCursor
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Validates equipment or food lines of an order with one query and returns
+    {item ID: {"Price": ..., "Stock": ..., "Quantity": ...}}. Lines for the same
+    item are merged by adding up their quantities. Raises 400 for missing or
+    unknown items and for quantities above the stock.
+    """
+    quantities: Dict[int, int] = {}
+    for order in item_orders:
+        item_id = order.get(item_key)
+        if not item_id:
+            raise HTTPException(status_code=400, detail=f"Missing {label} details ({item_key})")
+        quantities[item_id] = quantities.get(item_id, 0) + order.get('quantity', 1)
+
+    item_ids = list(quantities)
+    cursor.execute(
+        f"SELECT {id_column}, Price, Stock FROM {table} WHERE {id_column} IN ({_placeholders(item_ids)})",
+        item_ids
+    )
+    items = {row[id_column]: row for row in cursor.fetchall()}
+    for item_id, quantity in quantities.items():
+        item = items.get(item_id)
+        if not item or item['Stock'] <= 0:
+            logger.warning(f"{label.capitalize()} with ID {item_id} is not found or out of stock.")
+            raise HTTPException(status_code=400, detail=f"{label.capitalize()} {item_id} is unavailable or out of stock.")
+        if item['Stock'] < quantity:
+            logger.warning(f"{label.capitalize()} with ID {item_id} has {item['Stock']} in stock, {quantity} requested.")
+            raise HTTPException(status_code=400, detail=f"Only {item['Stock']} of {label} {item_id} left in stock.")
+        item['Quantity'] = quantity
+    return {item_id: items[item_id] for item_id in item_ids}
 
 
 # --- Functions to Create Order and Related Entries ---
@@ -127,65 +177,77 @@ def create_order_table_entry(customer_id: int, total_amount: float, db: pymysql.
         raise # Re-raise to be caught by the main transaction handler
 
 
-def create_booking_entry(order_id: int, customer_id: int, court_id: int, start_time: datetime, end_time: datetime, price: float, db: pymysql.connections.Connection, cursor: pymysql.cursors.DictCursor):
-    """Creates an entry in the Booking table (relies on BookingID AUTO_INCREMENT)."""
+def create_booking_entries(order_id: int, customer_id: int, courts: List[Dict[str, Any]], db: pymysql.connections.Connection, cursor: pymysql.cursors.DictCursor) -> List[Dict[str, Any]]:
+    """
+    Creates the Booking rows of an order with a single multi-row INSERT and
+    returns them (BookingID, CourtID, StartTime, Endtime).
+    """
     try:
-        cursor.execute(
+        cursor.executemany(
             """
             INSERT INTO Booking (CustomerID, CourtID, StartTime, Endtime, Status, TotalPrice, OrderID)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
             """,
-            (customer_id, court_id, start_time, end_time, BookingStatus.PENDING.value, price, order_id)
+            [
+                (customer_id, court['court_id'], court['start_time'], court['end_time'], BookingStatus.PENDING.value, court['price'], order_id)
+                for court in courts
+            ]
         )
-        # Log the booking ID for debugging
-        booking_id = cursor.lastrowid
-        logger.info(f"Created Booking entry with ID {booking_id} for OrderID {order_id}, CourtID {court_id}")
-        logger.info(f"Created Booking entry for OrderID {order_id}, CourtID {court_id}")
+        cursor.execute("SELECT BookingID, CourtID, StartTime, Endtime FROM Booking WHERE OrderID = %s", (order_id,))
+        bookings = cursor.fetchall()
+        logger.info(f"Created {len(bookings)} Booking entries for OrderID {order_id}")
+        return bookings
     except pymysql.Error as db_err:
-        logger.error(f"Database error creating Booking entry for OrderID {order_id}, CourtID {court_id}: {db_err}")
+        logger.error(f"Database error creating Booking entries for OrderID {order_id}: {db_err}")
         raise # Re-raise for transaction rollback
 
 
-def create_rental_entry(order_id: int, equipment_id: int, db: pymysql.connections.Connection, cursor: pymysql.cursors.DictCursor):
-    """Creates an entry in the Rent table."""
+def create_item_entries(order_id: int, quantities: Dict[int, int], table: str, id_column: str, db: pymysql.connections.Connection, cursor: pymysql.cursors.DictCursor):
+    """Creates the Rent or OrderFood rows ({item ID: quantity}) of an order with a single multi-row INSERT."""
     try:
-        cursor.execute(
-            "INSERT INTO Rent (OrderID, EquipmentID) VALUES (%s, %s)",
-            (order_id, equipment_id)
+        cursor.executemany(
+            f"INSERT INTO {table} (OrderID, {id_column}, Quantity) VALUES (%s, %s, %s)",
+            [(order_id, item_id, quantity) for item_id, quantity in quantities.items()]
         )
-        # Decrement stock (Optional: Could be done here or via triggers)
-        # cursor.execute("UPDATE Equipment SET Stock = Stock - 1 WHERE EquipmentID = %s", (equipment_id,))
-        logger.info(f"Created Rent entry for OrderID {order_id}, EquipmentID {equipment_id}")
+        logger.info(f"Created {len(quantities)} {table} entries for OrderID {order_id}")
     except pymysql.Error as db_err:
-        logger.error(f"Database error creating Rent entry for OrderID {order_id}, EquipmentID {equipment_id}: {db_err}")
+        logger.error(f"Database error creating {table} entries for OrderID {order_id}: {db_err}")
         raise # Re-raise for transaction rollback
 
 
-def create_food_order_entry(order_id: int, food_id: int, db: pymysql.connections.Connection, cursor: pymysql.cursors.DictCursor):
-    """Creates an entry in the OrderFood table."""
-    try:
-        cursor.execute(
-            "INSERT INTO OrderFood (OrderID, FoodID) VALUES (%s, %s)",
-            (order_id, food_id)
-        )
-         # Decrement stock (Optional: Could be done here or via triggers)
-        # cursor.execute("UPDATE CafeteriaFood SET Stock = Stock - 1 WHERE FoodID = %s", (food_id,))
-        logger.info(f"Created OrderFood entry for OrderID {order_id}, FoodID {food_id}")
-    except pymysql.Error as db_err:
-        logger.error(f"Database error creating OrderFood entry for OrderID {order_id}, FoodID {food_id}: {db_err}")
-        raise # Re-raise for transaction rollback
+def reserve_stock(quantities: Dict[int, int], table: str, id_column: str, label: str, db: pymysql.connections.Connection, cursor: pymysql.cursors.DictCursor):
+    """
+    Takes {item ID: quantity} out of stock with a single UPDATE joined to the
+    requested quantities. An item without enough stock left is not updated; then
+    the row count falls short and 409 is raised, and the caller's rollback undoes
+    the other decrements, so the order reserves all of its items or none.
+    """
+    requested = " UNION ALL ".join(["SELECT %s AS ItemID, %s AS Quantity"] * len(quantities))
+    params = [value for item in quantities.items() for value in item]
+    cursor.execute(
+        f"""
+        UPDATE {table} t
+        JOIN ({requested}) r ON t.{id_column} = r.ItemID
+        SET t.Stock = t.Stock - r.Quantity
+        WHERE t.Stock >= r.Quantity
+        """,
+        params
+    )
+    if cursor.rowcount != len(quantities):
+        logger.error(f"Failed to reserve stock for {table} items {quantities}: only {cursor.rowcount} updated. Some items might be out of stock.")
+        raise HTTPException(status_code=409, detail=f"{label.capitalize()} {', '.join(map(str, quantities))} became unavailable during order processing.")
 
 
 def create_payment_entry(order_id: int, customer_id: int, total_amount: float, payment_method: PaymentMethod, db: pymysql.connections.Connection, cursor: pymysql.cursors.DictCursor) -> Dict[str, Any]:
     """Creates an entry in the Payment table with a unique description and specified method."""
     try:
-        payment_description = str(uuid.uuid4()) # Generate unique description
+        payment_description = str(uuid.uuid4()) # Generate unique description, also stored as the indexed Reference
         cursor.execute(
             """
-            INSERT INTO Payment (OrderID, Total, Customer_ID, Method, Status, Description, Time)
-            VALUES (%s, %s, %s, %s, %s, %s, NOW())
+            INSERT INTO Payment (OrderID, Total, Customer_ID, Method, Status, Description, Reference, Time)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
             """,
-            (order_id, total_amount, customer_id, payment_method.value, PaymentStatus.PENDING.value, payment_description)
+            (order_id, total_amount, customer_id, payment_method.value, PaymentStatus.PENDING.value, payment_description, payment_description)
         )
         payment_id = cursor.lastrowid
         if not payment_id:
@@ -206,116 +268,80 @@ def process_order(
     equipment_orders: Optional[List[Dict[str, Any]]],
     food_orders: Optional[List[Dict[str, Any]]],
     payment_method: PaymentMethod, # Add payment_method parameter
-    db: pymysql.connections.Connection
+    db: pymysql.connections.Connection,
+    before_commit: Optional[Callable[[pymysql.cursors.DictCursor, Dict[str, Any]], None]] = None
 ) -> Dict[str, Any]:
     """
     Processes a complete order:
-    1. Validates items and calculates total price.
+    1. Validates items and calculates total price (one query per item type).
     2. Creates OrderTable entry.
-    3. Creates Booking, Rent, OrderFood entries.
+    3. Creates Booking, Rent, OrderFood entries with multi-row inserts and reserves
+       the equipment and food quantities with one UPDATE per item type.
     4. Handles the entire process within a database transaction.
+    `before_commit(cursor, result)`, if given, runs last in that transaction
+    (e.g. to record an idempotent response); raising from it rolls the order back.
     """
     total_amount = 0.0
     validated_courts = []
-    validated_equipment = []
-    validated_food = []
+    validated_equipment: Dict[int, int] = {}
+    validated_food: Dict[int, int] = {}
 
     try:
         # --- 1. Validation and Price Calculation ---
-        if court_orders:
-            for order in court_orders:
-                court_id = order.get('court_id')
-                start_time = order.get('start_time')
-                end_time = order.get('end_time')
-                if not all([court_id, start_time, end_time]):
-                    raise HTTPException(status_code=400, detail="Missing court booking details (court_id, start_time, end_time)")
-
-                details = get_court_details(court_id, start_time, end_time, db)
-                if not details:
-                    raise HTTPException(status_code=400, detail=f"Court {court_id} is unavailable or invalid for the requested time.")
-                total_amount += details['Price']
-                validated_courts.append({**order, "price": details['Price']}) # Store details needed for insertion
-
-        if equipment_orders:
-            for order in equipment_orders:
-                equipment_id = order.get('equipment_id')
-                # quantity = order.get('quantity', 1) # Assuming quantity 1 for now
-                if not equipment_id:
-                     raise HTTPException(status_code=400, detail="Missing equipment rental details (equipment_id)")
-
-                details = get_equipment_details(equipment_id, db)
-                if not details:
-                    raise HTTPException(status_code=400, detail=f"Equipment {equipment_id} is unavailable or out of stock.")
-                total_amount += details['Price'] # * quantity
-                validated_equipment.append(order) # Store details needed for insertion
-
-        if food_orders:
-            for order in food_orders:
-                food_id = order.get('food_id')
-                # quantity = order.get('quantity', 1) # Assuming quantity 1 for now
-                if not food_id:
-                     raise HTTPException(status_code=400, detail="Missing food order details (food_id)")
-
-                details = get_food_details(food_id, db)
-                if not details:
-                    raise HTTPException(status_code=400, detail=f"Food item {food_id} is unavailable or out of stock.")
-                total_amount += details['Price'] # * quantity
-                validated_food.append(order) # Store details needed for insertion
+        with db.cursor() as cursor:
+            try:
+                if court_orders:
+                    validated_courts = validate_court_orders(court_orders, cursor)
+                    total_amount += sum(court['price'] for court in validated_courts)
+
+                if equipment_orders:
+                    equipment = validate_stock_items(equipment_orders, 'equipment_id', 'Equipment', 'EquipmentID', 'equipment', cursor)
+                    validated_equipment = {equipment_id: item['Quantity'] for equipment_id, item in equipment.items()}
+                    total_amount += sum(item['Price'] * item['Quantity'] for item in equipment.values())
+
+                if food_orders:
+                    food = validate_stock_items(food_orders, 'food_id', 'CafeteriaFood', 'FoodID', 'food item', cursor)
+                    validated_food = {food_id: item['Quantity'] for food_id, item in food.items()}
+                    total_amount += sum(item['Price'] * item['Quantity'] for item in food.values())
+            except pymysql.Error as db_err:
+                logger.error(f"Database error validating order for CustomerID {customer_id}: {db_err}")
+                raise HTTPException(status_code=500, detail="Database error checking order items")
 
         if total_amount <= 0 and not (validated_courts or validated_equipment or validated_food):
              raise HTTPException(status_code=400, detail="Order cannot be empty.")
 
         # --- 2. Database Transaction ---
+        lock_names = court_lock_names(validated_courts)
         with db.cursor() as cursor:
             try:
+                if lock_names:
+                    # End the validation snapshot so the re-check below sees bookings committed meanwhile
+                    db.commit()
+                    acquire_court_locks(lock_names, cursor)
+                    db.begin()
+                    # Re-check under the locks: another order may have booked these courts since validation
+                    conflicts = find_overlapping_bookings(validated_courts, cursor)
+                    if conflicts:
+                        logger.warning(f"Court {conflicts[0]['CourtID']} was booked by another order during validation.")
+                        raise HTTPException(status_code=409, detail=f"Court {conflicts[0]['CourtID']} was booked by another order for the requested time.")
+
                 # --- Create OrderTable Entry ---
                 order_id = create_order_table_entry(customer_id, total_amount, db, cursor)
 
                 # --- Create Booking Entries ---
-                for court_data in validated_courts:
-                    create_booking_entry(
-                        order_id=order_id,
-                        customer_id=customer_id,
-                        court_id=court_data['court_id'],
-                        start_time=court_data['start_time'],
-                        end_time=court_data['end_time'],
-                        price=court_data['price'],
-                        db=db,
-                        cursor=cursor
-                    )
+                bookings = []
+                if validated_courts:
+                    bookings = create_booking_entries(order_id, customer_id, validated_courts, db, cursor)
 
-                # --- Create Rent Entries ---
-                for equip_data in validated_equipment:
-                    create_rental_entry(
-                        order_id=order_id,
-                        equipment_id=equip_data['equipment_id'],
-                        db=db,
-                        cursor=cursor
-                    )
-                    # Decrement equipment stock within the transaction
-                    cursor.execute("UPDATE Equipment SET Stock = Stock - 1 WHERE EquipmentID = %s AND Stock > 0", (equip_data['equipment_id'],))
-                    if cursor.rowcount == 0:
-                        # This means the stock was 0 or the item didn't exist, despite earlier checks.
-                        # This could happen due to a race condition.
-                        logger.error(f"Failed to decrement stock for EquipmentID {equip_data['equipment_id']} (OrderID: {order_id}). Item might be out of stock.")
-                        raise HTTPException(status_code=409, detail=f"Equipment {equip_data['equipment_id']} became unavailable during order processing.")
-
-
-                # --- Create OrderFood Entries ---
-                for food_data in validated_food:
-                    create_food_order_entry(
-                        order_id=order_id,
-                        food_id=food_data['food_id'],
-                        db=db,
-                        cursor=cursor
-                    )
-                    # Decrement food stock within the transaction
-                    cursor.execute("UPDATE CafeteriaFood SET Stock = Stock - 1 WHERE FoodID = %s AND Stock > 0", (food_data['food_id'],))
-                    if cursor.rowcount == 0:
-                        # This means the stock was 0 or the item didn't exist.
-                        logger.error(f"Failed to decrement stock for FoodID {food_data['food_id']} (OrderID: {order_id}). Item might be out of stock.")
-                        raise HTTPException(status_code=409, detail=f"Food item {food_data['food_id']} became unavailable during order processing.")
+                # --- Create Rent Entries and reserve equipment stock ---
+                if validated_equipment:
+                    create_item_entries(order_id, validated_equipment, 'Rent', 'EquipmentID', db, cursor)
+                    reserve_stock(validated_equipment, 'Equipment', 'EquipmentID', 'equipment', db, cursor)
 
+                # --- Create OrderFood Entries and reserve food stock ---
+                if validated_food:
+                    create_item_entries(order_id, validated_food, 'OrderFood', 'FoodID', db, cursor)
+                    reserve_stock(validated_food, 'CafeteriaFood', 'FoodID', 'food item', db, cursor)
 
                 # --- Create Payment Entry ---
                 payment_details = create_payment_entry(
@@ -327,16 +353,32 @@ def process_order(
                     cursor=cursor
                 )
 
-                # --- Commit Transaction ---
-                db.commit()
-                logger.info(f"Successfully processed and committed OrderID: {order_id} for CustomerID: {customer_id}")
-                return {
+                result = {
                     "order_id": order_id,
                     "total_amount": total_amount,
                     "message": "Order placed successfully, pending payment.",
                     "payment_id": payment_details["payment_id"],
                     "payment_description": payment_details["payment_description"]
                 }
+                if before_commit:
+                    before_commit(cursor, result)
+
+                # --- Commit Transaction ---
+                db.commit()
+                if validated_equipment or validated_food:
+                    # Stock shown in the public catalog changed
+                    catalog_cache.invalidate("equipment", "food")
+                for booking in bookings:
+                    court_index.add_booking(
+                        booking['BookingID'],
+                        booking['CourtID'],
+                        booking['StartTime'],
+                        booking['Endtime'],
+                        BookingStatus.PENDING.value,
+                        order_id
+                    )
+                logger.info(f"Successfully processed and committed OrderID: {order_id} for CustomerID: {customer_id}")
+                return result
 
             except (pymysql.Error, HTTPException) as e:
                 db.rollback()
@@ -349,6 +391,9 @@ def process_order(
                  db.rollback()
                  logger.exception(f"Unexpected error during order transaction for CustomerID {customer_id}: {e}")
                  raise HTTPException(status_code=500, detail="An unexpected error occurred while processing the order.")
+            finally:
+                if lock_names:
+                    release_court_locks(cursor)
 
     except HTTPException as e:
         # Catch validation errors before transaction starts
@@ -359,169 +404,230 @@ def process_order(
         raise HTTPException(status_code=500, detail="An unexpected error occurred before processing the order.")
 # --- Function to Retrieve User Orders ---
 
-def get_user_orders(customer_id: int, db: pymysql.connections.Connection) -> List[Dict[str, Any]]:
+ORDER_HEADERS_SQL = """
+    SELECT
+        `o`.`OrderID`,
+        `o`.`OrderDate`,
+        `o`.`TotalAmount`,
+        `o`.`SessionID` AS `order_session_id`,
+        `ts`.`SessionID` AS `session_SessionID`,
+        `ts`.`Type` AS `session_Type`,
+        `ts`.`StartDate` AS `session_StartDate`,
+        `ts`.`EndDate` AS `session_EndDate`,
+        `ts`.`Price` AS `session_Price`
+    FROM `OrderTable` `o`
+    LEFT JOIN `Training_Session` `ts` ON `o`.`SessionID` = `ts`.`SessionID`
+"""
+
+def encode_order_cursor(order_date: datetime, order_id: int) -> str:
+    """Opaque cursor pointing just after the order (order_date, order_id)."""
+    return base64.urlsafe_b64encode(f"{order_date.isoformat()}|{order_id}".encode()).decode().rstrip("=")
+
+
+def decode_order_cursor(cursor_token: str) -> Tuple[datetime, int]:
+    """Inverse of encode_order_cursor. Raises 400 for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor_token + "=" * (-len(cursor_token) % 4)).decode()
+        order_date, order_id = raw.split("|")
+        return datetime.fromisoformat(order_date), int(order_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def build_order_header(base_order: Dict[str, Any], expand: bool) -> Dict[str, Any]:
+    """Order dict from a row of ORDER_HEADERS_SQL; detail lists are None unless expanded."""
+    session_details = None
+    if base_order['order_session_id'] is not None and base_order['session_SessionID'] is not None:
+         session_details = {
+             "SessionID": base_order['session_SessionID'],
+             "Type": base_order['session_Type'],
+             "StartDate": base_order['session_StartDate'],
+             "EndDate": base_order['session_EndDate'],
+             "Price": base_order['session_Price']
+         }
+    return {
+        "order_id": base_order['OrderID'],
+        "order_date": base_order['OrderDate'],
+        "total_amount": base_order['TotalAmount'],
+        "bookings": [] if expand else None,
+        "equipment_rentals": [] if expand else None,
+        "food_items": [] if expand else None,
+        "session": session_details
+    }
+
+
+def attach_order_details(orders_dict: Dict[int, Dict[str, Any]], cursor: pymysql.cursors.DictCursor):
+    """Fills the bookings, rentals and food items of the given orders, one query per kind."""
+    order_ids = list(orders_dict)
+    if not order_ids:
+        return
+
+    # Fetch Bookings
+    sql_bookings = """
+    SELECT
+        `b`.`OrderID`,
+        `b`.`BookingID`,
+        `b`.`StartTime`,
+        `b`.`Endtime`,
+        `b`.`Status`,
+        `b`.`TotalPrice`,
+        `b`.`CourtID` AS `Court_ID`,
+        `c`.`Type` AS `CourtType`,
+        `c`.`HourRate`
+    FROM `Booking` `b`
+    JOIN `Court` `c` ON `b`.`CourtID` = `c`.`Court_ID`
+    WHERE `b`.`OrderID` IN %s
+    """
+    cursor.execute(sql_bookings, (order_ids,))
+    bookings = cursor.fetchall()
+    for booking in bookings:
+        oid = booking['OrderID']
+        if oid in orders_dict:
+            booking_data = {
+                "BookingID": booking['BookingID'],
+                "StartTime": booking['StartTime'],
+                "Endtime": booking['Endtime'],
+                "Status": booking['Status'],
+                "TotalPrice": booking['TotalPrice'],
+                "Court_ID": booking['Court_ID'],
+                "CourtType": booking['CourtType'],
+                "HourRate": booking['HourRate'],
+            }
+            orders_dict[oid]['bookings'].append(booking_data)
+
+
+    # Fetch Equipment Rentals
+    sql_equipment = """
+    SELECT
+        `r`.`OrderID`,
+        `e`.`EquipmentID`,
+        `e`.`Name`,
+        `e`.`Brand`,
+        `e`.`Type` AS `EquipmentType`,
+        `e`.`Price`,
+        `r`.`Quantity`
+    FROM `Rent` `r`
+    JOIN `Equipment` `e` ON `r`.`EquipmentID` = `e`.`EquipmentID`
+    WHERE `r`.`OrderID` IN %s
     """
-    Retrieves all orders and their details for a given customer, including
-    linked training session details if applicable.
+    cursor.execute(sql_equipment, (order_ids,))
+    equipment_rentals = cursor.fetchall()
+    for rental in equipment_rentals:
+         oid = rental['OrderID']
+         if oid in orders_dict:
+            rental_data = {
+                "EquipmentID": rental['EquipmentID'],
+                "Name": rental['Name'],
+                "Brand": rental['Brand'],
+                "EquipmentType": rental['EquipmentType'],
+                "Price": rental['Price'],
+                "Quantity": rental['Quantity'],
+            }
+            orders_dict[oid]['equipment_rentals'].append(rental_data)
+
+    # Fetch Food Items (Corrected Query)
+    sql_food = """
+    SELECT
+        `of`.`OrderID`,
+        `cf`.`FoodID`,
+        `cf`.`Name`,
+        `cf`.`Category` AS `FoodCategory`,
+        `cf`.`Price`,
+        `of`.`Quantity`
+    FROM `OrderFood` `of`
+    JOIN `CafeteriaFood` `cf` ON `of`.`FoodID` = `cf`.`FoodID`
+    WHERE `of`.`OrderID` IN %s
+    """
+    # ^-- Added backticks around table names (`OrderFood`, `CafeteriaFood`),
+    #     aliases (`of`, `cf`), and potentially ambiguous column names.
+    cursor.execute(sql_food, (order_ids,))
+    food_items = cursor.fetchall()
+    for food in food_items:
+        oid = food['OrderID']
+        if oid in orders_dict:
+            food_data = {
+                "FoodID": food['FoodID'],
+                "Name": food['Name'],
+                "FoodCategory": food['FoodCategory'],
+                "Price": food['Price'],
+                "Quantity": food['Quantity'],
+            }
+            orders_dict[oid]['food_items'].append(food_data)
+
+
+def get_user_orders(
+    customer_id: int,
+    db: pymysql.connections.Connection,
+    limit: Optional[int] = 20,
+    after: Optional[str] = None,
+    expand: bool = True
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Retrieves one page of a customer's orders, newest first, including linked
+    training session details if applicable. Pages are keyed on (OrderDate, OrderID)
+    so each page is an index range scan on (CustomerID, OrderDate) whatever its depth.
+    `after` is the next_cursor of the previous page. Without `expand` only the
+    order headers are returned; details can then be fetched per order.
+    `limit` None returns all remaining orders (no next_cursor).
+    Returns (orders, next_cursor), next_cursor being None on the last page.
     """
-    orders_list = []
     try:
         # Use DictCursor to get results as dictionaries
         with db.cursor(pymysql.cursors.DictCursor) as cursor: # Ensure DictCursor is used
-
-            # 1. Fetch all base order details for the customer, JOIN with Session
-            # Use aliases (o, ts) for clarity and backticks for safety
-            sql_base_orders = """
-            SELECT
-                `o`.`OrderID`,
-                `o`.`OrderDate`,
-                `o`.`TotalAmount`,
-                `o`.`SessionID` AS `order_session_id`,
-                `ts`.`SessionID` AS `session_SessionID`,
-                `ts`.`Type` AS `session_Type`,
-                `ts`.`StartDate` AS `session_StartDate`,
-                `ts`.`EndDate` AS `session_EndDate`,
-                `ts`.`Price` AS `session_Price`
-            FROM `OrderTable` `o`
-            LEFT JOIN `Training_Session` `ts` ON `o`.`SessionID` = `ts`.`SessionID`
-            WHERE `o`.`CustomerID` = %s
-            ORDER BY `o`.`OrderDate` DESC
-            """
-            cursor.execute(sql_base_orders, (customer_id,))
-            orders_base_data = cursor.fetchall()
-            
-            logger.debug(f"Fetched base order data for CustomerID {customer_id}: {orders_base_data}")
-            # Log specific details for Order #12 if found
-
-            if not orders_base_data:
-                return []
-
-            orders_dict: Dict[int, Dict[str, Any]] = {}
-            order_ids: List[int] = []
-
-            for base_order in orders_base_data:
-                order_id = base_order['OrderID']
-                order_ids.append(order_id)
-
-                session_details = None
-                if base_order['order_session_id'] is not None and base_order['session_SessionID'] is not None:
-                     session_details = {
-                         "SessionID": base_order['session_SessionID'],
-                         "Type": base_order['session_Type'],
-                         "StartDate": base_order['session_StartDate'],
-                         "EndDate": base_order['session_EndDate'],
-                         "Price": base_order['session_Price']
-                     }
-
-                orders_dict[order_id] = {
-                    "order_id": order_id,
-                    "order_date": base_order['OrderDate'],
-                    "total_amount": base_order['TotalAmount'],
-                    "bookings": [],
-                    "equipment_rentals": [],
-                    "food_items": [],
-                    "session": session_details
-                }
-
-            if not order_ids:
-                return []
-
-            # 2. Fetch associated details in batches using IN clause (with backticks)
-
-            # Fetch Bookings
-            sql_bookings = """
-            SELECT
-                `b`.`OrderID`,
-                `b`.`BookingID`,
-                `b`.`StartTime`,
-                `b`.`Endtime`,
-                `b`.`Status`,
-                `b`.`TotalPrice`,
-                `b`.`CourtID` AS `Court_ID`,
-                `c`.`Type` AS `CourtType`,
-                `c`.`HourRate`
-            FROM `Booking` `b`
-            JOIN `Court` `c` ON `b`.`CourtID` = `c`.`Court_ID`
-            WHERE `b`.`OrderID` IN %s
-            """
-            cursor.execute(sql_bookings, (order_ids,))
-            bookings = cursor.fetchall()
-            for booking in bookings:
-                oid = booking['OrderID']
-                if oid in orders_dict:
-                    booking_data = {
-                        "BookingID": booking['BookingID'],
-                        "StartTime": booking['StartTime'],
-                        "Endtime": booking['Endtime'],
-                        "Status": booking['Status'],
-                        "TotalPrice": booking['TotalPrice'],
-                        "Court_ID": booking['Court_ID'],
-                        "CourtType": booking['CourtType'],
-                        "HourRate": booking['HourRate'],
-                    }
-                    orders_dict[oid]['bookings'].append(booking_data)
-
-
-            # Fetch Equipment Rentals
-            sql_equipment = """
-            SELECT
-                `r`.`OrderID`,
-                `e`.`EquipmentID`,
-                `e`.`Name`,
-                `e`.`Brand`,
-                `e`.`Type` AS `EquipmentType`,
-                `e`.`Price`
-            FROM `Rent` `r`
-            JOIN `Equipment` `e` ON `r`.`EquipmentID` = `e`.`EquipmentID`
-            WHERE `r`.`OrderID` IN %s
-            """
-            cursor.execute(sql_equipment, (order_ids,))
-            equipment_rentals = cursor.fetchall()
-            for rental in equipment_rentals:
-                 oid = rental['OrderID']
-                 if oid in orders_dict:
-                    rental_data = {
-                        "EquipmentID": rental['EquipmentID'],
-                        "Name": rental['Name'],
-                        "Brand": rental['Brand'],
-                        "EquipmentType": rental['EquipmentType'],
-                        "Price": rental['Price'],
-                    }
-                    orders_dict[oid]['equipment_rentals'].append(rental_data)
-
-            # Fetch Food Items (Corrected Query)
-            sql_food = """
-            SELECT
-                `of`.`OrderID`,
-                `cf`.`FoodID`,
-                `cf`.`Name`,
-                `cf`.`Category` AS `FoodCategory`,
-                `cf`.`Price`
-            FROM `OrderFood` `of`
-            JOIN `CafeteriaFood` `cf` ON `of`.`FoodID` = `cf`.`FoodID`
-            WHERE `of`.`OrderID` IN %s
-            """
-            # ^-- Added backticks around table names (`OrderFood`, `CafeteriaFood`),
-            #     aliases (`of`, `cf`), and potentially ambiguous column names.
-            cursor.execute(sql_food, (order_ids,))
-            food_items = cursor.fetchall()
-            for food in food_items:
-                oid = food['OrderID']
-                if oid in orders_dict:
-                    food_data = {
-                        "FoodID": food['FoodID'],
-                        "Name": food['Name'],
-                        "FoodCategory": food['FoodCategory'],
-                        "Price": food['Price'],
-                    }
-                    orders_dict[oid]['food_items'].append(food_data)
-
-            orders_list = list(orders_dict.values())
-        return orders_list
-
+            sql = ORDER_HEADERS_SQL + " WHERE `o`.`CustomerID` = %s"
+            params: List[Any] = [customer_id]
+            if after:
+                after_date, after_id = decode_order_cursor(after)
+                sql += " AND (`o`.`OrderDate` < %s OR (`o`.`OrderDate` = %s AND `o`.`OrderID` < %s))"
+                params += [after_date, after_date, after_id]
+            sql += " ORDER BY `o`.`OrderDate` DESC, `o`.`OrderID` DESC"
+            if limit is not None:
+                # One extra row tells whether there is a next page
+                sql += " LIMIT %s"
+                params.append(limit + 1)
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+            next_cursor = None
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_order_cursor(rows[-1]['OrderDate'], rows[-1]['OrderID'])
+
+            orders_dict = {row['OrderID']: build_order_header(row, expand) for row in rows}
+            if expand:
+                attach_order_details(orders_dict, cursor)
+        return list(orders_dict.values()), next_cursor
+
+    except HTTPException:
+        raise
     except pymysql.Error as db_err:
         logger.error(f"Database error fetching orders for CustomerID {customer_id}: {db_err}")
         raise HTTPException(status_code=500, detail="Database error retrieving order history.")
     except Exception as e:
         logger.exception(f"Unexpected error fetching orders for CustomerID {customer_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error retrieving order history.")
+
+
+def get_user_order(customer_id: int, order_id: int, db: pymysql.connections.Connection) -> Dict[str, Any]:
+    """Retrieves one order of a customer with all its details. Raises 404 if not found."""
+    try:
+        with db.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(
+                ORDER_HEADERS_SQL + " WHERE `o`.`OrderID` = %s AND `o`.`CustomerID` = %s",
+                (order_id, customer_id)
+            )
+            row = cursor.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail="Order not found")
+            orders_dict = {order_id: build_order_header(row, True)}
+            attach_order_details(orders_dict, cursor)
+        return orders_dict[order_id]
+
+    except HTTPException:
+        raise
+    except pymysql.Error as db_err:
+        logger.error(f"Database error fetching order {order_id} for CustomerID {customer_id}: {db_err}")
+        raise HTTPException(status_code=500, detail="Database error retrieving order.")
+    except Exception as e:
+        logger.exception(f"Unexpected error fetching order {order_id} for CustomerID {customer_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error retrieving order.")
@@ -0,0 +1,193 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import pymysql
+from loguru import logger
+from app.env import PENDING_ORDER_HOLD_MINUTES, PENDING_SWEEP_INTERVAL_SECONDS, PENDING_SWEEP_BATCH_SIZE
+from app.models.enums import BookingStatus, PaymentStatus
+from app.models.court_index import court_index
+from app.utils.cache import catalog_cache
+from app.models.payment_queue import payment_queue
+
+# Orders whose payment is still Pending after PENDING_ORDER_HOLD_MINUTES are
+# abandoned checkouts: their bookings stop blocking the court and their
+# equipment and food go back into stock. Enrollment orders are left alone, and
+# so are payments whose confirmation is waiting in the payment queue.
+# A confirmation that still arrives after expiry is reported by
+# confirm_payments as paid_after_expiry and recorded in PaymentReview.
+
+
+def _placeholders(values: List[Any]) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+def stale_payments_sql(excluded: int) -> str:
+    """Candidates via the (Status, Time) index, skipping `excluded` references."""
+    skip = f"AND p.Reference NOT IN ({', '.join(['%s'] * excluded)})" if excluded else ""
+    return f"""
+    SELECT p.PaymentID FROM Payment p
+    JOIN OrderTable o ON o.OrderID = p.OrderID
+    WHERE p.Status = %s AND p.Time < NOW() - INTERVAL %s MINUTE AND o.SessionID IS NULL {skip}
+    ORDER BY p.Time
+    LIMIT %s
+"""
+
+
+def release_item_stock(order_ids: List[int], table: str, item_table: str, id_column: str, cursor: pymysql.cursors.DictCursor) -> int:
+    """Give the quantities of the orders' Rent or OrderFood lines back to stock in one UPDATE."""
+    cursor.execute(
+        f"""
+        UPDATE {table} t
+        JOIN (
+            SELECT {id_column} AS ItemID, SUM(Quantity) AS Quantity FROM {item_table}
+            WHERE OrderID IN ({_placeholders(order_ids)})
+            GROUP BY {id_column}
+        ) r ON t.{id_column} = r.ItemID
+        SET t.Stock = t.Stock + r.Quantity
+        """,
+        order_ids
+    )
+    return cursor.rowcount
+
+
+def expire_pending_orders(
+    db: pymysql.connections.Connection,
+    hold_minutes: int = PENDING_ORDER_HOLD_MINUTES,
+    batch_size: int = PENDING_SWEEP_BATCH_SIZE,
+    exclude_references: Iterable[str] = ()
+) -> int:
+    """
+    Cancels up to `batch_size` orders whose payment has been Pending for longer
+    than `hold_minutes`: their payment and pending bookings become Cancel and
+    their items go back to stock, in one transaction. Payments whose Reference
+    is in `exclude_references` (confirmations still queued) are skipped.
+    Returns how many orders were expired.
+    """
+    excluded = list(exclude_references)
+    cancelled_bookings = []
+    with db.cursor() as cursor:
+        try:
+            # Candidates via the (Status, Time) index, then locked by primary key and
+            # re-checked, like confirm_payments does, so a payment being confirmed
+            # right now is either confirmed or expired, never both
+            cursor.execute(stale_payments_sql(len(excluded)), [PaymentStatus.PENDING.value, hold_minutes] + excluded + [batch_size])
+            candidate_ids = [row['PaymentID'] for row in cursor.fetchall()]
+            if not candidate_ids:
+                db.commit()
+                return 0
+            cursor.execute(
+                f"SELECT PaymentID, OrderID FROM Payment WHERE PaymentID IN ({_placeholders(candidate_ids)}) AND Status = %s FOR UPDATE",
+                candidate_ids + [PaymentStatus.PENDING.value]
+            )
+            stale = cursor.fetchall()
+            if not stale:
+                db.commit()
+                return 0
+            payment_ids = [row['PaymentID'] for row in stale]
+            order_ids = list({row['OrderID'] for row in stale})
+
+            cursor.execute(
+                f"UPDATE Payment SET Status = %s WHERE PaymentID IN ({_placeholders(payment_ids)})",
+                [PaymentStatus.CANCEL.value] + payment_ids
+            )
+            cursor.execute(
+                f"SELECT BookingID, CourtID, StartTime, Endtime, OrderID FROM Booking WHERE OrderID IN ({_placeholders(order_ids)}) AND Status = %s",
+                order_ids + [BookingStatus.PENDING.value]
+            )
+            cancelled_bookings = cursor.fetchall()
+            cursor.execute(
+                f"UPDATE Booking SET Status = %s WHERE OrderID IN ({_placeholders(order_ids)}) AND Status = %s",
+                [BookingStatus.CANCEL.value] + order_ids + [BookingStatus.PENDING.value]
+            )
+            equipment_released = release_item_stock(order_ids, 'Equipment', 'Rent', 'EquipmentID', cursor)
+            food_released = release_item_stock(order_ids, 'CafeteriaFood', 'OrderFood', 'FoodID', cursor)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    for booking in cancelled_bookings:
+        court_index.add_booking(
+            booking['BookingID'],
+            booking['CourtID'],
+            booking['StartTime'],
+            booking['Endtime'],
+            BookingStatus.CANCEL.value,
+            booking['OrderID']
+        )
+    if equipment_released or food_released:
+        # Stock shown in the public catalog changed
+        catalog_cache.invalidate("equipment", "food")
+    logger.info(
+        f"Expired {len(order_ids)} pending order(s) older than {hold_minutes} minutes: "
+        f"{len(cancelled_bookings)} booking(s) cancelled, stock released for {equipment_released} equipment and {food_released} food item(s)"
+    )
+    return len(order_ids)
+
+
+class PendingOrderSweeper:
+    """Runs expire_pending_orders every `interval` seconds in a daemon thread."""
+
+    def __init__(self, interval: float, hold_minutes: int, batch_size: int):
+        self.interval = interval
+        self.hold_minutes = hold_minutes
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.expired = 0
+        self.runs = 0
+        self.queued_at_last_sweep = 0
+
+    def sweep(self) -> int:
+        """Expire stale orders batch by batch until none are left."""
+        from app.database import db_pool # Imported here to keep the models importable without a pool
+        # Read before the database: a confirmation queued after this is handled by
+        # confirm_payments as paid_after_expiry
+        queued = payment_queue.queued_descriptions()
+        self.queued_at_last_sweep = len(queued)
+        total = 0
+        with db_pool.connection() as db:
+            while not self._stop.is_set():
+                expired = expire_pending_orders(db, self.hold_minutes, self.batch_size, queued)
+                total += expired
+                if expired < self.batch_size:
+                    break
+        self.expired += total
+        self.runs += 1
+        return total
+
+    def _run(self):
+        from app.database import PoolTimeoutError
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except (PoolTimeoutError, pymysql.Error, OSError) as e:
+                logger.error(f"Pending order sweep failed, will retry next interval: {e}")
+            except Exception as e:
+                logger.exception(f"Unexpected error sweeping pending orders: {e}")
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pending-order-sweeper", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval,
+            "hold_minutes": self.hold_minutes,
+            "runs": self.runs,
+            "expired_orders": self.expired,
+            "queued_confirmations": self.queued_at_last_sweep,
+            "running": self._thread is not None,
+        }
+
+
+pending_order_sweeper = PendingOrderSweeper(PENDING_SWEEP_INTERVAL_SECONDS, PENDING_ORDER_HOLD_MINUTES, PENDING_SWEEP_BATCH_SIZE)
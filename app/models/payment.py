@@ -0,0 +1,125 @@
+import pymysql
+from fastapi import HTTPException
+from loguru import logger
+from typing import List, Dict, Any
+
+from app.models.enums import PaymentStatus, BookingStatus
+from app.models.court_index import court_index
+
+# Per-description outcomes of confirm_payments
+CONFIRMED = "confirmed"
+ALREADY_PROCESSED = "already_processed"
+NOT_FOUND = "not_found"
+# The payment was cancelled by the pending-order sweeper before its confirmation
+# arrived: the customer paid for an order whose courts and items were released.
+# It stays cancelled and is recorded in PaymentReview for a refund or manual fix.
+PAID_AFTER_EXPIRY = "paid_after_expiry"
+
+
+def _placeholders(values: List[Any]) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+def confirm_payments(descriptions: List[str], db: pymysql.connections.Connection) -> List[Dict[str, Any]]:
+    """
+    Marks the pending payments with the given descriptions (their Reference) as
+    successful and their pending bookings as successful, in one transaction with
+    set-based statements, however many descriptions there are.
+
+    Returns one result per distinct description, in request order:
+    {"description", "result": confirmed | already_processed | not_found |
+     paid_after_expiry, "payment_id", "order_id", "status"}, status being the
+    payment's current status when it is known. Confirmations of cancelled
+    payments are recorded in PaymentReview in the same transaction.
+    """
+    references = list(dict.fromkeys(descriptions))
+    if not references:
+        return []
+    try:
+        with db.cursor() as cursor:
+            try:
+                cursor.execute(
+                    f"SELECT PaymentID, OrderID, Status, Reference FROM Payment WHERE Reference IN ({_placeholders(references)})",
+                    references
+                )
+                payments = {row['Reference'].lower(): row for row in cursor.fetchall()} # Reference compares case-insensitively
+
+                # Lock the pending ones by primary key; a concurrent confirmation or the
+                # expiry sweeper changing the same payment waits here, or has already
+                # changed it and the locked read sees its new status
+                pending_ids = [row['PaymentID'] for row in payments.values() if row['Status'] == PaymentStatus.PENDING.value]
+                confirmed: Dict[int, int] = {} # PaymentID -> OrderID
+                confirmed_bookings = []
+                if pending_ids:
+                    cursor.execute(
+                        f"SELECT PaymentID, OrderID, Status FROM Payment WHERE PaymentID IN ({_placeholders(pending_ids)}) FOR UPDATE",
+                        pending_ids
+                    )
+                    current = {row['PaymentID']: row['Status'] for row in cursor.fetchall()}
+                    for payment in payments.values():
+                        if payment['PaymentID'] in current:
+                            payment['Status'] = current[payment['PaymentID']]
+                            if payment['Status'] == PaymentStatus.PENDING.value:
+                                confirmed[payment['PaymentID']] = payment['OrderID']
+
+                if confirmed:
+                    payment_ids = list(confirmed)
+                    cursor.execute(
+                        f"UPDATE Payment SET Status = %s WHERE PaymentID IN ({_placeholders(payment_ids)})",
+                        [PaymentStatus.SUCCESS.value] + payment_ids
+                    )
+                    order_ids = list(set(confirmed.values()))
+                    cursor.execute(
+                        f"SELECT BookingID, CourtID, StartTime, Endtime, OrderID FROM Booking WHERE OrderID IN ({_placeholders(order_ids)}) AND Status = %s",
+                        order_ids + [BookingStatus.PENDING.value]
+                    )
+                    confirmed_bookings = cursor.fetchall()
+                    cursor.execute(
+                        f"UPDATE Booking SET Status = %s WHERE OrderID IN ({_placeholders(order_ids)}) AND Status = %s",
+                        [BookingStatus.SUCCESS.value] + order_ids + [BookingStatus.PENDING.value]
+                    )
+                    logger.info(f"Confirmed {len(payment_ids)} payment(s) and {cursor.rowcount} booking(s) for {len(order_ids)} order(s)")
+
+                # Only the pending-order sweeper cancels payments; these were paid too late
+                paid_after_expiry = [row for row in payments.values() if row['Status'] == PaymentStatus.CANCEL.value]
+                if paid_after_expiry:
+                    cursor.executemany(
+                        "INSERT IGNORE INTO PaymentReview (PaymentID, OrderID, Reason, CreatedAt) VALUES (%s, %s, %s, NOW())",
+                        [(row['PaymentID'], row['OrderID'], PAID_AFTER_EXPIRY) for row in paid_after_expiry]
+                    )
+                    logger.error(
+                        f"Received payment for {len(paid_after_expiry)} order(s) already cancelled as unpaid, recorded in PaymentReview "
+                        f"for refund: PaymentIDs {[row['PaymentID'] for row in paid_after_expiry]}"
+                    )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+
+        for booking in confirmed_bookings:
+            court_index.add_booking(
+                booking['BookingID'],
+                booking['CourtID'],
+                booking['StartTime'],
+                booking['Endtime'],
+                BookingStatus.SUCCESS.value,
+                booking['OrderID']
+            )
+
+        results = []
+        for reference in references:
+            payment = payments.get(reference.lower())
+            if payment is None:
+                results.append({"description": reference, "result": NOT_FOUND, "payment_id": None, "order_id": None, "status": None})
+            elif payment['PaymentID'] in confirmed:
+                results.append({"description": reference, "result": CONFIRMED, "payment_id": payment['PaymentID'], "order_id": payment['OrderID'], "status": PaymentStatus.SUCCESS.value})
+            elif payment['Status'] == PaymentStatus.CANCEL.value:
+                results.append({"description": reference, "result": PAID_AFTER_EXPIRY, "payment_id": payment['PaymentID'], "order_id": payment['OrderID'], "status": payment['Status']})
+            else:
+                # Already confirmed, possibly by a concurrent request between the two SELECTs
+                results.append({"description": reference, "result": ALREADY_PROCESSED, "payment_id": payment['PaymentID'], "order_id": payment['OrderID'], "status": payment['Status']})
+        return results
+
+    except pymysql.Error as db_err:
+        logger.error(f"Database error confirming {len(references)} payment(s): {db_err}")
+        raise HTTPException(status_code=500, detail="Database error during confirmation.")
@@ -0,0 +1,299 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+import pymysql
+from fastapi import HTTPException
+from loguru import logger
+from app.env import (
+    PAYMENT_QUEUE_DIR,
+    PAYMENT_QUEUE_BATCH_SIZE,
+    PAYMENT_QUEUE_POLL_SECONDS,
+    PAYMENT_QUEUE_RETRY_BASE_SECONDS,
+    PAYMENT_QUEUE_RETRY_MAX_SECONDS,
+    PAYMENT_QUEUE_MAX_ATTEMPTS,
+)
+from app.models.payment import confirm_payments, NOT_FOUND, PAID_AFTER_EXPIRY
+
+# Files in the queue directory:
+#   pending.log        notifications appended by the webhook, one JSON line each
+#   inflight-*.log     pending.log files taken by the worker, deleted once handled
+#   retry.json         notifications waiting for a retry, with attempt counts
+#   dead.log           notifications given up after PAYMENT_QUEUE_MAX_ATTEMPTS
+#   queue.lock         held while appending to or taking pending.log
+#   worker.lock        held by the process draining the queue (one at a time)
+# A notification is only removed from disk after confirm_payments has handled
+# it, or after it has been written to retry.json/dead.log. A crash can make a
+# notification run twice, which confirm_payments reports as already processed.
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True):
+    """Exclusive flock on `path`, shared by all processes using the directory."""
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_durably(path: str, content: str):
+    """Replace `path` with `content` atomically (write, fsync, rename)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class PaymentWebhookQueue:
+    """
+    Durable local queue of payment confirmations.
+
+    `enqueue()` appends a notification to pending.log and fsyncs it, without
+    touching the database, so the webhook can answer 202 right away. A worker
+    thread drains the queue every `poll_seconds` (or as soon as something is
+    enqueued in this process). Notifications are deduplicated on description and
+    confirmed PAYMENT_QUEUE_BATCH_SIZE at a time with confirm_payments. Batches
+    that fail on the database are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        batch_size: int = 200,
+        poll_seconds: float = 1,
+        retry_base_seconds: float = 2,
+        retry_max_seconds: float = 300,
+        max_attempts: int = 10
+    ):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._counters = {"enqueued": 0, "confirmed": 0, "already_processed": 0, "not_found": 0, PAID_AFTER_EXPIRY: 0, "retried": 0, "dead": 0}
+        self._waiting = 0
+        self._last_error: Optional[str] = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    # --- Producer side ---
+
+    def enqueue(self, description: str):
+        """Durably record a payment notification. Raises OSError if it could not be written."""
+        line = json.dumps({"description": description, "received_at": datetime.utcnow().isoformat()}) + "\n"
+        with self._lock, _file_lock(self._path("queue.lock")):
+            with open(self._path("pending.log"), "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._counters["enqueued"] += 1
+        self._wake.set()
+
+    def queued_descriptions(self) -> Set[str]:
+        """
+        Descriptions still waiting to be confirmed: pending, in flight or due for a
+        retry. Their payments were reported as paid, so the pending-order sweeper
+        must not expire them.
+        """
+        if not os.path.isdir(self.directory):
+            return set()
+        descriptions: Set[str] = set()
+        with _file_lock(self._path("queue.lock")):
+            # Log files before retry.json: the worker rewrites retry.json before it
+            # deletes an in-flight file, so a notification is seen in one or the other
+            names = sorted(name for name in os.listdir(self.directory) if name.startswith("inflight-") and name.endswith(".log"))
+            for name in names + ["pending.log"]:
+                descriptions.update(self._read_descriptions(self._path(name)))
+        try:
+            with open(self._path("retry.json")) as f:
+                descriptions.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        return descriptions
+
+    @staticmethod
+    def _read_descriptions(path: str) -> List[str]:
+        try:
+            with open(path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            # Taken or handled by the worker in the meantime
+            return []
+        descriptions = []
+        for line in lines:
+            try:
+                descriptions.append(json.loads(line)["description"])
+            except (ValueError, KeyError):
+                continue
+        return descriptions
+
+    # --- Worker side ---
+
+    def _take_pending(self) -> List[str]:
+        """Move pending.log aside so new notifications go to a fresh file; returns all in-flight files."""
+        with _file_lock(self._path("queue.lock")):
+            pending = self._path("pending.log")
+            if os.path.exists(pending) and os.path.getsize(pending) > 0:
+                os.replace(pending, self._path(f"inflight-{time.time_ns()}.log"))
+        return sorted(
+            self._path(name) for name in os.listdir(self.directory)
+            if name.startswith("inflight-") and name.endswith(".log")
+        )
+
+    def _load(self, inflight: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Queued notifications by description: retry.json first, then the in-flight files."""
+        items: Dict[str, Dict[str, Any]] = {}
+        retry_path = self._path("retry.json")
+        if os.path.exists(retry_path):
+            with open(retry_path) as f:
+                items.update(json.load(f))
+        for path in inflight:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        notification = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append
+                        logger.warning(f"Skipping unreadable line in {path}: {line!r}")
+                        continue
+                    items.setdefault(notification["description"], {
+                        "received_at": notification["received_at"],
+                        "attempts": 0,
+                        "next_attempt": 0,
+                    })
+        return items
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+
+    def drain(self) -> int:
+        """
+        Confirm the due notifications; returns how many were handled. Only one
+        process drains a directory at a time; others return 0 immediately.
+        """
+        from app.database import db_pool, PoolTimeoutError # Imported here to keep the models importable without a pool
+        with _file_lock(self._path("worker.lock"), blocking=False) as locked:
+            if not locked:
+                return 0
+            inflight = self._take_pending()
+            items = self._load(inflight)
+            if not items:
+                for path in inflight:
+                    os.remove(path)
+                return 0
+
+            now = time.time()
+            due = [description for description, item in items.items() if item["next_attempt"] <= now]
+            if not due and not inflight:
+                return 0
+            handled = 0
+            for start in range(0, len(due), self.batch_size):
+                batch = due[start:start + self.batch_size]
+                try:
+                    with db_pool.connection() as db:
+                        results = confirm_payments(batch, db)
+                except (HTTPException, PoolTimeoutError, pymysql.Error, OSError) as e:
+                    self._last_error = str(getattr(e, "detail", e))
+                    logger.error(f"Payment queue batch of {len(batch)} failed, will retry: {self._last_error}")
+                    dead = []
+                    for description in batch:
+                        item = items[description]
+                        item["attempts"] += 1
+                        if item["attempts"] >= self.max_attempts:
+                            dead.append(description)
+                        else:
+                            item["next_attempt"] = now + self._backoff(item["attempts"])
+                            self._counters["retried"] += 1
+                    self._bury(dead, items)
+                    continue
+                for result in results:
+                    self._counters[result["result"]] += 1
+                    if result["result"] == NOT_FOUND:
+                        logger.warning(f"Queued payment confirmation for unknown description: {result['description']}")
+                    elif result["result"] == PAID_AFTER_EXPIRY:
+                        logger.error(f"Queued payment {result['payment_id']} arrived after order {result['order_id']} expired; recorded in PaymentReview")
+                    del items[result["description"]]
+                handled += len(results)
+
+            # Persist what is left before forgetting the in-flight files
+            _write_durably(self._path("retry.json"), json.dumps(items))
+            for path in inflight:
+                os.remove(path)
+            self._waiting = len(items)
+            return handled
+
+    def _bury(self, descriptions: List[str], items: Dict[str, Dict[str, Any]]):
+        if not descriptions:
+            return
+        with open(self._path("dead.log"), "a") as f:
+            for description in descriptions:
+                f.write(json.dumps({"description": description, **items.pop(description)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._counters["dead"] += len(descriptions)
+        logger.error(f"Gave up on {len(descriptions)} payment confirmation(s) after {self.max_attempts} attempts; see {self._path('dead.log')}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                logger.exception(f"Unexpected error draining payment queue: {e}")
+
+    def start(self):
+        """Create the queue directory and start the worker thread (drains leftovers first)."""
+        if self._worker is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._wake.set()
+        self._worker = threading.Thread(target=self._run, name="payment-queue", daemon=True)
+        self._worker.start()
+
+    def shutdown(self):
+        """Stop the worker; anything still queued stays on disk for the next start."""
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=10)
+            self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                "waiting_retry": self._waiting,
+                "last_error": self._last_error,
+                "running": self._worker is not None,
+            }
+
+
+payment_queue = PaymentWebhookQueue(
+    PAYMENT_QUEUE_DIR,
+    batch_size=PAYMENT_QUEUE_BATCH_SIZE,
+    poll_seconds=PAYMENT_QUEUE_POLL_SECONDS,
+    retry_base_seconds=PAYMENT_QUEUE_RETRY_BASE_SECONDS,
+    retry_max_seconds=PAYMENT_QUEUE_RETRY_MAX_SECONDS,
+    max_attempts=PAYMENT_QUEUE_MAX_ATTEMPTS,
+)
@@ -0,0 +1,132 @@
+import aiomysql
+import time
+from datetime import datetime
+from fastapi import HTTPException
+from loguru import logger
+
+# Refresh tokens are JWTs whose `jti` is the RefreshToken.TokenID.
+# All times are stored and compared in UTC.
+# Rows are deleted once expired: an expired token is rejected by its JWT `exp`
+# before the table is consulted. Revoked rows are kept until then, so reuse of
+# a rotated token is still detected for as long as it could be presented.
+
+SWEEP_INTERVAL_SECONDS = 300
+SWEEP_BATCH_SIZE = 1000
+SWEEP_MAX_BATCHES = 10
+
+_last_sweep = 0.0
+
+
+async def sweep_expired_refresh_tokens_async(db: aiomysql.Connection):
+    """
+    Delete expired rows in batches of SWEEP_BATCH_SIZE, at most once every
+    SWEEP_INTERVAL_SECONDS per process. Called after tokens are issued, so the
+    table stays at about the tokens issued within REFRESH_TOKEN_EXPIRE_MINUTES.
+    """
+    global _last_sweep
+    if time.monotonic() - _last_sweep < SWEEP_INTERVAL_SECONDS:
+        return
+    _last_sweep = time.monotonic()
+    deleted = 0
+    try:
+        async with db.cursor() as cursor:
+            for _ in range(SWEEP_MAX_BATCHES):
+                await cursor.execute(
+                    "DELETE FROM RefreshToken WHERE ExpiresAt < UTC_TIMESTAMP() LIMIT %s",
+                    (SWEEP_BATCH_SIZE,)
+                )
+                deleted += cursor.rowcount
+                if cursor.rowcount < SWEEP_BATCH_SIZE:
+                    break
+        if deleted:
+            logger.info(f"Swept {deleted} expired refresh tokens.")
+    except aiomysql.Error as db_err:
+        logger.error(f"Database error sweeping refresh tokens: {db_err}")
+
+
+async def store_refresh_token_async(token_id: str, username: str, expires_at: datetime, db: aiomysql.Connection):
+    """
+    Record a newly issued refresh token.
+    """
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "INSERT INTO RefreshToken (TokenID, Username, ExpiresAt) VALUES (%s, %s, %s)",
+                (token_id, username, expires_at)
+            )
+    except aiomysql.Error as db_err:
+        logger.error(f"Database error storing refresh token for '{username}': {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
+    await sweep_expired_refresh_tokens_async(db)
+
+
+async def rotate_refresh_token_async(
+    token_id: str,
+    username: str,
+    new_token_id: str,
+    new_expires_at: datetime,
+    db: aiomysql.Connection
+) -> bool:
+    """
+    Atomically revoke refresh token `token_id` and record `new_token_id` as its replacement.
+    Returns False if the token is unknown, expired or already revoked. A revoked token
+    being presented again means it was leaked (or replayed), so every refresh token
+    of that user is revoked as well.
+    """
+    try:
+        await db.begin()
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                """
+                UPDATE RefreshToken
+                SET RevokedAt = UTC_TIMESTAMP(), ReplacedBy = %s
+                WHERE TokenID = %s AND Username = %s
+                AND RevokedAt IS NULL AND ExpiresAt > UTC_TIMESTAMP()
+                """,
+                (new_token_id, token_id, username)
+            )
+            if cursor.rowcount != 1:
+                await cursor.execute(
+                    "SELECT RevokedAt FROM RefreshToken WHERE TokenID = %s AND Username = %s",
+                    (token_id, username)
+                )
+                existing = await cursor.fetchone()
+                if existing and existing['RevokedAt'] is not None:
+                    logger.warning(f"Reuse of revoked refresh token for '{username}', revoking all of the user's refresh tokens.")
+                    await cursor.execute(
+                        "UPDATE RefreshToken SET RevokedAt = UTC_TIMESTAMP() WHERE Username = %s AND RevokedAt IS NULL",
+                        (username,)
+                    )
+                await db.commit()
+                return False
+
+            await cursor.execute(
+                "INSERT INTO RefreshToken (TokenID, Username, ExpiresAt) VALUES (%s, %s, %s)",
+                (new_token_id, username, new_expires_at)
+            )
+        await db.commit()
+    except aiomysql.Error as db_err:
+        await db.rollback()
+        logger.error(f"Database error rotating refresh token for '{username}': {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
+    except Exception as e:
+        await db.rollback()
+        logger.exception(f"Unexpected error rotating refresh token for '{username}': {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    await sweep_expired_refresh_tokens_async(db)
+    return True
+
+
+async def revoke_refresh_token_async(token_id: str, username: str, db: aiomysql.Connection):
+    """
+    Revoke a single refresh token (logout). Revoking an unknown or revoked token is a no-op.
+    """
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "UPDATE RefreshToken SET RevokedAt = UTC_TIMESTAMP() WHERE TokenID = %s AND Username = %s AND RevokedAt IS NULL",
+                (token_id, username)
+            )
+    except aiomysql.Error as db_err:
+        logger.error(f"Database error revoking refresh token for '{username}': {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
@@ -1,8 +1,20 @@
+import aiomysql
 import pymysql
 from fastapi import HTTPException
 from typing import List, Dict, Any
 from app.models.enums import TrainingSessionType # Keep if needed, based on dump.sql
 from loguru import logger # Import loguru
+from app.utils.cache import catalog_cache, CATALOG_TTL_SECONDS, MISSING
+from app.models.court_index import court_index
+
+TRAINING_SESSION_SELECT_SQL = """
+    SELECT ts.SessionID, ts.StartDate, ts.EndDate, ts.CoachID, ts.CourtID,
+           ts.Schedule, ts.Type, ts.Price, ts.Max_Students, ts.Status, ts.Rating,
+           s.Name as CoachName, c.url as coach_image_url
+    FROM Training_Session ts
+    JOIN Coach c ON ts.CoachID = c.StaffID
+    JOIN Staff s ON c.StaffID = s.StaffID
+"""
 
 def get_all_training_sessions(db: pymysql.connections.Connection) -> List[Dict[str, Any]]:
     """
@@ -10,16 +22,7 @@ def get_all_training_sessions(db: pymysql.connections.Connection) -> List[Dict[s
     """
     try:
         with db.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT ts.SessionID, ts.StartDate, ts.EndDate, ts.CoachID, ts.CourtID,
-                       ts.Schedule, ts.Type, ts.Price, ts.Max_Students, ts.Status, ts.Rating,
-                       s.Name as CoachName, c.url as coach_image_url
-                FROM Training_Session ts
-                JOIN Coach c ON ts.CoachID = c.StaffID
-                JOIN Staff s ON c.StaffID = s.StaffID
-                """
-            )
+            cursor.execute(TRAINING_SESSION_SELECT_SQL)
             sessions = cursor.fetchall()
             if not sessions:
                 logger.info("No training sessions found in the database.")
@@ -42,18 +45,7 @@ def get_training_session_by_id(session_id: int, db: pymysql.connections.Connecti
     session = None # Initialize session to None
     try:
         with db.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT ts.SessionID, ts.StartDate, ts.EndDate, ts.CoachID, ts.CourtID,
-                       ts.Schedule, ts.Type, ts.Price, ts.Max_Students, ts.Status, ts.Rating,
-                       s.Name as CoachName, c.url as coach_image_url
-                FROM Training_Session ts
-                JOIN Coach c ON ts.CoachID = c.StaffID
-                JOIN Staff s ON c.StaffID = s.StaffID
-                WHERE ts.SessionID = %s
-                """,
-                (session_id,)
-            )
+            cursor.execute(TRAINING_SESSION_SELECT_SQL + " WHERE ts.SessionID = %s", (session_id,))
             session = cursor.fetchone()
     except pymysql.Error as db_err:
         logger.error(f"Database error fetching training session ID {session_id}: {db_err}")
@@ -80,18 +72,7 @@ def get_training_sessions_by_coach(coach_id: int, db: pymysql.connections.Connec
 
     try:
         with db.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT ts.SessionID, ts.StartDate, ts.EndDate, ts.CoachID, ts.CourtID,
-                       ts.Schedule, ts.Type, ts.Price, ts.Max_Students, ts.Status, ts.Rating,
-                       s.Name as CoachName, c.url as coach_image_url
-                FROM Training_Session ts
-                JOIN Coach c ON ts.CoachID = c.StaffID
-                JOIN Staff s ON c.StaffID = s.StaffID
-                WHERE ts.CoachID = %s
-                """,
-                (coach_id,)
-            )
+            cursor.execute(TRAINING_SESSION_SELECT_SQL + " WHERE ts.CoachID = %s", (coach_id,))
             sessions = cursor.fetchall()
             if not sessions:
                  logger.info(f"No training sessions found for coach ID {coach_id}.")
@@ -137,6 +118,90 @@ def get_training_sessions_by_customer_id(customer_id: int, db: pymysql.connectio
     except Exception as e:
         logger.exception(f"Unexpected error fetching enrolled training sessions for customer ID {customer_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+async def get_all_training_sessions_async(db: aiomysql.Connection) -> List[Dict[str, Any]]:
+    """
+    Async version of get_all_training_sessions, served from the catalog cache when possible.
+    """
+    cache_key = ("training_session",)
+    cached = catalog_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    generation = catalog_cache.generation("training_session")
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute(TRAINING_SESSION_SELECT_SQL)
+            sessions = await cursor.fetchall()
+            if not sessions:
+                logger.info("No training sessions found in the database.")
+            catalog_cache.set(cache_key, sessions, CATALOG_TTL_SECONDS["training_session"], generation)
+            return sessions
+    except aiomysql.Error as db_err:
+        logger.error(f"Database error fetching all training sessions: {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
+    except Exception as e:
+        logger.exception(f"Unexpected error fetching all training sessions: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+async def get_training_session_by_id_async(session_id: int, db: aiomysql.Connection) -> Dict[str, Any]:
+    """
+    Async version of get_training_session_by_id, served from the catalog cache when possible.
+    """
+    if session_id <= 0:
+        logger.warning(f"Attempted to fetch training session with invalid ID: {session_id}")
+        raise HTTPException(status_code=400, detail="Invalid Session ID provided.")
+    cache_key = ("training_session", session_id)
+    cached = catalog_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    generation = catalog_cache.generation("training_session")
+
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute(TRAINING_SESSION_SELECT_SQL + " WHERE ts.SessionID = %s", (session_id,))
+            session = await cursor.fetchone()
+    except aiomysql.Error as db_err:
+        logger.error(f"Database error fetching training session ID {session_id}: {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
+    except Exception as e:
+        logger.exception(f"Unexpected error fetching training session ID {session_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    if not session:
+        logger.warning(f"Training session with ID {session_id} not found.")
+        raise HTTPException(status_code=404, detail=f"Training session with ID {session_id} not found")
+
+    catalog_cache.set(cache_key, session, CATALOG_TTL_SECONDS["training_session"], generation)
+    return session
+
+async def get_training_sessions_by_coach_async(coach_id: int, db: aiomysql.Connection) -> List[Dict[str, Any]]:
+    """
+    Async version of get_training_sessions_by_coach, served from the catalog cache when possible.
+    """
+    if coach_id <= 0:
+        logger.warning(f"Attempted to fetch training sessions for invalid coach ID: {coach_id}")
+        raise HTTPException(status_code=400, detail="Invalid Coach ID provided.")
+    cache_key = ("training_session", "coach", coach_id)
+    cached = catalog_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    generation = catalog_cache.generation("training_session")
+
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute(TRAINING_SESSION_SELECT_SQL + " WHERE ts.CoachID = %s", (coach_id,))
+            sessions = await cursor.fetchall()
+            if not sessions:
+                 logger.info(f"No training sessions found for coach ID {coach_id}.")
+            catalog_cache.set(cache_key, sessions, CATALOG_TTL_SECONDS["training_session"], generation)
+            return sessions
+    except aiomysql.Error as db_err:
+        logger.error(f"Database error fetching training sessions for coach ID {coach_id}: {db_err}")
+        raise HTTPException(status_code=500, detail="Database error")
+    except Exception as e:
+        logger.exception(f"Unexpected error fetching training sessions for coach ID {coach_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
     
 # --- Admin Specific Functions ---
 
@@ -150,6 +215,7 @@ def create_training_session_admin(session_data, db: pymysql.connections.Connecti
     if session_data.EndDate <= session_data.StartDate:
         raise HTTPException(status_code=400, detail="EndDate must be after StartDate")
 
+    schedule_params = []
     try:
         # --- Start Transaction ---
         db.begin()
@@ -223,6 +289,8 @@ def create_training_session_admin(session_data, db: pymysql.connections.Connecti
 
             # --- Commit Transaction ---
             db.commit()
+            catalog_cache.invalidate("training_session")
+            court_index.replace_session_schedule(new_session_id, [(court_id, start, end) for _, court_id, start, end in schedule_params])
             logger.info(f"Admin created Training Session ID: {new_session_id} and associated schedule slots.")
             
             # Fetch and return the created session details using the new ID
@@ -415,6 +483,8 @@ def update_training_session_admin(session_id: int, update_data, db: pymysql.conn
     if updates:
         params.append(session_id)
 
+    replaced_slots = None # (CourtID, StartTime, EndTime) of the new schedule, if it is replaced
+    previous_slots = []
     try:
         db.begin()
         with db.cursor() as cursor:
@@ -424,9 +494,12 @@ def update_training_session_admin(session_id: int, update_data, db: pymysql.conn
                 new_slots_objects = update_data.schedule_slots # These are ScheduleSlot OBJECTS
 
                 # Delete existing slots
+                cursor.execute("SELECT CourtID, StartTime, EndTime FROM TrainingSchedule WHERE SessionID = %s", (session_id,))
+                previous_slots = [(row['CourtID'], row['StartTime'], row['EndTime']) for row in cursor.fetchall()]
                 delete_schedule_sql = "DELETE FROM TrainingSchedule WHERE SessionID = %s"
                 cursor.execute(delete_schedule_sql, (session_id,))
                 logger.info(f"Deleted existing schedule slots for SessionID {session_id} before update.")
+                replaced_slots = []
 
                 # Insert new slots if the list is not empty
                 if new_slots_objects: # Check if the list has items
@@ -461,6 +534,7 @@ def update_training_session_admin(session_id: int, update_data, db: pymysql.conn
                     if schedule_params:
                         cursor.executemany(schedule_sql, schedule_params)
                         logger.info(f"Inserted {len(schedule_params)} new schedule slots for SessionID {session_id}")
+                        replaced_slots = [(court_id, start, end) for _, court_id, start, end in schedule_params]
 
             # 2. Update Training_Session table (if other fields were provided)
             if updates: # Only run update if there are fields for the main table
@@ -491,6 +565,9 @@ def update_training_session_admin(session_id: int, update_data, db: pymysql.conn
 
             # --- Commit Transaction ---
             db.commit()
+            catalog_cache.invalidate("training_session")
+            if replaced_slots is not None:
+                court_index.replace_session_schedule(session_id, replaced_slots, previous_slots)
             logger.info(f"Admin: Update transaction committed for session ID {session_id}.")
 
             return get_training_session_by_id_admin(session_id, db)
@@ -523,6 +600,8 @@ def delete_training_session_admin(session_id: int, db: pymysql.connections.Conne
         db.begin()
         with db.cursor() as cursor:
             # 1. Delete from TrainingSchedule first (FK dependency)
+            cursor.execute("SELECT CourtID, StartTime, EndTime FROM TrainingSchedule WHERE SessionID = %s", (session_id,))
+            previous_slots = [(row['CourtID'], row['StartTime'], row['EndTime']) for row in cursor.fetchall()]
             schedule_delete_sql = "DELETE FROM TrainingSchedule WHERE SessionID = %s"
             cursor.execute(schedule_delete_sql, (session_id,))
             deleted_schedules = cursor.rowcount
@@ -568,6 +647,8 @@ def delete_training_session_admin(session_id: int, db: pymysql.connections.Conne
 
                 # --- Commit Transaction ---
                 db.commit()
+                catalog_cache.invalidate("training_session")
+                court_index.remove_session_schedule(session_id, previous_slots)
                 logger.info(f"Admin: Successfully deleted session ID {session_id} and associated schedule slots.")
                 # No body needed for 204 response in the router
 
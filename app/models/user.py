@@ -1,9 +1,11 @@
+import aiomysql
 import pymysql
 from fastapi import HTTPException
 from app.database import get_db
 from datetime import datetime
 from app.models.enums import UserType
 from loguru import logger # Import loguru
+from app.utils.cache import catalog_cache, principal_cache
 
 
 # Database operations for User model using raw SQL
@@ -15,6 +17,51 @@ def get_user_by_username(username: str, db: pymysql.connections.Connection):
         cursor.execute("SELECT * FROM User WHERE Username = %s", (username,))
         return cursor.fetchone()
 
+PRINCIPAL_SELECT_SQL = """
+    SELECT u.Username, u.Phone, u.UserType, u.JoinDate, u.ClaimsVersion, c.CustomerID, s.StaffID
+    FROM User u
+    LEFT JOIN Customer c ON c.Username = u.Username
+    LEFT JOIN Staff s ON s.Username = u.Username
+    WHERE u.Username = %s
+    LIMIT 1
+"""
+
+def get_principal_by_username(username: str, db: pymysql.connections.Connection):
+    """
+    Fetch the authenticated-user view of a user: the User row without the
+    password hash, plus the matching CustomerID / StaffID (None if absent).
+    """
+    with db.cursor() as cursor:
+        cursor.execute(PRINCIPAL_SELECT_SQL, (username,))
+        return cursor.fetchone()
+
+async def get_principal_by_username_async(username: str, db: aiomysql.Connection):
+    """
+    Async version of get_principal_by_username.
+    """
+    async with db.cursor() as cursor:
+        await cursor.execute(PRINCIPAL_SELECT_SQL, (username,))
+        return await cursor.fetchone()
+
+async def get_user_by_username_async(username: str, db: aiomysql.Connection):
+    """
+    Async version of get_user_by_username, also returning the CustomerID / StaffID
+    that login embeds in the access token.
+    """
+    async with db.cursor() as cursor:
+        await cursor.execute(
+            """
+            SELECT u.*, c.CustomerID, s.StaffID
+            FROM User u
+            LEFT JOIN Customer c ON c.Username = u.Username
+            LEFT JOIN Staff s ON s.Username = u.Username
+            WHERE u.Username = %s
+            LIMIT 1
+            """,
+            (username,)
+        )
+        return await cursor.fetchone()
+
 def register_user(username: str, hashed_password: str, phone: str, user_type: str, name: str, db: pymysql.connections.Connection):
     """
     Register a new user and associated customer/staff data.
@@ -330,6 +377,8 @@ def update_user_admin(username: str, db: pymysql.connections.Connection, update_
 
             # Commit changes
             db.commit()
+            principal_cache.invalidate(username)
+            catalog_cache.invalidate("coach", "training_session")
             logger.info(f"Successfully updated user '{username}'.")
 
             # Fetch and return updated details
@@ -401,6 +450,8 @@ def delete_user_admin(username: str, db: pymysql.connections.Connection):
 
             # 4. Commit transaction
             db.commit()
+            principal_cache.invalidate(username)
+            catalog_cache.invalidate("coach", "training_session")
             logger.info(f"Successfully deleted user '{username}'.")
             return {"message": f"User '{username}' deleted successfully."}
 
@@ -469,8 +520,9 @@ def promote_customer_to_staff_admin(username: str, db: pymysql.connections.Conne
 
             # 5. Update User table UserType
             logger.debug(f"Updating UserType to Staff for '{username}'")
+            # Bumping ClaimsVersion invalidates access tokens issued with the Customer role
             cursor.execute(
-                "UPDATE User SET UserType = %s WHERE Username = %s",
+                "UPDATE User SET UserType = %s, ClaimsVersion = ClaimsVersion + 1 WHERE Username = %s",
                 (UserType.STAFF.value, username)
             )
             if cursor.rowcount == 0:
@@ -479,6 +531,7 @@ def promote_customer_to_staff_admin(username: str, db: pymysql.connections.Conne
 
             # 6. Commit transaction
             db.commit()
+            principal_cache.invalidate(username)
             logger.info(f"Successfully promoted user '{username}' to Staff.")
 
             # 7. Fetch and return updated details
@@ -544,6 +597,8 @@ def promote_staff_to_coach_admin(username: str, db: pymysql.connections.Connecti
 
             # 5. Commit transaction
             db.commit()
+            principal_cache.invalidate(username)
+            catalog_cache.invalidate("coach", "training_session")
             logger.info(f"Successfully promoted user '{username}' to Coach.")
 
             # 6. Fetch and return user details (no change in User/Staff table, but confirms success)
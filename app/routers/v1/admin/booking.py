@@ -5,7 +5,7 @@ from datetime import datetime
 import pymysql
 from loguru import logger
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.utils.auth import get_current_admin
 from app.models.enums import BookingStatus
 
@@ -56,7 +56,7 @@ async def get_all_bookings(
     customer_id: Optional[int] = Query(None, description="Filter by CustomerID"),
     court_id: Optional[int] = Query(None, description="Filter by CourtID"),
     status: Optional[BookingStatus] = Query(None, description="Filter by Booking Status"),
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: pymysql.connections.Connection = Depends(get_read_db)
 ):
     """
     Admin route to retrieve a list of all bookings, with optional filters.
@@ -4,7 +4,7 @@ from typing import List, Optional
 import pymysql
 from loguru import logger
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.utils.auth import get_current_admin
 # Import model functions
 from app.models.coach import get_all_coaches_admin, get_coach_details_admin, update_coach_admin
@@ -48,7 +48,7 @@ class CoachUpdateRequest(BaseModel):
 
 # Placeholder for GET /
 @admin_coach_router.get("/", response_model=List[CoachDetailResponse])
-async def get_all_coaches(db: pymysql.connections.Connection = Depends(get_db)):
+async def get_all_coaches(db: pymysql.connections.Connection = Depends(get_read_db)):
     """
     Admin route to retrieve a list of all coaches with their details.
     Requires admin privileges.
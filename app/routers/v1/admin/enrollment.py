@@ -4,7 +4,7 @@ from typing import List, Optional
 import pymysql
 from loguru import logger
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.utils.auth import get_current_admin
 
 # Import model functions
@@ -49,7 +49,7 @@ class EnrollmentDetailResponse(BaseModel):
 async def get_enrollments(
     customer_id: Optional[int] = Query(None, description="Filter by CustomerID"),
     session_id: Optional[int] = Query(None, description="Filter by SessionID"),
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: pymysql.connections.Connection = Depends(get_read_db)
 ):
     """
     Admin route to retrieve a list of enrollments, with optional filters.
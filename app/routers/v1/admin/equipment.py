@@ -4,7 +4,7 @@ from typing import List, Optional
 import pymysql
 from loguru import logger
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.utils.auth import get_current_admin
 from app.models.enums import EquipmentType
 
@@ -81,7 +81,7 @@ async def create_equipment(
 
 # GET / - List all equipment
 @admin_equipment_router.get("/", response_model=List[AdminEquipmentResponse])
-async def get_all_equipment(db: pymysql.connections.Connection = Depends(get_db)):
+async def get_all_equipment(db: pymysql.connections.Connection = Depends(get_read_db)):
     """
     Admin route to retrieve a list of all equipment items.
     Requires admin privileges.
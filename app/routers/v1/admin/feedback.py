@@ -4,7 +4,7 @@ from typing import List, Optional
 import pymysql
 from loguru import logger
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.utils.auth import get_current_admin
 from app.models.enums import FeedbackType # From dump.sql ON column
 
@@ -52,7 +52,7 @@ async def get_all_feedback(
     customer_id: Optional[int] = Query(None, description="Filter by CustomerID"),
     feedback_on: Optional[FeedbackType] = Query(None, alias="on", description="Filter by type (Court or Session)"),
     target_id: Optional[int] = Query(None, description="Filter by CourtID or SessionID (use with 'on' filter)"),
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: pymysql.connections.Connection = Depends(get_read_db)
 ):
     """
     Admin route to retrieve a list of all feedback, with optional filters.
@@ -4,7 +4,7 @@ from typing import List, Optional
 import pymysql
 from loguru import logger
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.utils.auth import get_current_admin
 from app.models.enums import FoodCategory
 
@@ -78,7 +78,7 @@ async def create_food_item(
 
 # GET / - List all food items
 @admin_food_router.get("/", response_model=List[AdminFoodResponse])
-async def get_all_food_items(db: pymysql.connections.Connection = Depends(get_db)):
+async def get_all_food_items(db: pymysql.connections.Connection = Depends(get_read_db)):
     """
     Admin route to retrieve a list of all cafeteria food items.
     Requires admin privileges.
@@ -4,7 +4,7 @@ from typing import List, Optional
 import pymysql
 from loguru import logger
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.utils.auth import get_current_admin
 # from app.models.enums import UserType # Not needed here
 # Import model functions
@@ -43,7 +43,7 @@ class StaffUpdateRequest(BaseModel):
 
 # Placeholder for GET /
 @admin_staff_router.get("/", response_model=List[StaffDetailResponse])
-async def get_all_staff(db: pymysql.connections.Connection = Depends(get_db)):
+async def get_all_staff(db: pymysql.connections.Connection = Depends(get_read_db)):
     """
     Admin route to retrieve a list of all staff members.
     Requires admin privileges.
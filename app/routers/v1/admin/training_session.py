@@ -5,7 +5,7 @@ from datetime import datetime
 import pymysql
 from loguru import logger
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.utils.auth import get_current_admin
 from app.models.enums import TrainingSessionType, TrainingSessionStatus # Use correct enum for session status
 
@@ -118,7 +118,7 @@ async def create_session(
 
 # GET / - List all sessions
 @admin_training_router.get("/", response_model=List[AdminTrainingSessionResponse])
-async def get_all_sessions(db: pymysql.connections.Connection = Depends(get_db)):
+async def get_all_sessions(db: pymysql.connections.Connection = Depends(get_read_db)):
     """
     Admin route to retrieve a list of all training sessions.
     Requires admin privileges.
@@ -4,7 +4,7 @@ from typing import List, Optional
 import pymysql
 from loguru import logger
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.utils.auth import get_current_admin, get_password_hash
 from app.models.enums import UserType
 # Import the necessary model functions
@@ -159,7 +159,7 @@ async def create_user(
 # GET /users - List all users
 @admin_user_router.get("/", response_model=List[UserListDetailResponse])
 async def get_users(
-    db: pymysql.connections.Connection = Depends(get_db),
+    db: pymysql.connections.Connection = Depends(get_read_db),
     page: int = Query(1, ge=1, description="Page number, starting from 1"),
     limit: int = Query(25, ge=1, le=100, description="Number of items per page")
 ):
@@ -327,7 +327,7 @@ async def promote_user_to_coach(
 
 @admin_user_router.get("/stats/customer-count", response_model=CustomerCountResponse)
 async def get_customer_count(
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: pymysql.connections.Connection = Depends(get_read_db)
 ):
     """
     Admin route to get the total count of customers in the system.
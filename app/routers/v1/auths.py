@@ -2,12 +2,23 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
 from typing import Optional
-from app.utils.auth import verify_password, get_password_hash, create_access_token, get_current_user
-from app.models.user import get_user_by_username, register_user
+from app.utils.auth import (
+    verify_password_async,
+    get_password_hash_async,
+    create_access_token,
+    create_refresh_token,
+    decode_refresh_token,
+    get_current_user,
+    user_token_claims,
+)
+from app.models.user import get_user_by_username_async, get_principal_by_username_async, register_user
+from app.models.refresh_token import store_refresh_token_async, rotate_refresh_token_async, revoke_refresh_token_async
 from pydantic import BaseModel, validator
+import aiomysql
 import pymysql
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.env import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.utils.offload import db_executor
 
 router = APIRouter(
     prefix="/auth",
@@ -22,6 +33,7 @@ oauth2_scheme = None  # Not needed as it's handled in utils/auth.py
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -48,25 +60,61 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 
 # Routes
 @router.post("/login", response_model=Token)
-async def login(login_data: LoginRequest, db: pymysql.connections.Connection = Depends(get_db)):
-    user = get_user_by_username(login_data.username, db)
-    if not user or not verify_password(login_data.password, user['Password']):
+async def login(login_data: LoginRequest, db: aiomysql.Connection = Depends(get_async_db)):
+    user = await get_user_by_username_async(login_data.username, db)
+    if not user or not await verify_password_async(login_data.password, user['Password']):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(data={"sub": user['Username']}, expires_delta=access_token_expires)
-    return {"access_token": access_token, "token_type": "bearer"}
+    access_token = create_access_token(data=user_token_claims(user), expires_delta=access_token_expires)
+    refresh_token, token_id, expires_at = create_refresh_token(user['Username'])
+    await store_refresh_token_async(token_id, user['Username'], expires_at, db)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/refresh", response_model=Token)
+async def refresh(refresh_data: RefreshRequest, db: aiomysql.Connection = Depends(get_async_db)):
+    """
+    Exchange a refresh token for a new access token without re-checking the password.
+    The refresh token is rotated: the presented one is revoked and a new one returned.
+    """
+    payload = decode_refresh_token(refresh_data.refresh_token)
+    username = payload['sub']
+    new_refresh_token, new_token_id, new_expires_at = create_refresh_token(username)
+    rotated = await rotate_refresh_token_async(payload['jti'], username, new_token_id, new_expires_at, db)
+    user = await get_principal_by_username_async(username, db) if rotated else None
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(data=user_token_claims(user), expires_delta=access_token_expires)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": new_refresh_token}
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(refresh_data: RefreshRequest, db: aiomysql.Connection = Depends(get_async_db)):
+    """
+    Revoke a refresh token. The access token stays valid until it expires.
+    """
+    payload = decode_refresh_token(refresh_data.refresh_token)
+    await revoke_refresh_token_async(payload['jti'], payload['sub'], db)
 
 @router.post("/register")
 async def register(user: RegisterRequest, db: pymysql.connections.Connection = Depends(get_db)):
-    hashed_password = get_password_hash(user.password)
-    return register_user(user.username, hashed_password, user.phone, "Customer", user.name, db)
+    hashed_password = await get_password_hash_async(user.password)
+    return await db_executor.run(
+        "auths.register", register_user, user.username, hashed_password, user.phone, "Customer", user.name, db
+    )
 
 @router.get("/profile", response_model=User)
 async def read_users_me(current_user: dict = Depends(get_current_user)):
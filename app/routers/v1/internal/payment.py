@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header, Security
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Security, Response
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Literal, Optional
 import pymysql
 from loguru import logger
+import asyncio
 import secrets # For secure comparison
 
-from app.database import get_db
-from app.env import PAYMENT_WEBHOOK_SECRET
-from app.models.enums import PaymentStatus, BookingStatus
+from app.database import get_db, db_pool, PoolTimeoutError
+from app.env import PAYMENT_WEBHOOK_SECRET, PAYMENT_QUEUE_ENABLED
+from app.models.payment import confirm_payments, CONFIRMED, ALREADY_PROCESSED, NOT_FOUND, PAID_AFTER_EXPIRY
+from app.models.payment_queue import payment_queue
+from app.utils.offload import db_executor, stay_on_event_loop
+
+MAX_BATCH_CONFIRMATIONS = 500
 
 # --- Security Dependency ---
 
@@ -40,6 +45,7 @@ internal_payment_router = APIRouter(
     dependencies=[Security(verify_webhook_token)], # Apply security to all routes in this router
     responses={
         401: {"description": "Unauthorized"},
+        503: {"description": "Queue or database unavailable"},
         404: {"description": "Not found"},
         400: {"description": "Bad Request"},
         500: {"description": "Internal Server Error"}
@@ -51,82 +57,112 @@ internal_payment_router = APIRouter(
 class PaymentConfirmationRequest(BaseModel):
     description: str = Field(..., description="The unique payment description generated during order creation.")
 
-# --- API Endpoint ---
+class BatchPaymentConfirmationRequest(BaseModel):
+    descriptions: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_CONFIRMATIONS, description="Payment descriptions to confirm")
+
+class PaymentConfirmationResult(BaseModel):
+    description: str
+    result: Literal["confirmed", "already_processed", "not_found", "paid_after_expiry"]
+    payment_id: Optional[int] = None
+    order_id: Optional[int] = None
+    status: Optional[str] = None # Payment status after this call, when known
+
+class BatchPaymentConfirmationResponse(BaseModel):
+    confirmed: int
+    already_processed: int
+    not_found: int
+    paid_after_expiry: int # Order was cancelled as unpaid first; recorded in PaymentReview for a refund
+    results: List[PaymentConfirmationResult]
 
-@internal_payment_router.post("/confirm", status_code=status.HTTP_200_OK)
+# --- API Endpoints ---
+
+@internal_payment_router.post("/confirm", status_code=status.HTTP_202_ACCEPTED)
+@stay_on_event_loop
 async def confirm_payment(
     payload: PaymentConfirmationRequest,
-    db: pymysql.connections.Connection = Depends(get_db)
+    response: Response
 ):
     """
     Webhook endpoint to confirm a payment and update related booking statuses.
     Requires Bearer token authentication matching PAYMENT_WEBHOOK_SECRET.
+
+    The notification is written to the local payment queue and acknowledged with
+    202; a background worker confirms queued payments in batches. The append runs
+    on a plain worker thread, not on the database executor, so the webhook is
+    answered however busy the database is. With PAYMENT_QUEUE_ENABLED=false the
+    payment is confirmed on the database executor before answering (200).
     """
     payment_description = payload.description
     logger.info(f"Received payment confirmation request for description: {payment_description}")
 
+    if PAYMENT_QUEUE_ENABLED:
+        try:
+            await asyncio.to_thread(payment_queue.enqueue, payment_description) # flock + fsync
+        except OSError as e:
+            logger.error(f"Could not queue payment confirmation for description {payment_description}: {e}")
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Payment queue unavailable, please retry.")
+        return {"message": "Payment confirmation queued."}
+
+    response.status_code = status.HTTP_200_OK
+    return await db_executor.run(f"{__name__}.confirm_payment", _confirm_payment_now, payment_description)
+
+
+def _confirm_payment_now(payment_description: str):
+    """Synchronous /confirm (PAYMENT_QUEUE_ENABLED=false); runs on the database executor."""
     try:
-        with db.cursor() as cursor:
-            # --- Find Payment by Description ---
-            cursor.execute(
-                "SELECT PaymentID, OrderID, Status FROM Payment WHERE Description = %s",
-                (payment_description,)
-            )
-            payment = cursor.fetchone()
-
-            if not payment:
-                logger.warning(f"Payment not found for description: {payment_description}")
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Payment description not found.")
-
-            payment_id = payment['PaymentID']
-            order_id = payment['OrderID']
-            current_status = payment['Status']
-
-            if current_status != PaymentStatus.PENDING.value:
-                logger.warning(f"Payment {payment_id} (Description: {payment_description}) already has status: {current_status}. No action taken.")
-                # Return 200 OK even if already processed to acknowledge receipt
-                return {"message": f"Payment already processed with status: {current_status}"}
-
-            # --- Start Transaction ---
-            try:
-                # --- Update Payment Status ---
-                cursor.execute(
-                    "UPDATE Payment SET Status = %s WHERE PaymentID = %s",
-                    (PaymentStatus.SUCCESS.value, payment_id)
-                )
-                logger.info(f"Updated Payment {payment_id} status to {PaymentStatus.SUCCESS.value}")
-
-                # --- Update Booking Statuses ---
-                # Find all bookings associated with this OrderID that are still Pending
-                cursor.execute(
-                    "UPDATE Booking SET Status = %s WHERE OrderID = %s AND Status = %s",
-                    (BookingStatus.SUCCESS.value, order_id, BookingStatus.PENDING.value)
-                )
-                updated_bookings_count = cursor.rowcount
-                logger.info(f"Updated {updated_bookings_count} Booking(s) status to {BookingStatus.SUCCESS.value} for OrderID {order_id}")
-
-                # --- Commit Transaction ---
-                db.commit()
-                logger.info(f"Successfully confirmed payment and updated bookings for PaymentID {payment_id}, OrderID {order_id}")
-                return {"message": "Payment confirmed successfully and bookings updated."}
-
-            except pymysql.Error as db_err:
-                db.rollback()
-                logger.error(f"Database error during payment confirmation transaction for PaymentID {payment_id}: {db_err}")
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error during confirmation.")
-            except Exception as e:
-                 db.rollback()
-                 logger.exception(f"Unexpected error during payment confirmation transaction for PaymentID {payment_id}: {e}")
-                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred during confirmation.")
+        with db_pool.connection() as db:
+            result = confirm_payments([payment_description], db)[0]
+
+        if result['result'] == NOT_FOUND:
+            logger.warning(f"Payment not found for description: {payment_description}")
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Payment description not found.")
+
+        if result['result'] == PAID_AFTER_EXPIRY:
+            # Acknowledged so the gateway stops retrying; the payment is in PaymentReview
+            return {"message": "Payment received after the order expired; recorded for refund."}
+
+        if result['result'] == ALREADY_PROCESSED:
+            logger.warning(f"Payment {result['payment_id']} (Description: {payment_description}) already has status: {result['status']}. No action taken.")
+            # Return 200 OK even if already processed to acknowledge receipt
+            return {"message": f"Payment already processed with status: {result['status']}"}
+
+        logger.info(f"Successfully confirmed payment and updated bookings for PaymentID {result['payment_id']}, OrderID {result['order_id']}")
+        return {"message": "Payment confirmed successfully and bookings updated."}
 
     except HTTPException as e:
         # Re-raise HTTPExceptions (like 404 Not Found)
         raise e
-    except pymysql.Error as db_err:
-        # Catch errors during initial payment fetch
-        logger.error(f"Database error fetching payment for description {payment_description}: {db_err}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error finding payment.")
+    except PoolTimeoutError as e:
+        logger.error(f"Database pool exhausted: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database busy, please retry")
     except Exception as e:
         # Catch any other unexpected errors
         logger.exception(f"Unexpected error processing payment confirmation for description {payment_description}: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred.")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred.")
+
+
+@internal_payment_router.post("/confirm-batch", response_model=BatchPaymentConfirmationResponse, status_code=status.HTTP_200_OK)
+async def confirm_payment_batch(
+    payload: BatchPaymentConfirmationRequest,
+    db: pymysql.connections.Connection = Depends(get_db)
+):
+    """
+    Webhook endpoint to confirm many payments at once (gateway settlement batches).
+    All payments are resolved with one query and confirmed in one transaction; the
+    response has one result per distinct description. Repeated descriptions are
+    reported once.
+    """
+    logger.info(f"Received batch payment confirmation for {len(payload.descriptions)} description(s)")
+    try:
+        results = confirm_payments(payload.descriptions, db)
+        counts = {outcome: 0 for outcome in (CONFIRMED, ALREADY_PROCESSED, NOT_FOUND, PAID_AFTER_EXPIRY)}
+        for result in results:
+            counts[result['result']] += 1
+        logger.info(f"Batch payment confirmation done: {counts}")
+        return BatchPaymentConfirmationResponse(results=results, **counts)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.exception(f"Unexpected error processing batch payment confirmation: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred.")
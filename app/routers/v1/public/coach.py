@@ -1,10 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, Path
 from typing import List, Optional
-import pymysql
-from app.database import get_db
+import aiomysql
+from app.database import get_async_read_db
 from app.models.coach import ( # Updated import
-    get_all_coaches,
-    get_coach_by_id,
+    get_all_coaches_async,
+    get_coach_by_id_async,
 )
 from pydantic import BaseModel
 
@@ -24,13 +24,13 @@ class CoachResponse(BaseModel):
 
 @coach_router.get("/", response_model=List[CoachResponse])
 async def get_coaches(
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: aiomysql.Connection = Depends(get_async_read_db)
 ):
     """
     Get all coaches.
     """
     try:
-        coaches = get_all_coaches(db)
+        coaches = await get_all_coaches_async(db)
         return coaches
     except HTTPException as e:
         raise e
@@ -43,13 +43,13 @@ async def get_coaches(
 @coach_router.get("/{coach_id}", response_model=CoachResponse)
 async def get_coach(
     coach_id: int = Path(..., description="Coach ID (StaffID)"),
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: aiomysql.Connection = Depends(get_async_read_db)
 ):
     """
     Get a specific coach by ID.
     """
     try:
-        coach = get_coach_by_id(coach_id, db)
+        coach = await get_coach_by_id_async(coach_id, db)
         return coach
     except HTTPException as e:
         raise e
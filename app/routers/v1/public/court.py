@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Optional, Any
-import pymysql
-from datetime import datetime, timedelta
-from app.database import get_db
+import aiomysql
+from datetime import date, datetime, timezone
+from app.database import get_async_read_db
 from app.models.court import (
-    get_available_courts,
-    get_court_by_id,
-    get_available_time_slots
+    get_available_courts_async,
+    get_court_by_id_async,
+    get_available_time_slots_async,
+    get_courts_availability_async,
+    get_courts_calendar_async,
+    get_courts_free_at_async,
+    search_free_slots_async,
+    MAX_SEARCH_WINDOW
 )
+from app.models.enums import CourtType
+from app.utils.events import court_events
 from pydantic import BaseModel, Field
 
 router = APIRouter(
@@ -16,6 +24,15 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+def as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Query datetimes with an offset (`...Z`, `+07:00`) converted to the naive UTC
+    the index and the database use; naive values are taken as UTC already.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
 # Pydantic models for response
 class TimeSlot(BaseModel):
     start: datetime
@@ -31,39 +48,167 @@ class CourtTimeSlotResponse(BaseModel):
     court: Dict[str, Any]
     available_slots: List[TimeSlot]
 
+class CourtDayAvailability(BaseModel):
+    date: date
+    available_slots: List[TimeSlot]
+
+class CourtAvailabilityResponse(BaseModel):
+    court: CourtResponse
+    days: List[CourtDayAvailability]
+
+class CourtCalendarDay(BaseModel):
+    date: date
+    day_start: datetime
+    busy: str = Field(..., description="One character per slot from day_start: '1' busy, '0' free")
+    free_slots: List[TimeSlot]
+
+class CourtCalendar(BaseModel):
+    court: CourtResponse
+    days: List[CourtCalendarDay]
+
+class CourtCalendarResponse(BaseModel):
+    slot_minutes: int
+    courts: List[CourtCalendar]
+
+class CourtSlotCandidate(BaseModel):
+    court: CourtResponse
+    start: datetime
+    end: datetime
+    price: float
+
 @router.get("/", response_model=List[CourtResponse])
 async def get_courts(
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: aiomysql.Connection = Depends(get_async_read_db)
 ):
     """
     Get all available courts.
     """
     try:
-        courts = get_available_courts(db)
+        courts = await get_available_courts_async(db)
         return courts
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+# Declared before /{court_id} so "availability" is not parsed as a court ID
+@router.get("/availability", response_model=List[CourtAvailabilityResponse])
+async def get_courts_availability(
+    date: Optional[date] = Query(None, description="First day (YYYY-MM-DD, UTC+7); defaults to today"),
+    days: int = Query(1, ge=1, le=14, description="Number of days"),
+    type: Optional[CourtType] = Query(None, description="Only courts of this type"),
+    db: aiomysql.Connection = Depends(get_async_read_db)
+):
+    """
+    Get available time slots of every available court, per day, for a date window.
+
+    Each day uses working hours (5:00-23:00 UTC+7).
+    """
+    try:
+        return await get_courts_availability_async(date, days, type, db)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.get("/calendar", response_model=CourtCalendarResponse)
+async def get_courts_calendar(
+    date: Optional[date] = Query(None, description="First day (YYYY-MM-DD, UTC+7); defaults to today"),
+    days: int = Query(7, ge=1, le=31, description="Number of days"),
+    type: Optional[CourtType] = Query(None, description="Only courts of this type"),
+    min_minutes: int = Query(15, ge=1, le=1080, description="Only list free gaps at least this long"),
+    db: aiomysql.Connection = Depends(get_async_read_db)
+):
+    """
+    Get the occupancy grid (5:00-23:00 UTC+7 in fixed slots) and the free gaps of
+    at least `min_minutes` of every available court, per day.
+    """
+    try:
+        return await get_courts_calendar_async(date, days, type, min_minutes, db)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.get("/free", response_model=List[CourtResponse])
+async def get_courts_free_at(
+    at: datetime = Query(..., description="Start time (ISO format)"),
+    duration_minutes: int = Query(60, ge=1, le=1080, description="Required duration in minutes"),
+    type: Optional[CourtType] = Query(None, description="Only courts of this type"),
+    db: aiomysql.Connection = Depends(get_async_read_db)
+):
+    """
+    Get the available courts that are free for `duration_minutes` starting at `at`.
+    """
+    try:
+        return await get_courts_free_at_async(as_naive_utc(at), duration_minutes, type, db)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.get("/search", response_model=List[CourtSlotCandidate])
+async def search_court_slots(
+    duration_minutes: int = Query(60, ge=15, le=1080, description="Required duration in minutes"),
+    start_time: Optional[datetime] = Query(None, description="Search window start (ISO format); defaults to now"),
+    end_time: Optional[datetime] = Query(None, description="Search window end (ISO format); defaults to 7 days after the start"),
+    type: Optional[CourtType] = Query(None, description="Only courts of this type"),
+    limit: int = Query(10, ge=1, le=100, description="Maximum number of results"),
+    db: aiomysql.Connection = Depends(get_async_read_db)
+):
+    """
+    Find the earliest free slots of `duration_minutes` on any available court,
+    with the price of each slot. Results are ordered by start time, then price.
+    """
+    start_time, end_time = as_naive_utc(start_time), as_naive_utc(end_time)
+    if start_time and end_time and end_time <= start_time:
+        raise HTTPException(status_code=400, detail="end_time must be after start_time")
+    if end_time and end_time - (start_time or datetime.utcnow()) > MAX_SEARCH_WINDOW:
+        raise HTTPException(status_code=400, detail=f"Search window cannot exceed {MAX_SEARCH_WINDOW.days} days")
+    try:
+        return await search_free_slots_async(duration_minutes, start_time, end_time, type, limit, db)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.get("/events")
+async def stream_court_events(
+    request: Request,
+    court_id: Optional[List[int]] = Query(None, description="Only events of these courts (repeatable)")
+):
+    """
+    Server-Sent Events stream of court availability changes.
+
+    - `booking`: a booking was created or changed status (court_id, start, end, status).
+    - `schedule`: a training schedule slot was added or removed (court_id, start, end, session_id, action).
+    - `resync`: events were dropped because the client fell behind; re-fetch availability.
+    """
+    return StreamingResponse(
+        court_events.stream(request, set(court_id) if court_id else None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/{court_id}", response_model=CourtTimeSlotResponse)
 async def get_court_by_id_with_availability(
     court_id: int = Path(..., description="Court ID"),
     start_time: Optional[datetime] = Query(None, description="Start time (ISO format)"),
     end_time: Optional[datetime] = Query(None, description="End time (ISO format)"),
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: aiomysql.Connection = Depends(get_async_read_db)
 ):
     """
     Get a specific court by ID with available time slots.
     
     If start_time and end_time are not provided, uses working hours (5:00-23:00 UTC+7).
     """
+    start_time, end_time = as_naive_utc(start_time), as_naive_utc(end_time)
     try:
         # Get court information
-        court = get_court_by_id(court_id, db)
+        court = await get_court_by_id_async(court_id, db)
         
         # Get available time slots
-        available_slots = get_available_time_slots(court_id, start_time, end_time, db)
+        available_slots = await get_available_time_slots_async(court_id, start_time, end_time, db)
         
         # Convert to response model
         response = {
@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
-import pymysql
-from app.database import get_db
+import aiomysql
+from app.database import get_async_read_db
 from app.models.equipment import (
-    get_all_equipment,
+    get_all_equipment_async,
     EquipmentResponse, # Import the Pydantic model
 )
 from loguru import logger # Import loguru
@@ -17,13 +17,13 @@ equipment_router = APIRouter(
 
 @equipment_router.get("/", response_model=List[EquipmentResponse])
 async def get_equipment(
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: aiomysql.Connection = Depends(get_async_read_db)
 ):
     """
     Get all available equipment.
     """
     try:
-        equipment_list = get_all_equipment(db)
+        equipment_list = await get_all_equipment_async(db)
         return equipment_list
     except HTTPException as e:
         # Re-raise HTTPException to let FastAPI handle it
@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
-import pymysql
-from app.database import get_db
+import aiomysql
+from app.database import get_async_read_db
 from app.models.food import (
-    get_all_food,
+    get_all_food_async,
     FoodResponse, # Import the Pydantic model
 )
 from loguru import logger # Import loguru
@@ -17,13 +17,13 @@ food_router = APIRouter(
 
 @food_router.get("/", response_model=List[FoodResponse])
 async def get_food(
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: aiomysql.Connection = Depends(get_async_read_db)
 ):
     """
     Get all available food items.
     """
     try:
-        food_list = get_all_food(db)
+        food_list = await get_all_food_async(db)
         return food_list
     except HTTPException as e:
         # Re-raise HTTPException to let FastAPI handle it
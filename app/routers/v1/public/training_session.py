@@ -1,12 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Path
 from typing import List, Optional
-import pymysql
+import aiomysql
 from datetime import datetime
-from app.database import get_db
+from app.database import get_async_read_db
 from app.models.training_session import ( # Updated import
-    get_all_training_sessions,
-    get_training_session_by_id,
-    get_training_sessions_by_coach
+    get_all_training_sessions_async,
+    get_training_session_by_id_async,
+    get_training_sessions_by_coach_async
 )
 from pydantic import BaseModel
 from app.models.enums import TrainingSessionType # Keep this if needed, check dump.sql
@@ -37,16 +37,16 @@ class TrainingSessionResponse(BaseModel):
 @training_router.get("/", response_model=List[TrainingSessionResponse])
 async def get_training_sessions(
     coach_id: Optional[int] = Query(None, description="Filter by coach ID"),
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: aiomysql.Connection = Depends(get_async_read_db)
 ):
     """
     Get all training sessions. Optionally filter by coach ID.
     """
     try:
         if coach_id:
-            sessions = get_training_sessions_by_coach(coach_id, db)
+            sessions = await get_training_sessions_by_coach_async(coach_id, db)
         else:
-            sessions = get_all_training_sessions(db)
+            sessions = await get_all_training_sessions_async(db)
         return sessions
     except HTTPException as e:
         raise e
@@ -59,13 +59,13 @@ async def get_training_sessions(
 @training_router.get("/{session_id}", response_model=TrainingSessionResponse)
 async def get_training_session(
     session_id: int = Path(..., description="Training Session ID"),
-    db: pymysql.connections.Connection = Depends(get_db)
+    db: aiomysql.Connection = Depends(get_async_read_db)
 ):
     """
     Get a specific training session by ID.
     """
     try:
-        session = get_training_session_by_id(session_id, db)
+        session = await get_training_session_by_id_async(session_id, db)
         return session
     except HTTPException as e:
         raise e
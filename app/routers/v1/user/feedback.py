@@ -5,10 +5,10 @@ import pymysql
 from loguru import logger
 
 from app.database import get_db
-from app.utils.auth import get_current_user
+from app.utils.auth import get_current_user, require_customer_id
+from app.utils.cache import catalog_cache
 from app.models.feedback import get_all_feedback_admin, get_feedback_by_id_admin
 from app.models.enums import FeedbackType
-from app.models.user import get_customer_id_by_username  # Import the function to get customer ID
 
 feedback_router = APIRouter(
     prefix="/feedback",
@@ -47,8 +47,8 @@ async def get_user_feedback(
     logger.info(f"User '{username}' is retrieving their feedback.")
 
     try:
-        # Get CustomerID by username using the imported function
-        customer_id = get_customer_id_by_username(username, db)
+        # CustomerID comes from the signed token claims
+        customer_id = require_customer_id(current_user)
 
         feedback_list = get_all_feedback_admin(db, customer_id=customer_id)
         logger.info(f"User '{username}' retrieved {len(feedback_list)} feedback entries.")
@@ -77,8 +77,8 @@ async def submit_feedback(
         # Convert enum to string if needed
         feedback_on_value = feedback_data.feedback_on.value if hasattr(feedback_data.feedback_on, 'value') else str(feedback_data.feedback_on)
         
-        # Get CustomerID by username using the imported function
-        customer_id = get_customer_id_by_username(username, db)
+        # CustomerID comes from the signed token claims
+        customer_id = require_customer_id(current_user)
         
         # Check if user has already submitted feedback for this order
         with db.cursor() as cursor:
@@ -146,6 +146,7 @@ async def submit_feedback(
                 feedback_data.order_id
             ))
             db.commit()
+            catalog_cache.invalidate("training_session")
 
         logger.info(f"User '{username}' successfully submitted feedback.")
         return {"message": "Feedback submitted successfully"}
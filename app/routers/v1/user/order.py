@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Response, Query, Path
 from pydantic import BaseModel, Field, validator, model_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
@@ -6,11 +6,13 @@ import pymysql
 from loguru import logger
 
 from app.database import get_db
-from app.utils.auth import get_current_user
-from app.models.user import get_customer_id_by_username
-from app.models.order import process_order, get_user_orders # Import the new function
+from app.utils.auth import get_current_user, require_customer_id
+from app.models.order import process_order, get_user_orders, get_user_order # Import the new function
+from app.models.idempotency import run_idempotent
 from app.models.enums import BookingStatus, CourtType, EquipmentType, FoodCategory, PaymentMethod # Import necessary enums
 
+ORDER_PAGE_SIZE = 20 # Page size when only a cursor is passed
+
 # Create user order router
 order_router = APIRouter(
     prefix="/order",
@@ -38,11 +40,11 @@ class CourtOrderItem(BaseModel):
 
 class EquipmentOrderItem(BaseModel):
     equipment_id: int = Field(..., gt=0, description="ID of the equipment to rent")
-    # quantity: int = Field(1, gt=0, description="Quantity of equipment to rent") # Add quantity later if needed
+    quantity: int = Field(1, gt=0, le=100, description="Quantity of equipment to rent")
 
 class FoodOrderItem(BaseModel):
     food_id: int = Field(..., gt=0, description="ID of the food item to order")
-    # quantity: int = Field(1, gt=0, description="Quantity of food item to order") # Add quantity later if needed
+    quantity: int = Field(1, gt=0, le=100, description="Quantity of food item to order")
 
 class OrderRequest(BaseModel):
     court_orders: Optional[List[CourtOrderItem]] = None
@@ -90,6 +92,7 @@ class EquipmentRentalDetail(BaseModel):
     brand: Optional[str] = Field(None, alias="Brand")
     equipment_type: EquipmentType = Field(..., alias="EquipmentType")
     price: float = Field(..., alias="Price")
+    quantity: int = Field(1, alias="Quantity")
 
     class Config:
         populate_by_name = True
@@ -99,6 +102,7 @@ class FoodItemDetail(BaseModel):
     name: str = Field(..., alias="Name")
     food_category: FoodCategory = Field(..., alias="FoodCategory")
     price: float = Field(..., alias="Price")
+    quantity: int = Field(1, alias="Quantity")
 
     class Config:
         populate_by_name = True
@@ -114,13 +118,14 @@ class UserOrderDetail(BaseModel):
     order_id: int
     order_date: datetime
     total_amount: float
-    bookings: List[BookingDetail]
-    equipment_rentals: List[EquipmentRentalDetail]
-    food_items: List[FoodItemDetail]
+    bookings: Optional[List[BookingDetail]] = None # None when the list was requested without expand
+    equipment_rentals: Optional[List[EquipmentRentalDetail]] = None
+    food_items: Optional[List[FoodItemDetail]] = None
     session: Optional[SessionDetail] = None 
 
 class UserOrderListResponse(BaseModel):
     orders: List[UserOrderDetail]
+    next_cursor: Optional[str] = None # Pass as `cursor` to get the next page; None on the last page
 
 
 # --- API Endpoints ---
@@ -128,12 +133,18 @@ class UserOrderListResponse(BaseModel):
 @order_router.post("/", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
 async def create_user_order(
     order_data: OrderRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=64, description="Retries with the same key return the first response"),
     db: pymysql.connections.Connection = Depends(get_db),
     current_user: dict = Depends(get_current_user) # Requires user authentication
 ):
     """
     Place a new order for court bookings, equipment rentals, and/or food items.
     Requires user authentication.
+
+    Send an `Idempotency-Key` header to make retries safe: a retry with the same key
+    returns the first response (with `Idempotent-Replayed: true`) instead of placing
+    the order again.
     """
     username = current_user.get('Username')
     if not username:
@@ -142,9 +153,9 @@ async def create_user_order(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Authentication error")
 
     try:
-        # Get CustomerID associated with the authenticated user
-        customer_id = get_customer_id_by_username(username, db)
-        # get_customer_id_by_username raises HTTPException if not found or on DB error
+        # CustomerID comes from the signed token claims
+        customer_id = require_customer_id(current_user)
+        # require_customer_id raises 404 if the user is not a customer
 
         logger.info(f"Processing order for CustomerID: {customer_id} (Username: {username})")
 
@@ -154,17 +165,28 @@ async def create_user_order(
         food_orders_dict = [item.dict() for item in order_data.food_orders] if order_data.food_orders else None
 
         # Call the model function to process the order
-        result = process_order(
-            customer_id=customer_id,
-            court_orders=court_orders_dict,
-            equipment_orders=equipment_orders_dict,
-            food_orders=food_orders_dict,
-            db=db,
-            payment_method=order_data.payment_method # Pass payment method
+        result, replayed = run_idempotent(
+            username,
+            "POST /v1/user/order",
+            idempotency_key,
+            order_data,
+            status.HTTP_201_CREATED,
+            lambda record: process_order(
+                customer_id=customer_id,
+                court_orders=court_orders_dict,
+                equipment_orders=equipment_orders_dict,
+                food_orders=food_orders_dict,
+                db=db,
+                payment_method=order_data.payment_method, # Pass payment method
+                before_commit=record # Stores the replayable response with the order
+            ),
+            db
         )
         # process_order raises HTTPException on validation/processing errors
-
-        logger.info(f"Order {result['order_id']} created successfully for CustomerID: {customer_id}")
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        else:
+            logger.info(f"Order {result['order_id']} created successfully for CustomerID: {customer_id}")
         # The result dictionary now contains order_id, total_amount, message, payment_id, payment_description
         return OrderResponse(**result)
 
@@ -179,11 +201,17 @@ async def create_user_order(
 
 @order_router.get("/", response_model=UserOrderListResponse, status_code=status.HTTP_200_OK)
 async def get_user_order_history(
+    limit: Optional[int] = Query(None, ge=1, le=100, description=f"Number of orders per page ({ORDER_PAGE_SIZE} with a cursor); without limit and cursor all orders are returned"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    expand: bool = Query(True, description="Include bookings, rentals and food items; false returns order headers only"),
     db: pymysql.connections.Connection = Depends(get_db),
     current_user: dict = Depends(get_current_user) # Requires user authentication
 ):
     """
-    Retrieve the order history for the authenticated user.
+    Retrieve the order history for the authenticated user, newest first. Pass `limit`
+    to get one page at a time and follow `next_cursor`; without `limit` or `cursor`
+    the whole history is returned, as before pagination existed.
+    Use `GET /order/{order_id}` to load the details of an order listed without `expand`.
     """
     username = current_user.get('Username')
     if not username:
@@ -192,21 +220,24 @@ async def get_user_order_history(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Authentication error")
 
     try:
-        # Get CustomerID associated with the authenticated user
-        customer_id = get_customer_id_by_username(username, db)
-        # get_customer_id_by_username raises HTTPException if not found or on DB error
+        # CustomerID comes from the signed token claims
+        customer_id = require_customer_id(current_user)
+        # require_customer_id raises 404 if the user is not a customer
 
         logger.info(f"Fetching order history for CustomerID: {customer_id} (Username: {username})")
 
+        if limit is None and cursor:
+            limit = ORDER_PAGE_SIZE
+
         # Call the model function to get the order history
-        orders_data = get_user_orders(customer_id=customer_id, db=db)
+        orders_data, next_cursor = get_user_orders(customer_id=customer_id, db=db, limit=limit, after=cursor, expand=expand)
         # get_user_orders raises HTTPException on errors
 
         logger.info(f"Successfully retrieved {len(orders_data)} orders for CustomerID: {customer_id}")
 
         # Wrap the list in the response model structure
         # FastAPI will automatically handle validation against UserOrderListResponse
-        return UserOrderListResponse(orders=orders_data)
+        return UserOrderListResponse(orders=orders_data, next_cursor=next_cursor)
 
     except HTTPException as e:
         # Re-raise HTTPExceptions raised from model functions
@@ -214,4 +245,24 @@ async def get_user_order_history(
     except Exception as e:
         # Catch any unexpected errors
         logger.exception(f"Unexpected error retrieving order history for user {username}: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred while retrieving order history.")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred while retrieving order history.")
+
+
+@order_router.get("/{order_id}", response_model=UserOrderDetail, status_code=status.HTTP_200_OK)
+async def get_user_order_detail(
+    order_id: int = Path(..., gt=0, description="The ID of the order"),
+    db: pymysql.connections.Connection = Depends(get_db),
+    current_user: dict = Depends(get_current_user) # Requires user authentication
+):
+    """
+    Retrieve one order of the authenticated user with its bookings, rentals and food items.
+    """
+    username = current_user.get('Username')
+    try:
+        customer_id = require_customer_id(current_user)
+        return get_user_order(customer_id=customer_id, order_id=order_id, db=db)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.exception(f"Unexpected error retrieving order {order_id} for user {username}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred while retrieving the order.")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Path, status, Body
+from fastapi import APIRouter, Depends, HTTPException, Path, status, Body, Header, Response
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import pymysql
@@ -6,11 +6,11 @@ from loguru import logger
 from datetime import datetime
 
 from app.database import get_db
-from app.utils.auth import get_current_user
-from app.models.user import get_customer_id_by_username
+from app.utils.auth import get_current_user, require_customer_id
 from app.models.training_session import get_training_session_by_id, get_training_sessions_by_customer_id # Added import
-from app.models.enroll import get_enrollment_count, is_user_enrolled, enroll_user_in_session
+from app.models.enroll import is_user_enrolled, enroll_user_in_session
 from app.models.enums import PaymentMethod # Import PaymentMethod
+from app.models.idempotency import run_idempotent, RecordResponse
 
 
 # --- Pydantic Models ---
@@ -51,8 +51,10 @@ class UserTrainingSessionResponse(BaseModel):
 
 @router.post("/{session_id}/enroll", response_model=EnrollResponse, status_code=status.HTTP_201_CREATED)
 async def enroll_in_training_session(
+    response: Response,
     session_id: int = Path(..., description="The ID of the training session to enroll in", gt=0),
     enroll_data: EnrollRequest = Body(...), # Use the request model
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=64, description="Retries with the same key return the first response"),
     db: pymysql.connections.Connection = Depends(get_db),
     current_user: dict = Depends(get_current_user) # Requires user authentication
 ):
@@ -61,49 +63,27 @@ async def enroll_in_training_session(
 
     Checks for session availability, capacity, and prevents duplicate enrollments.
     Creates an order and enrollment record upon successful enrollment.
+    A retry with the same `Idempotency-Key` header returns the first response.
     """
     username = current_user['Username']
     logger.info(f"User '{username}' attempting enrollment in session ID: {session_id}")
 
     try:
-        # 1. Get CustomerID from username
-        customer_id = get_customer_id_by_username(username, db)
-
-        # 2. Get Training Session details
-        session = get_training_session_by_id(session_id, db)
-
-        # 3. Check if session is available
-        if session['Status'] != 'Available':
-            logger.warning(f"Enrollment failed: Session {session_id} is not available (Status: {session['Status']}). User: {username}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This training session is currently unavailable.")
-
-        # 4. Check if user is already enrolled
-        if is_user_enrolled(customer_id, session_id, db):
-            logger.warning(f"Enrollment failed: User {username} (CustomerID: {customer_id}) already enrolled in session {session_id}.")
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="You are already enrolled in this session.")
-
-        # 5. Check session capacity
-        current_enrollments = get_enrollment_count(session_id, db)
-        if current_enrollments >= session['Max_Students']:
-            logger.warning(f"Enrollment failed: Session {session_id} is full (Enrolled: {current_enrollments}, Max: {session['Max_Students']}). User: {username}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This training session is full.")
-
-        # 6. Perform enrollment (creates order, payment, and enroll record)
-        enrollment_result = enroll_user_in_session(
-            customer_id=customer_id,
-            session_id=session_id,
-            price=session['Price'],
-            payment_method=enroll_data.payment_method, # Pass payment method from request model
-            db=db
+        # 1. Get CustomerID from the token claims
+        customer_id = require_customer_id(current_user)
+
+        result, replayed = run_idempotent(
+            username,
+            "POST /v1/user/training-sessions/enroll",
+            idempotency_key,
+            {"session_id": session_id, **enroll_data.dict()},
+            status.HTTP_201_CREATED,
+            lambda record: _enroll(username, customer_id, session_id, enroll_data, db, record),
+            db
         )
-
-        logger.info(f"User '{username}' (CustomerID: {customer_id}) successfully enrolled in session {session_id}. OrderID: {enrollment_result['order_id']}, PaymentID: {enrollment_result['payment_id']}")
-        return {
-            "message": "Successfully enrolled in training session",
-            "order_id": enrollment_result['order_id'],
-            "payment_id": enrollment_result['payment_id'],
-            "payment_description": enrollment_result['payment_description']
-        }
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
 
     except HTTPException as http_exc:
         # Re-raise HTTPExceptions (like 404 Not Found from models, or specific ones raised above)
@@ -114,6 +94,55 @@ async def enroll_in_training_session(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error")
 
 
+def _enrollment_response(enrollment_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Response body of a successful enrollment (also what an idempotent retry replays)."""
+    return {
+        "message": "Successfully enrolled in training session",
+        "order_id": enrollment_result['order_id'],
+        "payment_id": enrollment_result['payment_id'],
+        "payment_description": enrollment_result['payment_description']
+    }
+
+
+def _enroll(
+    username: str,
+    customer_id: int,
+    session_id: int,
+    enroll_data: EnrollRequest,
+    db: pymysql.connections.Connection,
+    record: Optional[RecordResponse] = None
+) -> Dict[str, Any]:
+    """
+    Checks and enrollment for enroll_in_training_session; raises HTTPException on failure.
+    `record(cursor, response)` stores the idempotent response in the enrollment's transaction.
+    """
+    # 2. Get Training Session details
+    session = get_training_session_by_id(session_id, db)
+
+    # 3. Check if session is available
+    if session['Status'] != 'Available':
+        logger.warning(f"Enrollment failed: Session {session_id} is not available (Status: {session['Status']}). User: {username}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This training session is currently unavailable.")
+
+    # 4. Check if user is already enrolled
+    if is_user_enrolled(customer_id, session_id, db):
+        logger.warning(f"Enrollment failed: User {username} (CustomerID: {customer_id}) already enrolled in session {session_id}.")
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="You are already enrolled in this session.")
+
+    # 5. Perform enrollment (creates order, payment, and enroll record; takes a seat or raises 400 when full)
+    enrollment_result = enroll_user_in_session(
+        customer_id=customer_id,
+        session_id=session_id,
+        price=session['Price'],
+        payment_method=enroll_data.payment_method, # Pass payment method from request model
+        db=db,
+        before_commit=(lambda cursor, result: record(cursor, _enrollment_response(result))) if record else None
+    )
+
+    logger.info(f"User '{username}' (CustomerID: {customer_id}) successfully enrolled in session {session_id}. OrderID: {enrollment_result['order_id']}, PaymentID: {enrollment_result['payment_id']}")
+    return _enrollment_response(enrollment_result)
+
+
 @router.get("/my-sessions", response_model=List[UserTrainingSessionResponse])
 async def get_my_training_sessions(
     db: pymysql.connections.Connection = Depends(get_db),
@@ -126,8 +155,8 @@ async def get_my_training_sessions(
     logger.info(f"User '{username}' requesting their enrolled training sessions.")
 
     try:
-        # 1. Get CustomerID from username
-        customer_id = get_customer_id_by_username(username, db)
+        # 1. Get CustomerID from the token claims
+        customer_id = require_customer_id(current_user)
 
         # 2. Get enrolled sessions using the new model function
         sessions = get_training_sessions_by_customer_id(customer_id, db)
@@ -6,11 +6,15 @@ from jwt.exceptions import InvalidTokenError
 import bcrypt
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
-import pymysql
-from app.database import get_db
-from app.models.user import get_user_by_username
+import time
+from loguru import logger
+from app.database import db_pool, PoolTimeoutError
+from app.models.user import get_principal_by_username
 from app.models.enums import UserType
-from app.env import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.utils.cache import principal_cache, MISSING
+from app.utils.hashing import password_hasher, BCRYPT_ROUNDS
+import uuid
+from app.env import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_MINUTES, PRINCIPAL_CACHE_TTL_SECONDS
 
 # Security configurations
 bearer_security = HTTPBearer(auto_error=False)
@@ -19,7 +23,15 @@ def verify_password(plain_password, hashed_password):
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(10)).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password on the password hasher process pool (does not block the event loop)."""
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """get_password_hash on the password hasher process pool (does not block the event loop)."""
+    return await password_hasher.hash(password)
 
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -31,11 +43,104 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_refresh_token(username: str) -> tuple:
+    """
+    Issue a refresh token for `username`.
+    Returns (token, token_id, expires_at); token_id/expires_at (UTC) go to the RefreshToken table.
+    """
+    token_id = str(uuid.uuid4())
+    expires_at = datetime.utcnow().replace(microsecond=0) + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+    token = jwt.encode(
+        {"sub": username, "jti": token_id, "kind": "refresh", "exp": expires_at},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+    return token, token_id, expires_at
+
+def decode_refresh_token(token: str) -> Dict[str, Any]:
+    """Validate a refresh token's signature, expiry and kind; 401 otherwise."""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except InvalidTokenError:
+        raise credentials_exception
+    if payload.get("kind") != "refresh" or not payload.get("sub") or not payload.get("jti"):
+        raise credentials_exception
+    return payload
+
+def user_token_claims(user: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Signed identity claims for an access token: username, UserType, CustomerID,
+    StaffID and the user's ClaimsVersion, so user routes need no lookups.
+    """
+    return {
+        "sub": user['Username'],
+        "typ": user['UserType'],
+        "cid": user.get('CustomerID'),
+        "sid": user.get('StaffID'),
+        "ver": user.get('ClaimsVersion', 0),
+    }
+
+def apply_token_claims(payload: Dict[str, Any], principal: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Merge the token's identity claims into the principal.
+    Returns None when the token was issued for an older ClaimsVersion (e.g. before
+    a promotion), so stale role claims are never trusted. Tokens issued before
+    claims existed carry no `ver` and fall back to the principal's own values.
+    """
+    if "ver" not in payload:
+        return principal
+    if payload["ver"] != principal.get('ClaimsVersion'):
+        return None
+    principal.update({
+        "UserType": payload.get("typ"),
+        "CustomerID": payload.get("cid"),
+        "StaffID": payload.get("sid"),
+    })
+    return principal
+
+def require_customer_id(current_user: Dict[str, Any]) -> int:
+    """CustomerID of the authenticated user; 404 if the user is not a customer."""
+    customer_id = current_user.get('CustomerID')
+    if customer_id is None:
+        logger.warning(f"Customer not found for username: {current_user.get('Username')}")
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return customer_id
+
+def get_principal(username: str, expires_at: Optional[float]) -> Optional[Dict[str, Any]]:
+    """
+    Return the principal (user without password, plus CustomerID/StaffID) for a
+    validated token. Principals are cached per (username, token expiry) for up to
+    PRINCIPAL_CACHE_TTL_SECONDS, so most requests skip the database entirely;
+    a connection is only checked out on a cache miss.
+    """
+    key = (username, expires_at)
+    principal = principal_cache.get(key)
+    if principal is not MISSING:
+        return dict(principal)
+    generation = principal_cache.generation(username)
+    try:
+        with db_pool.connection() as db:
+            principal = get_principal_by_username(username, db)
+    except PoolTimeoutError as e:
+        logger.error(f"Database pool exhausted while authenticating: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database busy, please retry")
+    if principal is None:
+        return None
+    ttl = PRINCIPAL_CACHE_TTL_SECONDS
+    if expires_at is not None:
+        ttl = min(ttl, expires_at - time.time())
+    principal_cache.set(key, principal, ttl, generation)
+    return dict(principal)
+
 def get_current_user(
     request: Request,
     background_tasks: BackgroundTasks,
-    auth_token: HTTPAuthorizationCredentials = Depends(bearer_security),
-    db: pymysql.connections.Connection = Depends(get_db)
+    auth_token: HTTPAuthorizationCredentials = Depends(bearer_security)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -49,12 +154,14 @@ def get_current_user(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("kind") == "refresh":
             raise credentials_exception
     except InvalidTokenError:
         raise credentials_exception
     
-    user = get_user_by_username(username, db)
+    user = get_principal(username, payload.get("exp"))
+    if user is not None:
+        user = apply_token_claims(payload, user)
     if user is None:
         raise credentials_exception
     return user
@@ -62,8 +169,7 @@ def get_current_user(
 def get_current_admin(
     request: Request,
     background_tasks: BackgroundTasks,
-    auth_token: HTTPAuthorizationCredentials = Depends(bearer_security),
-    db: pymysql.connections.Connection = Depends(get_db)
+    auth_token: HTTPAuthorizationCredentials = Depends(bearer_security)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -77,12 +183,14 @@ def get_current_admin(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("kind") == "refresh":
             raise credentials_exception
     except InvalidTokenError:
         raise credentials_exception
     
-    user = get_user_by_username(username, db)
+    user = get_principal(username, payload.get("exp"))
+    if user is not None:
+        user = apply_token_claims(payload, user)
     if user is None or user['UserType'] != UserType.STAFF.value:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
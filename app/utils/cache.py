@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+from loguru import logger
+from app.env import CATALOG_CACHE_ENABLED, PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_SIZE
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache with a per-entry TTL and LRU eviction.
+
+    Keys are tuples whose first element names the resource, e.g. ("coach", 5).
+    `invalidate("coach")` drops every key of that resource and bumps its
+    generation; a value computed before the bump is then refused by `set()`,
+    so a slow read can never re-populate the cache with data older than a write.
+    """
+
+    def __init__(self, max_entries: int = 1024, enabled: bool = True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[float, Any]]" = OrderedDict()
+        self._generations: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, resource: Hashable) -> int:
+        """Current generation of `resource`; pass it back to `set()`."""
+        with self._lock:
+            return self._generations.get(resource, 0)
+
+    def get(self, key: Tuple[Hashable, ...]) -> Any:
+        """Return the cached value, or MISSING if absent or expired."""
+        if not self.enabled:
+            return MISSING
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Tuple[Hashable, ...], value: Any, ttl: float, generation: int = None):
+        """Store `value` for `ttl` seconds unless its resource was invalidated since `generation`."""
+        if not self.enabled or ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and self._generations.get(key[0], 0) != generation:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *resources: Hashable):
+        """Drop every entry of the given resources."""
+        with self._lock:
+            for resource in resources:
+                self._generations[resource] = self._generations.get(resource, 0) + 1
+            stale = [key for key in self._entries if key[0] in resources]
+            for key in stale:
+                del self._entries[key]
+        logger.debug(f"Cache invalidated for {', '.join(map(str, resources))} ({len(stale)} entries).")
+
+    def clear(self):
+        with self._lock:
+            for resource in {key[0] for key in self._entries}:
+                self._generations[resource] = self._generations.get(resource, 0) + 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Seconds each public catalog resource may be served from memory.
+# Admin writes invalidate the affected resources immediately, so the TTL only
+# bounds staleness from writes made outside this process.
+CATALOG_TTL_SECONDS = {
+    "court": 300,
+    "coach": 300,
+    "training_session": 60,
+    "food": 60,
+    "equipment": 60,
+}
+
+catalog_cache = TTLCache(max_entries=1024, enabled=CATALOG_CACHE_ENABLED)
+
+# Validated principals for get_current_user / get_current_admin, keyed by
+# (username, token expiry). The resource is the username, so
+# `principal_cache.invalidate(username)` drops every cached token of that user.
+principal_cache = TTLCache(max_entries=PRINCIPAL_CACHE_SIZE, enabled=PRINCIPAL_CACHE_TTL_SECONDS > 0)
@@ -0,0 +1,96 @@
+import asyncio
+import itertools
+import json
+import threading
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+
+
+class Subscription:
+    """One SSE client: a bounded queue living on the client's event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int, court_ids: Optional[Set[int]] = None):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.court_ids = court_ids
+
+    def offer(self, event: Dict[str, Any]):
+        """Runs on the subscriber's loop. A client that falls behind is told to re-fetch."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"id": event["id"], "type": "resync"})
+            logger.warning(f"Court event subscriber fell behind ({self.queue.maxsize} events queued), sent resync at event {event['id']}.")
+
+
+class CourtEventBroker:
+    """
+    Fan-out of court availability changes to Server-Sent Events clients.
+
+    `publish()` may be called from any thread (writes run in the database
+    executor threads); each event is handed to every subscriber's own loop.
+    Subscribers interested in specific courts only get events for those courts.
+    """
+
+    def __init__(self, queue_size: int = 100, heartbeat_seconds: float = 15):
+        self.queue_size = queue_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self._subscribers: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    def subscribe(self, court_ids: Optional[Set[int]] = None) -> Subscription:
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size, court_ids)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event: Dict[str, Any]):
+        with self._lock:
+            event = {"id": next(self._ids), **event}
+            self.published += 1
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.court_ids is not None and event.get("court_id") not in subscription.court_ids:
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # The subscriber's loop is closed
+                self.unsubscribe(subscription)
+                logger.info("Dropped court event subscriber whose event loop is closed.")
+
+    async def stream(self, request: Request, court_ids: Optional[Set[int]] = None) -> AsyncIterator[str]:
+        """Yield SSE frames until the client disconnects."""
+        subscription = self.subscribe(court_ids)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                data = {key: value for key, value in event.items() if key not in ("id", "type")}
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "published": self.published}
+
+
+court_events = CourtEventBroker()
@@ -0,0 +1,157 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict
+
+import bcrypt
+from fastapi import HTTPException, status
+from loguru import logger
+from app.env import PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE
+
+BCRYPT_ROUNDS = 10
+
+
+# Worker-side functions: top level so they can be pickled into the process pool.
+# They return wall-clock start/end times so the parent can split queue wait from run time.
+
+def _timed(func: Callable[..., Any], *args):
+    started_at = time.time()
+    result = func(*args)
+    return result, started_at, time.time()
+
+def _checkpw(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+def _hashpw(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+
+def _noop() -> None:
+    return None
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing/verification in a dedicated process pool so CPU-bound
+    work never blocks the event loop and scales across cores.
+
+    - `max_workers` processes hash in parallel.
+    - At most `queue_size` further calls may wait; beyond that requests get 503.
+    - Queue wait and hashing time are recorded per operation (`stats()`).
+    """
+
+    def __init__(self, max_workers: int, queue_size: int = 0):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self.queue_size = max(queue_size, 0)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.queue_size)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, float]] = {}
+        self._metrics_lock = threading.Lock()
+        self._pending = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # spawn: never fork a process that is running threads and an event loop
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _record(self, name: str, queue_wait: float = 0.0, run_time: float = 0.0, rejected: bool = False):
+        with self._metrics_lock:
+            entry = self._metrics.setdefault(name, {
+                "calls": 0,
+                "rejected": 0,
+                "queue_wait_total": 0.0,
+                "queue_wait_max": 0.0,
+                "run_time_total": 0.0,
+                "run_time_max": 0.0,
+            })
+            if rejected:
+                entry["rejected"] += 1
+                return
+            entry["calls"] += 1
+            entry["queue_wait_total"] += queue_wait
+            entry["queue_wait_max"] = max(entry["queue_wait_max"], queue_wait)
+            entry["run_time_total"] += run_time
+            entry["run_time_max"] = max(entry["run_time_max"], run_time)
+
+    async def run(self, name: str, func: Callable[..., Any], *args) -> Any:
+        """Run a picklable `func(*args)` in the pool; 503 when the queue is full."""
+        if not self._slots.acquire(blocking=False):
+            self._record(name, rejected=True)
+            logger.warning(f"Password hasher saturated, rejecting {name}.")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        with self._metrics_lock:
+            self._pending += 1
+        submitted_at = time.time()
+        try:
+            future = self._get_executor().submit(_timed, func, *args)
+        except Exception:
+            with self._metrics_lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+
+        def done(_future):
+            with self._metrics_lock:
+                self._pending -= 1
+            self._slots.release()
+
+        future.add_done_callback(done)
+        result, started_at, finished_at = await asyncio.wrap_future(future)
+        self._record(name, queue_wait=max(started_at - submitted_at, 0.0), run_time=finished_at - started_at)
+        return result
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run("verify", _checkpw, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self.run("hash", _hashpw, password)
+
+    def warm_up(self):
+        """Start all worker processes up front so the first logins do not pay the spawn cost."""
+        executor = self._get_executor()
+        for future in [executor.submit(_noop) for _ in range(self.max_workers)]:
+            future.result()
+        logger.info(f"Password hasher started with {self.max_workers} worker processes.")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            operations = {}
+            for name, entry in self._metrics.items():
+                count = entry["calls"]
+                operations[name] = {
+                    "calls": count,
+                    "rejected": entry["rejected"],
+                    "queue_wait_avg_ms": round(entry["queue_wait_total"] / count * 1000, 3) if count else 0.0,
+                    "queue_wait_max_ms": round(entry["queue_wait_max"] * 1000, 3),
+                    "run_time_avg_ms": round(entry["run_time_total"] / count * 1000, 3) if count else 0.0,
+                    "run_time_max_ms": round(entry["run_time_max"] * 1000, 3),
+                }
+            return {
+                "max_workers": self.max_workers,
+                "queue_size": self.queue_size,
+                "pending": self._pending,
+                "operations": operations,
+            }
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        logger.info("Password hasher shut down.")
+
+
+password_hasher = PasswordHasher(max_workers=PASSWORD_HASH_WORKERS, queue_size=PASSWORD_HASH_QUEUE_SIZE)
@@ -0,0 +1,177 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.routing import APIRoute
+from loguru import logger
+from app.env import DB_OFFLOAD_WORKERS, DB_OFFLOAD_QUEUE_SIZE
+
+
+class DatabaseExecutor:
+    """
+    Bounded thread pool for running blocking `app/models/*` calls off the event loop.
+
+    - At most `max_workers` calls run at once (sized to the DB pool by default, so
+      workers never queue on the pool themselves).
+    - At most `queue_size` further calls may wait for a worker; anything beyond that
+      is rejected immediately with a 503 instead of queueing forever.
+    - Per-call queue wait and run time are recorded and exposed through `stats()`.
+    """
+
+    def __init__(self, max_workers: int, queue_size: int = 0):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self.queue_size = max(queue_size, 0)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.queue_size)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._local = threading.local()
+        self._metrics: Dict[str, Dict[str, float]] = {}
+        self._metrics_lock = threading.Lock()
+        self._pending = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db-worker")
+            return self._executor
+
+    def _record(self, name: str, queue_wait: float = 0.0, run_time: float = 0.0, rejected: bool = False):
+        with self._metrics_lock:
+            entry = self._metrics.setdefault(name, {
+                "calls": 0,
+                "rejected": 0,
+                "queue_wait_total": 0.0,
+                "queue_wait_max": 0.0,
+                "run_time_total": 0.0,
+                "run_time_max": 0.0,
+            })
+            if rejected:
+                entry["rejected"] += 1
+                return
+            entry["calls"] += 1
+            entry["queue_wait_total"] += queue_wait
+            entry["queue_wait_max"] = max(entry["queue_wait_max"], queue_wait)
+            entry["run_time_total"] += run_time
+            entry["run_time_max"] = max(entry["run_time_max"], run_time)
+
+    def _worker_loop(self) -> asyncio.AbstractEventLoop:
+        # Each worker thread keeps one private event loop to drive offloaded coroutines
+        loop = getattr(self._local, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = asyncio.new_event_loop()
+            self._local.loop = loop
+        return loop
+
+    async def run(self, name: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run `func(*args, **kwargs)` on a worker thread and await its result.
+        Coroutine functions are driven to completion on the worker's own event loop.
+        Raises HTTP 503 when every worker is busy and the wait queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            self._record(name, rejected=True)
+            logger.warning(f"Database executor saturated, rejecting {name}.")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        submitted_at = time.monotonic()
+        with self._metrics_lock:
+            self._pending += 1
+
+        def call():
+            started_at = time.monotonic()
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    return self._worker_loop().run_until_complete(func(*args, **kwargs))
+                return func(*args, **kwargs)
+            finally:
+                finished_at = time.monotonic()
+                self._record(name, queue_wait=started_at - submitted_at, run_time=finished_at - started_at)
+
+        def done(_future):
+            with self._metrics_lock:
+                self._pending -= 1
+            self._slots.release()
+
+        future = self._get_executor().submit(call)
+        future.add_done_callback(done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            calls = {}
+            for name, entry in self._metrics.items():
+                count = entry["calls"]
+                calls[name] = {
+                    "calls": count,
+                    "rejected": entry["rejected"],
+                    "queue_wait_avg_ms": round(entry["queue_wait_total"] / count * 1000, 3) if count else 0.0,
+                    "queue_wait_max_ms": round(entry["queue_wait_max"] * 1000, 3),
+                    "run_time_avg_ms": round(entry["run_time_total"] / count * 1000, 3) if count else 0.0,
+                    "run_time_max_ms": round(entry["run_time_max"] * 1000, 3),
+                }
+            return {
+                "max_workers": self.max_workers,
+                "queue_size": self.queue_size,
+                "pending": self._pending,
+                "calls": calls,
+            }
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        logger.info("Database executor shut down.")
+
+
+db_executor = DatabaseExecutor(max_workers=DB_OFFLOAD_WORKERS, queue_size=DB_OFFLOAD_QUEUE_SIZE)
+
+
+def offload(func: Callable[..., Any], executor: DatabaseExecutor = db_executor) -> Callable[..., Any]:
+    """
+    Wrap an endpoint so its body runs on the database executor.
+    The wrapper keeps the original signature, so FastAPI resolves the same
+    parameters and dependencies as before.
+    """
+    if getattr(func, "__offloaded__", False):
+        return func
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await executor.run(name, func, *args, **kwargs)
+
+    wrapper.__offloaded__ = True
+    return wrapper
+
+
+def stay_on_event_loop(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Leave an endpoint out of offload_routes. Its blocking work must be handed
+    off by the endpoint itself (e.g. only the database part via executor.run),
+    so what it does without the database is not held up by a busy executor.
+    """
+    func.__offloaded__ = True
+    return func
+
+
+def offload_routes(router: APIRouter, executor: DatabaseExecutor = db_executor) -> APIRouter:
+    """
+    Make every endpoint of `router` run on the database executor.
+    Call this before `app.include_router(...)`; the endpoints behave exactly as
+    before, they just no longer block the event loop while the model call runs.
+    Endpoint bodies must not await anything bound to the main event loop.
+    """
+    for route in router.routes:
+        if isinstance(route, APIRoute):
+            route.endpoint = offload(route.endpoint, executor)
+    return router
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+# A court-day is a fixed grid of SLOT_MINUTES cells over working hours
+# (5:00-23:00 UTC+7). Occupancy is an int bitmask: bit i is set when cell i,
+# starting at day_start + i * SLOT_MINUTES, is busy. Plain ints keep the masks
+# small and make "free for D minutes" a handful of shifts and ANDs.
+
+SLOT_MINUTES = 15
+SLOT = timedelta(minutes=SLOT_MINUTES)
+WORKING_DAY = timedelta(hours=18) # 5:00-23:00
+SLOTS_PER_DAY = WORKING_DAY // SLOT
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+
+def cells_for(minutes: int) -> int:
+    """Number of cells needed to cover `minutes` (rounded up)."""
+    return max(-(-minutes // SLOT_MINUTES), 1)
+
+
+def range_mask(first: int, count: int) -> int:
+    """Mask of `count` cells starting at cell `first`, clipped to the day."""
+    if count <= 0 or first >= SLOTS_PER_DAY:
+        return 0
+    if first < 0:
+        count += first
+        first = 0
+    return (((1 << max(count, 0)) - 1) << first) & FULL_DAY
+
+
+def occupancy_mask(day_start: datetime, periods: Iterable[Dict[str, datetime]]) -> int:
+    """
+    Busy mask of the day starting at `day_start` (UTC). A cell is busy if any
+    period overlaps it, so partly used cells are never offered as free.
+    """
+    mask = 0
+    for period in periods:
+        first = (period["start"] - day_start) // SLOT
+        last = -(-(period["end"] - day_start) // SLOT) # first cell after the period
+        mask |= range_mask(first, last - first)
+    return mask
+
+
+def free_starts(busy: int, min_cells: int) -> int:
+    """Mask of cells at which `min_cells` consecutive free cells begin."""
+    candidates = ~busy & FULL_DAY
+    # After k steps bit i is set iff cells i..i+k are all free
+    window = 1
+    while window < min_cells and candidates:
+        step = min(window, min_cells - window)
+        candidates &= candidates >> step
+        window += step
+    return candidates
+
+
+def free_runs(busy: int, min_cells: int = 1) -> List[tuple]:
+    """Maximal free runs as (first cell, cell count) with at least `min_cells` cells."""
+    runs = []
+    free = ~busy & FULL_DAY
+    while free:
+        first = (free & -free).bit_length() - 1
+        shifted = free >> first
+        length = (~shifted & (shifted + 1)).bit_length() - 1 # trailing ones
+        if length >= min_cells:
+            runs.append((first, length))
+        free &= ~range_mask(first, length)
+    return runs
+
+
+def is_free(busy: int, first: int, count: int) -> bool:
+    """Whether `count` cells from `first` are all free (and inside the day)."""
+    if first < 0 or first + count > SLOTS_PER_DAY:
+        return False
+    return busy & range_mask(first, count) == 0
+
+
+def cell_of(day_start: datetime, moment: datetime) -> Optional[int]:
+    """Cell containing `moment` if it lies on the grid of that day, else None."""
+    offset = moment - day_start
+    if offset < timedelta(0) or offset % SLOT or offset >= WORKING_DAY:
+        return None
+    return offset // SLOT
+
+
+def slots_from_runs(day_start: datetime, runs: Iterable[tuple]) -> List[Dict[str, datetime]]:
+    return [
+        {"start": day_start + first * SLOT, "end": day_start + (first + length) * SLOT}
+        for first, length in runs
+    ]
+
+
+def mask_to_string(busy: int) -> str:
+    """One character per cell, earliest first: '1' busy, '0' free."""
+    return "".join("1" if busy >> cell & 1 else "0" for cell in range(SLOTS_PER_DAY))
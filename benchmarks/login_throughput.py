@@ -0,0 +1,87 @@
+"""
+Login throughput vs. password hasher worker count.
+
+Simulates a burst of concurrent logins, each doing the bcrypt verification that
+`/v1/auth/login` performs, and reports logins/second for the inline (event loop)
+path and for the process pool with an increasing number of workers, plus the
+longest event-loop stall seen during the burst (how long other requests would
+have been frozen).
+
+Usage (from the repository root):
+    python -m benchmarks.login_throughput --logins 64 --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import bcrypt
+
+from app.utils.hashing import PasswordHasher, BCRYPT_ROUNDS
+
+PASSWORD = "correct horse battery staple"
+
+
+async def max_loop_stall(done: asyncio.Event, interval: float = 0.005) -> float:
+    """Longest delay between scheduled wake-ups of a heartbeat task."""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while not done.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - expected)
+    return worst
+
+
+async def measure(burst) -> tuple:
+    done = asyncio.Event()
+    heartbeat = asyncio.create_task(max_loop_stall(done))
+    await asyncio.sleep(0)
+    elapsed = await burst
+    done.set()
+    return elapsed, await heartbeat
+
+
+async def inline_burst(hashed: str, logins: int) -> float:
+    async def login():
+        # What login did before: bcrypt directly on the event loop
+        await asyncio.sleep(0)
+        return bcrypt.checkpw(PASSWORD.encode('utf-8'), hashed.encode('utf-8'))
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(logins)))
+    assert all(results)
+    return time.perf_counter() - started
+
+
+async def pooled_burst(hasher: PasswordHasher, hashed: str, logins: int) -> float:
+    started = time.perf_counter()
+    results = await asyncio.gather(*(hasher.verify(PASSWORD, hashed) for _ in range(logins)))
+    assert all(results)
+    return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64, help="concurrent logins per run")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="worker counts to try")
+    args = parser.parse_args()
+
+    hashed = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+    print(f"bcrypt cost {BCRYPT_ROUNDS}, {args.logins} concurrent logins, {os.cpu_count()} CPUs")
+    print(f"{'mode':<12}{'seconds':>10}{'logins/s':>12}{'max stall ms':>15}")
+
+    elapsed, stall = await measure(inline_burst(hashed, args.logins))
+    print(f"{'inline':<12}{elapsed:>10.2f}{args.logins / elapsed:>12.1f}{stall * 1000:>15.1f}")
+    for workers in args.workers:
+        hasher = PasswordHasher(max_workers=workers, queue_size=args.logins)
+        hasher.warm_up()
+        try:
+            elapsed, stall = await measure(pooled_burst(hasher, hashed, args.logins))
+        finally:
+            hasher.shutdown()
+        print(f"{f'pool x{workers}':<12}{elapsed:>10.2f}{args.logins / elapsed:>12.1f}{stall * 1000:>15.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,7 +4,8 @@ CREATE TABLE `User` (
     `Password` VARCHAR(255),
     `Phone` VARCHAR(20),
     `UserType` ENUM('Customer', 'Staff'),
-    `JoinDate` DATETIME
+    `JoinDate` DATETIME,
+    `ClaimsVersion` INT NOT NULL DEFAULT 0
 );
 
 -- Customer Table
@@ -54,6 +55,7 @@ CREATE TABLE `Training_Session` (
     `Price` INT,
     `Rating` DECIMAL(2,1),
     `Max_Students` INT,
+    `EnrolledCount` INT NOT NULL DEFAULT 0,
     FOREIGN KEY (`CoachID`) REFERENCES `Coach`(`StaffID`),
     FOREIGN KEY (`CourtID`) REFERENCES `Court`(`Court_ID`)
 );
@@ -65,6 +67,7 @@ CREATE TABLE `OrderTable` (
     `TotalAmount` INT,
     `CustomerID` INT,
     `SessionID` INT,
+    INDEX `idx_ordertable_customer_date` (`CustomerID`, `OrderDate`),
     FOREIGN KEY (`CustomerID`) REFERENCES `Customer`(`CustomerID`),
     FOREIGN KEY (`SessionID`) REFERENCES `Training_Session`(`SessionID`)
 );
@@ -93,11 +96,24 @@ CREATE TABLE `Payment` (
     `Method` ENUM('Credit Card', 'Cash'),
     `Status` ENUM('Pending', 'Success', 'Cancel'),
     `Description` TEXT,
+    `Reference` CHAR(36) CHARACTER SET ascii NULL,
     `Time` DATETIME,
+    UNIQUE INDEX `uq_payment_reference` (`Reference`),
+    INDEX `idx_payment_status_time` (`Status`, `Time`),
     FOREIGN KEY (`OrderID`) REFERENCES `OrderTable`(`OrderID`),
     FOREIGN KEY (`Customer_ID`) REFERENCES `Customer`(`CustomerID`)
 );
 
+-- PaymentReview Table: payments confirmed after their order was cancelled as unpaid, to refund or fix by hand
+CREATE TABLE `PaymentReview` (
+    `PaymentID` INT PRIMARY KEY,
+    `OrderID` INT,
+    `Reason` VARCHAR(50) NOT NULL,
+    `CreatedAt` DATETIME NOT NULL,
+    FOREIGN KEY (`PaymentID`) REFERENCES `Payment`(`PaymentID`),
+    FOREIGN KEY (`OrderID`) REFERENCES `OrderTable`(`OrderID`)
+);
+
 -- CafeteriaFood Table
 CREATE TABLE `CafeteriaFood` (
     `FoodID` INT PRIMARY KEY AUTO_INCREMENT,
@@ -143,6 +159,7 @@ CREATE TABLE `TrainingSchedule` (
 CREATE TABLE `Rent` (
     `OrderID` INT,
     `EquipmentID` INT,
+    `Quantity` INT NOT NULL DEFAULT 1,
     FOREIGN KEY (`OrderID`) REFERENCES `OrderTable`(`OrderID`),
     FOREIGN KEY (`EquipmentID`) REFERENCES `Equipment`(`EquipmentID`),
     PRIMARY KEY (`OrderID`, `EquipmentID`)
@@ -152,6 +169,7 @@ CREATE TABLE `Rent` (
 CREATE TABLE `OrderFood` (
     `OrderID` INT,
     `FoodID` INT,
+    `Quantity` INT NOT NULL DEFAULT 1,
     FOREIGN KEY (`OrderID`) REFERENCES `OrderTable`(`OrderID`),
     FOREIGN KEY (`FoodID`) REFERENCES `CafeteriaFood`(`FoodID`),
     PRIMARY KEY (`OrderID`, `FoodID`)
@@ -174,6 +192,33 @@ CREATE TABLE `FeedBack` (
     FOREIGN KEY (`OrderID`) REFERENCES `OrderTable`(`OrderID`)
 );
 
+-- RefreshToken Table: one row per issued refresh token (JWT id), used for rotation and revocation
+CREATE TABLE `RefreshToken` (
+    `TokenID` CHAR(36) PRIMARY KEY,
+    `Username` VARCHAR(255) NOT NULL,
+    `ExpiresAt` DATETIME NOT NULL,
+    `RevokedAt` DATETIME NULL,
+    `ReplacedBy` CHAR(36) NULL,
+    INDEX `idx_refreshtoken_username` (`Username`),
+    INDEX `idx_refreshtoken_expires` (`ExpiresAt`),
+    FOREIGN KEY (`Username`) REFERENCES `User`(`Username`) ON DELETE CASCADE
+);
+
+-- IdempotencyKey Table: first response of POST requests sent with an Idempotency-Key header, replayed on retries
+CREATE TABLE `IdempotencyKey` (
+    `Username` VARCHAR(255) NOT NULL,
+    `Endpoint` VARCHAR(100) NOT NULL,
+    `IdemKey` VARCHAR(64) NOT NULL,
+    `RequestHash` CHAR(64) NOT NULL,
+    `LeaseToken` CHAR(32) NOT NULL,
+    `StatusCode` SMALLINT NULL,
+    `Response` TEXT NULL,
+    `ExpiresAt` DATETIME NOT NULL,
+    PRIMARY KEY (`Username`, `Endpoint`, `IdemKey`),
+    INDEX `idx_idempotencykey_expires` (`ExpiresAt`),
+    FOREIGN KEY (`Username`) REFERENCES `User`(`Username`) ON DELETE CASCADE
+);
+
 
 -- Procedure to get all food items call using : CALL GetAllCafeteriaFood()
 DELIMITER //
@@ -196,40 +241,6 @@ END //
 DELIMITER ;
 
 
--- Trigger to automatically change the session status to 'Unavailable' when the max students are reached
-
-
-DELIMITER //
-
-CREATE TRIGGER after_enroll_insert
-AFTER INSERT ON Enroll
-FOR EACH ROW
-BEGIN
-    -- Declare variables to hold the current enrollment count and the max limit
-    DECLARE current_enrollment_count INT;
-    DECLARE max_students_limit INT;
-
-    -- Get the current number of students enrolled in the session that was just enrolled into
-    SELECT COUNT(*) INTO current_enrollment_count
-    FROM Enroll
-    WHERE SessionID = NEW.SessionID; -- NEW.SessionID refers to the SessionID of the newly inserted row
-
-    -- Get the maximum number of students allowed for this session
-    SELECT Max_Students INTO max_students_limit
-    FROM Training_Session
-    WHERE SessionID = NEW.SessionID;
-
-    -- Check if the current enrollment count equals the maximum limit
-    IF current_enrollment_count = max_students_limit THEN
-        -- If it does, update the status of the training session to 'Unavailable'
-        UPDATE Training_Session
-        SET Status = 'Unavailable'
-        WHERE SessionID = NEW.SessionID;
-    END IF;
-END //
-
-DELIMITER ;
-
 -- Trigger to automatically chang the rating of the session when a feedback is added on session
 
 DELIMITER $$
@@ -0,0 +1,3 @@
+-- Adds User.ClaimsVersion, embedded in access tokens as the `ver` claim.
+-- Bumping it (e.g. on promotion to Staff) invalidates tokens issued with the old role.
+ALTER TABLE `User` ADD COLUMN `ClaimsVersion` INT NOT NULL DEFAULT 0;
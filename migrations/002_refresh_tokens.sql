@@ -0,0 +1,11 @@
+-- Adds the RefreshToken table backing /v1/auth/refresh (rotation + revocation).
+CREATE TABLE `RefreshToken` (
+    `TokenID` CHAR(36) PRIMARY KEY,
+    `Username` VARCHAR(255) NOT NULL,
+    `ExpiresAt` DATETIME NOT NULL,
+    `RevokedAt` DATETIME NULL,
+    `ReplacedBy` CHAR(36) NULL,
+    INDEX `idx_refreshtoken_username` (`Username`),
+    INDEX `idx_refreshtoken_expires` (`ExpiresAt`),
+    FOREIGN KEY (`Username`) REFERENCES `User`(`Username`) ON DELETE CASCADE
+);
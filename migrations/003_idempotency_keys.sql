@@ -0,0 +1,13 @@
+-- Adds the IdempotencyKey table used to replay responses of retried order/enrollment requests.
+CREATE TABLE `IdempotencyKey` (
+    `Username` VARCHAR(255) NOT NULL,
+    `Endpoint` VARCHAR(100) NOT NULL,
+    `IdemKey` VARCHAR(64) NOT NULL,
+    `RequestHash` CHAR(64) NOT NULL,
+    `StatusCode` SMALLINT NULL,
+    `Response` TEXT NULL,
+    `ExpiresAt` DATETIME NOT NULL,
+    PRIMARY KEY (`Username`, `Endpoint`, `IdemKey`),
+    INDEX `idx_idempotencykey_expires` (`ExpiresAt`),
+    FOREIGN KEY (`Username`) REFERENCES `User`(`Username`) ON DELETE CASCADE
+);
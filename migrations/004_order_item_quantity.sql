@@ -0,0 +1,4 @@
+-- Adds per-line quantities to equipment rentals and food orders.
+-- Existing rows were single items, so they default to 1.
+ALTER TABLE `Rent` ADD COLUMN `Quantity` INT NOT NULL DEFAULT 1;
+ALTER TABLE `OrderFood` ADD COLUMN `Quantity` INT NOT NULL DEFAULT 1;
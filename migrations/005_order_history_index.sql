@@ -0,0 +1,4 @@
+-- Index for the keyset-paginated order history (newest first per customer).
+-- InnoDB appends the primary key (OrderID) to the index, which the
+-- (OrderDate, OrderID) cursor uses as tie-breaker.
+CREATE INDEX `idx_ordertable_customer_date` ON `OrderTable` (`CustomerID`, `OrderDate`);
@@ -0,0 +1,11 @@
+-- Indexed payment reference for the payment webhook, which used to scan the
+-- unindexed Payment.Description TEXT column. New payments store the same UUID
+-- in both columns; existing payments are backfilled from Description.
+ALTER TABLE `Payment` ADD COLUMN `Reference` CHAR(36) CHARACTER SET ascii NULL AFTER `Description`;
+
+UPDATE `Payment`
+SET `Reference` = LOWER(`Description`)
+WHERE `Reference` IS NULL
+  AND `Description` REGEXP '^[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12}$';
+
+CREATE UNIQUE INDEX `uq_payment_reference` ON `Payment` (`Reference`);
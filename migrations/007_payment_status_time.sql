@@ -0,0 +1,3 @@
+-- Lets the pending-order sweeper find unpaid payments older than the hold
+-- time with an index range scan instead of scanning Payment.
+CREATE INDEX `idx_payment_status_time` ON `Payment` (`Status`, `Time`);
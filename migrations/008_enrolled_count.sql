@@ -0,0 +1,10 @@
+-- Keeps the number of enrollments on Training_Session. Enrollment admits a
+-- student with a conditional UPDATE on this counter, which also marks the
+-- session Unavailable when it becomes full, so the after_enroll_insert
+-- trigger (a COUNT(*) after every insert) is dropped.
+ALTER TABLE `Training_Session` ADD COLUMN `EnrolledCount` INT NOT NULL DEFAULT 0;
+
+UPDATE `Training_Session` ts
+SET ts.`EnrolledCount` = (SELECT COUNT(*) FROM `Enroll` e WHERE e.`SessionID` = ts.`SessionID`);
+
+DROP TRIGGER IF EXISTS `after_enroll_insert`;
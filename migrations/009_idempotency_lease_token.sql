@@ -0,0 +1,5 @@
+-- Adds the lease token of the request holding an idempotency key. A response
+-- is only recorded (in the order's own transaction) while the row still holds
+-- the request's token, so a request whose lease was taken over by a retry
+-- rolls back instead of committing a second order.
+ALTER TABLE `IdempotencyKey` ADD COLUMN `LeaseToken` CHAR(32) NOT NULL DEFAULT '' AFTER `RequestHash`;
@@ -0,0 +1,11 @@
+-- Payments confirmed by the gateway after the pending-order sweeper had already
+-- cancelled their order (and released its courts and stock). The payment stays
+-- cancelled; each row here needs a refund or a manual re-booking.
+CREATE TABLE `PaymentReview` (
+    `PaymentID` INT PRIMARY KEY,
+    `OrderID` INT,
+    `Reason` VARCHAR(50) NOT NULL,
+    `CreatedAt` DATETIME NOT NULL,
+    FOREIGN KEY (`PaymentID`) REFERENCES `Payment`(`PaymentID`),
+    FOREIGN KEY (`OrderID`) REFERENCES `OrderTable`(`OrderID`)
+);
@@ -0,0 +1,38 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.database import get_async_read_db
+from app.models import court
+from app.routers.v1.public import court as court_routes
+
+
+def _fail_masks(*args, **kwargs):
+    raise AssertionError("no day masks should be built for a rejected window")
+
+
+def test_model_rejects_open_ended_window_longer_than_the_cap(monkeypatch):
+    monkeypatch.setattr(court, "get_court_day_masks_async", _fail_masks)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(court.search_free_slots_async(60, window_end=datetime(2200, 1, 1)))
+    assert error.value.status_code == 400
+
+
+def test_search_without_start_time_is_capped():
+    app = FastAPI()
+    app.include_router(court_routes.router)
+
+    async def no_db():
+        yield None
+
+    app.dependency_overrides[get_async_read_db] = no_db
+    client = TestClient(app)
+
+    response = client.get("/court/search", params={"end_time": "2200-01-01T00:00:00"})
+    assert response.status_code == 400
+
+    too_far = (datetime.utcnow() + court.MAX_SEARCH_WINDOW + timedelta(days=1)).isoformat()
+    assert client.get("/court/search", params={"end_time": too_far}).status_code == 400
@@ -0,0 +1,39 @@
+from app.models.enums import PaymentMethod
+from app.routers.v1.user import training_session
+
+
+ENROLLMENT = {"order_id": 7, "payment_id": 9, "payment_description": "5f0c7a4e-1d2b-4c3a-9e8f-0a1b2c3d4e5f"}
+EXPECTED = {"message": "Successfully enrolled in training session", **ENROLLMENT}
+
+
+def _stub_models(monkeypatch, calls):
+    monkeypatch.setattr(training_session, "get_training_session_by_id", lambda session_id, db: {"Status": "Available", "Price": 100000})
+    monkeypatch.setattr(training_session, "is_user_enrolled", lambda customer_id, session_id, db: False)
+
+    def enroll_user_in_session(customer_id, session_id, price, payment_method, db, before_commit=None):
+        calls.append((customer_id, session_id, price, payment_method))
+        if before_commit:
+            before_commit("cursor", dict(ENROLLMENT))
+        return dict(ENROLLMENT)
+
+    monkeypatch.setattr(training_session, "enroll_user_in_session", enroll_user_in_session)
+
+
+def test_enroll_returns_order_and_payment(monkeypatch):
+    calls = []
+    _stub_models(monkeypatch, calls)
+    request = training_session.EnrollRequest(payment_method=PaymentMethod.CREDIT_CARD)
+
+    assert training_session._enroll("alice", 3, 5, request, db=None) == EXPECTED
+    assert calls == [(3, 5, 100000, PaymentMethod.CREDIT_CARD)]
+
+
+def test_enroll_records_the_same_response_before_commit(monkeypatch):
+    _stub_models(monkeypatch, [])
+    recorded = []
+    request = training_session.EnrollRequest(payment_method=PaymentMethod.CASH)
+
+    response = training_session._enroll("alice", 3, 5, request, db=None, record=lambda cursor, body: recorded.append((cursor, body)))
+
+    assert recorded == [("cursor", EXPECTED)]
+    assert response == EXPECTED
@@ -0,0 +1,49 @@
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.env import PAYMENT_WEBHOOK_SECRET
+from app.models.payment_queue import PaymentWebhookQueue
+from app.routers.v1.internal import payment
+from app.utils.offload import offload_routes, DatabaseExecutor
+
+AUTH = {"Authorization": f"Bearer {PAYMENT_WEBHOOK_SECRET}"}
+
+
+def _saturated_executor(monkeypatch) -> DatabaseExecutor:
+    """A database executor with no free slot, installed where the router uses it."""
+    executor = DatabaseExecutor(max_workers=1, queue_size=0)
+    executor._slots.acquire()
+    monkeypatch.setattr(payment, "db_executor", executor)
+    return executor
+
+
+def _client(executor: DatabaseExecutor) -> TestClient:
+    app = FastAPI()
+    app.include_router(offload_routes(payment.internal_payment_router, executor), prefix="/v1")
+    return TestClient(app)
+
+
+def test_confirm_is_queued_while_the_database_executor_is_saturated(monkeypatch, tmp_path):
+    executor = _saturated_executor(monkeypatch)
+    queue = PaymentWebhookQueue(str(tmp_path))
+    monkeypatch.setattr(payment, "payment_queue", queue)
+    monkeypatch.setattr(payment, "PAYMENT_QUEUE_ENABLED", True)
+
+    response = _client(executor).post("/v1/internal/payment/confirm", json={"description": "ref-1"}, headers=AUTH)
+
+    assert response.status_code == 202
+    assert queue.queued_descriptions() == {"ref-1"}
+
+
+def test_synchronous_confirm_still_uses_the_database_executor(monkeypatch):
+    executor = _saturated_executor(monkeypatch)
+    monkeypatch.setattr(payment, "PAYMENT_QUEUE_ENABLED", False)
+
+    def no_database(description):
+        raise AssertionError("the database must not be reached through a saturated executor")
+
+    monkeypatch.setattr(payment, "_confirm_payment_now", no_database)
+
+    response = _client(executor).post("/v1/internal/payment/confirm", json={"description": "ref-1"}, headers=AUTH)
+
+    assert response.status_code == 503